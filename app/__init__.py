@@ -8,17 +8,67 @@ def create_app(config_class=Config):
     
     CORS(app)
     
+    #JSON ENCODER (orjson WHEN AVAILABLE)
+    from app.utils.json_provider import init_json_provider
+    init_json_provider(app)
+    
+    #DATABASE CONNECTION POOL
+    from app.db import init_app as init_db
+    init_db(app)
+    
     #REGISTER BLUE PRINTS
     from app.routes.main import main_bp
     from app.routes.facilities import facilities_bp
     from app.routes.locations import locations_bp
     from app.routes.stats import stats_bp
     from app.routes.routing import routing_bp
+    from app.routes.tiles import tiles_bp
     
     app.register_blueprint(main_bp)
     app.register_blueprint(facilities_bp)
     app.register_blueprint(locations_bp)
     app.register_blueprint(stats_bp)
     app.register_blueprint(routing_bp)
+    app.register_blueprint(tiles_bp)
+    
+    #DEPLOY COMMANDS (flask build-topology, ...)
+    from app.cli import register_commands
+    register_commands(app)
+    
+    #PICK UP A NEWLY PUBLISHED SNAPSHOT (flask build-snapshot) WITHOUT A RESTART
+    from app.utils.snapshot import init_snapshot_watch
+    init_snapshot_watch(app)
+    
+    #LOAD IN-MEMORY INDEXES BEFORE THE FIRST REQUEST
+    preload_indexes(app)
     
     return app
+
+def preload_indexes(app):
+    with app.app_context():
+        if app.config.get('FACILITY_INDEX_PRELOAD'):
+            from app.utils.facility_index import get_facility_index
+            get_facility_index()
+            from app.utils.geocoder import get_geocoder
+            from app.utils.facility_search import get_facility_search
+            get_geocoder()
+            get_facility_search()
+            from app.utils.vector_tiles import refresh_tile_cache
+            refresh_tile_cache()
+        from app.utils.topology import ensure_topology
+        ensure_topology(build_if_missing=app.config.get('ROUTING_TOPOLOGY_BUILD_IF_MISSING'))
+        if app.config.get('ROUTING_GRAPH_PRELOAD'):
+            from app.utils.node_snapper import get_facility_nodes
+            from app.utils.contraction import get_contraction_hierarchy
+            from app.utils.network_voronoi import get_network_voronoi
+            from app.utils.road_graph import get_road_graph
+            get_facility_nodes()
+            get_contraction_hierarchy(get_road_graph())
+            if app.config.get('ROUTING_WORKERS'):
+                from app.utils.routing_workers import get_routing_pool
+                try:
+                    get_routing_pool().warm(get_road_graph())
+                except Exception as e:
+                    print(f"Routing worker warm-up failed: {e}")
+            get_network_voronoi()
+
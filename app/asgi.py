@@ -0,0 +1,233 @@
+# ASYNC SERVING MODE - QUART HANDLERS ON asyncpg FOR THE ROUTES THAT WAIT ON POSTGIS, THE FLASK APP FOR THE REST
+import asyncio
+import io
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import RoutingException
+
+try:
+    from quart import Quart, current_app, request
+except ImportError:  # OPTIONAL - pip install quart asyncpg uvicorn
+    Quart = None
+
+from app import create_app
+from app.config import Config
+from app.db import database_offline
+
+#RUN A BLOCKING CALL (IN-MEMORY SEARCH, CACHE LOADER) IN A WORKER THREAD INSIDE THE FLASK APP CONTEXT
+async def run_sync(fn, *args, **kwargs):
+    sync_app = current_app.extensions['sync_app']
+
+    def call():
+        with sync_app.app_context():
+            return fn(*args, **kwargs)
+
+    return await asyncio.get_running_loop().run_in_executor(current_app.extensions['sync_executor'], call)
+
+
+class WSGIFallback:
+    """Serves an ASGI http request with a WSGI app running in a worker thread. The response body
+    is handed over chunk by chunk through a small queue, so streamed responses stay streamed"""
+    def __init__(self, wsgi_app, executor: ThreadPoolExecutor, queue_size: int = 8):
+        self.wsgi_app = wsgi_app
+        self.executor = executor
+        self.queue_size = queue_size
+
+    @staticmethod
+    def environ(scope, body: bytes) -> dict:
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client')
+        root_path = scope.get('root_path', '')
+        path = scope['path']
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': root_path.encode().decode('latin-1'),
+            'PATH_INFO': path.encode().decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': str(server[0]),
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0] if client else '',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                name = f'HTTP_{name}'
+            environ[name] = f'{environ[name]},{value}' if name in environ else value
+        return environ
+
+    async def __call__(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.extend(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        abandoned = threading.Event()
+
+        def put(item):
+            # BLOCKS THE WORKER WHILE THE CLIENT READS SLOWLY; NO-OP ONCE THE CLIENT IS GONE
+            if not abandoned.is_set():
+                asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        def run():
+            try:
+                def start_response(status, headers, exc_info=None):
+                    put(('start', status, headers))
+                    return lambda data: put(('body', data))
+
+                result = self.wsgi_app(self.environ(scope, bytes(body)), start_response)
+                try:
+                    for chunk in result:
+                        if chunk:
+                            put(('body', chunk))
+                finally:
+                    if hasattr(result, 'close'):
+                        result.close()
+            except BaseException as e:
+                put(('error', e))
+            finally:
+                put(('end',))
+
+        loop.run_in_executor(self.executor, run)
+        started = False
+        error = None
+        try:
+            while True:
+                item = await queue.get()
+                if item[0] == 'start' and not started:
+                    started = True
+                    status, headers = item[1], item[2]
+                    await send({
+                        'type': 'http.response.start',
+                        'status': int(status.split(' ', 1)[0]),
+                        'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+                    })
+                elif item[0] == 'body' and started:
+                    await send({'type': 'http.response.body', 'body': bytes(item[1]), 'more_body': True})
+                elif item[0] == 'error':
+                    error = item[1]
+                    print(f"Error in sync fallback for {scope['path']}: {error}")
+                elif item[0] == 'end':
+                    break
+            if error is not None and started:
+                # STATUS AND PART OF THE BODY ARE ALREADY SENT - ABORT THE CONNECTION RATHER THAN
+                # FINISH THE BODY, SO THE CLIENT SEES A BROKEN RESPONSE INSTEAD OF A TRUNCATED 200
+                raise RuntimeError(f"Sync fallback for {scope['path']} failed mid-response") from error
+            if not started:
+                await send({'type': 'http.response.start', 'status': 500,
+                            'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            # CLIENT DISCONNECTED MID-RESPONSE - UNBLOCK THE WORKER SO IT CAN FINISH AND FREE THE THREAD
+            abandoned.set()
+            while not queue.empty():
+                queue.get_nowait()
+
+
+class AsyncDispatcher:
+    """ASGI entry point. A request whose path and method have an async handler goes to the
+    Quart app; everything else (CORS preflights, and every request while the database is
+    offline) to the Flask app through WSGIFallback"""
+    def __init__(self, async_app, sync_app, executor: ThreadPoolExecutor):
+        self.async_app = async_app
+        self.sync_app = sync_app
+        self.fallback = WSGIFallback(sync_app, executor)
+        self._routes = async_app.url_map.bind('localhost')
+
+    def handles(self, method: str, path: str) -> bool:
+        if method == 'OPTIONS':
+            return False
+        try:
+            self._routes.match(path, method=method)
+            return True
+        except (HTTPException, RoutingException):
+            return False
+
+    def offline(self) -> bool:
+        # WHILE THE DATABASE IS UNREACHABLE THE FLASK HANDLERS ANSWER FROM THE SNAPSHOT
+        with self.sync_app.app_context():
+            return database_offline()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and (not self.handles(scope['method'], scope['path']) or self.offline()):
+            await self.fallback(scope, receive, send)
+        else:
+            # LIFESPAN (OPENS THE asyncpg POOL) AND ASYNC ROUTES
+            await self.async_app(scope, receive, send)
+
+
+#ASGI APP (uvicorn asgi:app) - SAME API AND CONFIG AS create_app
+def create_asgi_app(config_class=Config):
+    if Quart is None:
+        raise RuntimeError('Async serving needs quart and asyncpg (pip install quart asyncpg uvicorn)')
+
+    #THE SYNC APP LOADS THE IN-MEMORY INDEXES AND SERVES EVERY ROUTE WITHOUT AN ASYNC HANDLER
+    sync_app = create_app(config_class)
+
+    app = Quart(__name__, static_folder=None)
+    app.config.from_object(config_class)
+
+    from app.utils.json_provider import init_json_provider
+    init_json_provider(app)
+
+    executor = ThreadPoolExecutor(max_workers=app.config['ASGI_SYNC_WORKERS'], thread_name_prefix='asgi-sync')
+    app.extensions['sync_app'] = sync_app
+    app.extensions['sync_executor'] = executor
+
+    #asyncpg POOL (ALSO REPORTED BY /api/metrics ON THE SYNC SIDE)
+    from app.async_db import init_async_db
+    sync_app.extensions['async_db_pool'] = init_async_db(app)
+
+    #ASYNC HANDLERS FOR THE ROUTES THAT WAIT ON THE DATABASE
+    from app.async_routes.facilities import facilities_bp
+    from app.async_routes.locations import locations_bp
+    from app.async_routes.stats import stats_bp
+    from app.async_routes.routing import routing_bp
+
+    app.register_blueprint(facilities_bp)
+    app.register_blueprint(locations_bp)
+    app.register_blueprint(stats_bp)
+    app.register_blueprint(routing_bp)
+
+    #SAME SNAPSHOT CHECK AS THE SYNC APP, FOR REQUESTS SERVED BY THE ASYNC HANDLERS
+    from app.utils.snapshot import snapshot_changed, start_snapshot_swap
+
+    @app.before_request
+    async def pick_up_snapshot():
+        if snapshot_changed():
+            start_snapshot_swap(sync_app)
+
+    #SAME HEADERS AS flask-cors ON THE SYNC APP (ANY ORIGIN, ECHOED BACK); PREFLIGHTS ARE SENT TO THE SYNC APP
+    @app.after_request
+    async def allow_any_origin(response):
+        origin = request.headers.get('Origin')
+        response.headers['Access-Control-Allow-Origin'] = origin or '*'
+        if origin:
+            response.vary.add('Origin')
+        return response
+
+    @app.after_serving
+    async def stop_sync_workers():
+        executor.shutdown(wait=False)
+
+    return AsyncDispatcher(app, sync_app, executor)
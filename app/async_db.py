@@ -0,0 +1,206 @@
+# ASYNCIO POSTGRES POOL (asyncpg) FOR THE ASGI APP - SAME QUERIES AS THE SYNC PATH, %s PLACEHOLDERS INCLUDED
+import asyncio
+import re
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import asyncpg
+except ImportError:  # OPTIONAL - ONLY NEEDED FOR create_asgi_app
+    asyncpg = None
+
+from app.db import PoolTimeout, mark_database_unreachable
+
+_PLACEHOLDER = re.compile(r'%(s|%)')
+
+#A LOST, REFUSED OR STARTING/STOPPING SERVER (NOT A BUSY POOL) - THE SAME CASE AS psycopg2's OperationalError ON THE SYNC PATH
+CONNECTION_ERRORS = (OSError,) if asyncpg is None else (
+    OSError, asyncpg.PostgresConnectionError, asyncpg.InterfaceError, asyncpg.CannotConnectNowError)
+
+#psycopg2 STYLE "%s" / "%%" -> asyncpg "$1", "$2", ... / "%"
+@lru_cache(maxsize=256)
+def pg_placeholders(query: str) -> str:
+    counter = iter(range(1, query.count('%s') + 1))
+    return _PLACEHOLDER.sub(lambda m: f'${next(counter)}' if m.group(1) == 's' else '%', query)
+
+
+class AsyncConnectionPool:
+    """asyncpg pool opened on first use, so the app still starts (and answers
+    "Database connection failed") while PostGIS is down"""
+    def __init__(self, db_config: dict, min_size: int = 1, max_size: int = 10,
+                 timeout: float = 5.0, max_idle: float = 300.0):
+        if asyncpg is None:
+            raise RuntimeError('asyncpg is not installed (pip install asyncpg)')
+        self.db_config = dict(db_config)
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.timeout = timeout
+        self.max_idle = max_idle
+
+        self._pool = None
+        self._opening: Optional[asyncio.Lock] = None
+        self._in_use = 0
+        self._waiting = 0
+
+        self._checkouts = 0
+        self._timeouts = 0
+        self._queries = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    async def open(self):
+        if self._pool is not None:
+            return self._pool
+        if self._opening is None:
+            self._opening = asyncio.Lock()
+        async with self._opening:
+            if self._pool is None:
+                config = self.db_config
+                self._pool = await asyncpg.create_pool(
+                    database=config.get('dbname'),
+                    user=config.get('user'),
+                    password=config.get('password'),
+                    host=config.get('host'),
+                    port=config.get('port'),
+                    min_size=self.min_size,
+                    max_size=self.max_size,
+                    max_inactive_connection_lifetime=self.max_idle,
+                    timeout=self.timeout
+                )
+        return self._pool
+
+    async def available(self) -> bool:
+        try:
+            await self.open()
+            return True
+        except Exception as e:
+            print(f"Database connection error: {e}")
+            mark_database_unreachable()
+            return False
+
+    async def close(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await pool.close()
+
+    @asynccontextmanager
+    async def connection(self):
+        """Check out a connection, waiting up to `timeout` seconds for one to free up;
+        connection failures mark the database unreachable (so fallback mode can serve the snapshot) and re-raise"""
+        try:
+            pool = await self.open()
+        except CONNECTION_ERRORS:
+            mark_database_unreachable()
+            raise
+        start = time.monotonic()
+        self._waiting += 1
+        try:
+            conn = await pool.acquire(timeout=self.timeout)
+        # asyncio.TimeoutError IS AN OSError ON 3.11+, SO IT IS CAUGHT FIRST
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            raise PoolTimeout(f'No database connection available after {self.timeout}s '
+                              f'(pool size {self.max_size})')
+        except CONNECTION_ERRORS:
+            mark_database_unreachable()
+            raise
+        finally:
+            self._waiting -= 1
+
+        waited = time.monotonic() - start
+        self._checkouts += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        self._in_use += 1
+        try:
+            yield conn
+        except asyncio.TimeoutError:
+            raise
+        except CONNECTION_ERRORS:
+            mark_database_unreachable()
+            raise
+        finally:
+            self._in_use -= 1
+            await pool.release(conn)
+
+    # EACH CALL CHECKS OUT ITS OWN CONNECTION, SO INDEPENDENT QUERIES CAN RUN UNDER asyncio.gather
+    async def fetch_all(self, query: str, params: Sequence = ()) -> List[Dict]:
+        async with self.connection() as conn:
+            self._queries += 1
+            return [dict(row) for row in await conn.fetch(pg_placeholders(query), *params)]
+
+    async def fetch_one(self, query: str, params: Sequence = ()) -> Optional[Dict]:
+        async with self.connection() as conn:
+            self._queries += 1
+            row = await conn.fetchrow(pg_placeholders(query), *params)
+            return dict(row) if row is not None else None
+
+    async def fetch_value(self, query: str, params: Sequence = ()):
+        async with self.connection() as conn:
+            self._queries += 1
+            return await conn.fetchval(pg_placeholders(query), *params)
+
+    async def stream(self, query: str, params: Sequence = (), batch_size: int = 2000):
+        """Rows in batches from a server-side cursor; one connection is held until the generator finishes"""
+        async with self.connection() as conn:
+            self._queries += 1
+            async with conn.transaction(readonly=True):
+                cursor = await conn.cursor(pg_placeholders(query), *params)
+                while True:
+                    rows = await cursor.fetch(batch_size)
+                    if not rows:
+                        break
+                    yield [dict(row) for row in rows]
+
+    def stats(self) -> dict:
+        pool = self._pool
+        return {
+            'size': pool.get_size() if pool is not None else 0,
+            'idle': pool.get_idle_size() if pool is not None else 0,
+            'in_use': self._in_use,
+            'waiting': self._waiting,
+            'min_size': self.min_size,
+            'max_size': self.max_size,
+            'checkouts': self._checkouts,
+            'timeouts': self._timeouts,
+            'queries': self._queries,
+            'avg_checkout_ms': round(self._wait_total / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+            'max_checkout_ms': round(self._wait_max * 1000, 3)
+        }
+
+
+def create_async_pool(config) -> AsyncConnectionPool:
+    return AsyncConnectionPool(
+        config['DB_CONFIG'],
+        min_size=config['ASYNC_DB_POOL_MIN_SIZE'],
+        max_size=config['ASYNC_DB_POOL_MAX_SIZE'],
+        timeout=config['DB_POOL_TIMEOUT'],
+        max_idle=config['DB_POOL_MAX_IDLE']
+    )
+
+#POOL OF THE RUNNING ASGI APP
+def get_async_pool() -> AsyncConnectionPool:
+    from quart import current_app
+    return current_app.extensions['async_db_pool']
+
+def init_async_db(app) -> AsyncConnectionPool:
+    pool = create_async_pool(app.config)
+    app.extensions['async_db_pool'] = pool
+
+    @app.before_serving
+    async def open_async_pool():
+        if app.config.get('OFFLINE_MODE') == 'always':
+            return
+        try:
+            await pool.open()
+        except Exception as e:
+            print(f"Async database pool warm-up failed: {e}")
+            mark_database_unreachable()
+
+    @app.after_serving
+    async def close_async_pool():
+        await pool.close()
+
+    return pool
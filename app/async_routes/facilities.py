@@ -0,0 +1,164 @@
+import asyncio
+
+from quart import Blueprint, Response, current_app, jsonify, request
+from app.async_db import get_async_pool
+from app.utils.facility_query import (
+    FACILITY_BY_ID_QUERY, FACILITY_TYPES_QUERY, OWNERSHIPS_QUERY,
+    decode_cursor, encode_cursor, facility_count_key, facility_count_query, facility_filter_clause,
+    facility_listing_query, get_count_cache, parse_fields
+)
+from app.utils.helpers import get_services_by_type, get_working_hours, get_contact_info
+from app.utils.response_cache import async_cached_response
+from app.utils.streaming import NDJSON_MIMETYPE, async_json_envelope_stream, async_ndjson_stream, prime_batches
+
+facilities_bp = Blueprint('facilities', __name__)
+
+#TOTAL ROWS FOR A FILTER FROM THE SAME CACHE AS THE SYNC facility_count
+async def async_facility_count(pool, where, params):
+    cache = get_count_cache()
+    key = facility_count_key(where, params)
+    total = cache.get(key)
+    if total is None:
+        total = await pool.fetch_value(facility_count_query(where), params)
+        cache.put(key, total)
+    return total
+
+@facilities_bp.route('/api/facilities', methods=['GET'])
+async def get_all_facilities():
+    try:
+        functional_only = request.args.get('functional_only', 'false').lower() == 'true'
+        district = request.args.get('district', None)
+        facility_type = request.args.get('facility_type', None)
+        ownership = request.args.get('ownership', None)
+
+        fields = parse_fields(request.args.get('fields', None))
+
+        cursor = request.args.get('cursor', None)
+        page_size = request.args.get('page_size', None, type=int)
+        paginated = page_size is not None or cursor is not None
+        if paginated:
+            max_page_size = current_app.config['FACILITY_PAGE_MAX_SIZE']
+            if page_size is None:
+                page_size = current_app.config['FACILITY_PAGE_DEFAULT_SIZE']
+            if not 1 <= page_size <= max_page_size:
+                return jsonify({'success': False, 'error': f'page_size must be between 1 and {max_page_size}'}), 400
+        include_total = request.args.get('include_total', 'false').lower() == 'true'
+
+        stream = request.args.get('stream', '').lower()
+        if not stream and request.accept_mimetypes.best == NDJSON_MIMETYPE:
+            stream = 'ndjson'
+        if stream not in ('', 'json', 'ndjson'):
+            return jsonify({'success': False, 'error': 'stream must be "json" or "ndjson"'}), 400
+        if stream and paginated:
+            return jsonify({'success': False, 'error': 'stream cannot be combined with page_size or cursor'}), 400
+
+        pool = get_async_pool()
+        if not await pool.available():
+            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
+
+        where, where_params = facility_filter_clause(functional_only, district, facility_type, ownership)
+        filters = {
+            'functional_only': functional_only,
+            'district': district,
+            'facility_type': facility_type,
+            'ownership': ownership
+        }
+
+        if stream:
+            #asyncpg CURSOR IN A READ-ONLY TRANSACTION, ENCODED ONE BATCH AT A TIME
+            query, params = facility_listing_query(fields, where, where_params)
+            batches = await prime_batches(
+                pool.stream(query, params, current_app.config['FACILITY_STREAM_BATCH_SIZE'])
+            )
+            dumps = current_app.json.dumps
+            if stream == 'ndjson':
+                return Response(async_ndjson_stream(batches, dumps), mimetype=NDJSON_MIMETYPE)
+            return Response(async_json_envelope_stream(batches, dumps, success=True, filters=filters),
+                            mimetype='application/json')
+
+        if not paginated:
+            query, params = facility_listing_query(fields, where, where_params)
+        else:
+            after = decode_cursor(cursor) if cursor else None
+            select = fields + [f for f in ('name', 'id') if f not in fields]
+            query, params = facility_listing_query(select, where, where_params, after=after, limit=page_size + 1)
+
+        #THE PAGE AND THE TOTAL ARE INDEPENDENT - BOTH QUERIES RUN AT ONCE ON SEPARATE CONNECTIONS
+        if include_total:
+            facilities, total = await asyncio.gather(
+                pool.fetch_all(query, params),
+                async_facility_count(pool, where, where_params)
+            )
+        else:
+            facilities = await pool.fetch_all(query, params)
+
+        result = {
+            'success': True,
+            'data': facilities,
+            'count': len(facilities),
+            'filters': filters
+        }
+
+        if paginated:
+            has_more = len(facilities) > page_size
+            facilities = facilities[:page_size]
+            last = facilities[-1] if facilities else None
+            result.update({
+                'data': [{f: row[f] for f in fields} for row in facilities],
+                'count': len(facilities),
+                'page_size': page_size,
+                'has_more': has_more,
+                'next_cursor': encode_cursor(last['name'], last['id']) if has_more else None
+            })
+
+        if include_total:
+            result['total'] = total
+
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error in get_all_facilities: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+#GET DETAILED INFO ABOUT SPECIFIC FACILITY
+@facilities_bp.route('/api/facility/<int:facility_id>', methods=['GET'])
+async def get_facility_details(facility_id):
+    try:
+        pool = get_async_pool()
+        if not await pool.available():
+            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
+
+        facility = await pool.fetch_one(FACILITY_BY_ID_QUERY, (facility_id,))
+        if not facility:
+            return jsonify({'success': False, 'error': 'Facility not found'}), 404
+
+        # MOCK SERVICE
+        facility['services'] = get_services_by_type(facility['facility_type'])
+        facility['working_hours'] = get_working_hours(facility['facility_type'])
+        facility['contact'] = get_contact_info(facility['district'])
+        return jsonify({'success': True, 'data': facility})
+    except Exception as e:
+        print(f"Error in get_facility_details: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+#LOOKUP LIST (SAME RESPONSE CACHE AS THE SYNC VIEWS)
+async def lookup_list(query, name):
+    try:
+        pool = get_async_pool()
+        if not await pool.available():
+            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
+        return jsonify({'success': True, 'data': await pool.fetch_all(query)})
+    except Exception as e:
+        print(f"Error in {name}: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@facilities_bp.route('/api/facility-types', methods=['GET'])
+@async_cached_response
+async def get_facility_types():
+    return await lookup_list(FACILITY_TYPES_QUERY, 'get_facility_types')
+
+@facilities_bp.route('/api/ownerships', methods=['GET'])
+@async_cached_response
+async def get_ownerships():
+    return await lookup_list(OWNERSHIPS_QUERY, 'get_ownerships')
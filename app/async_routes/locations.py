@@ -0,0 +1,21 @@
+from quart import Blueprint, jsonify
+from app.async_db import get_async_pool
+from app.utils.facility_query import DISTRICTS_QUERY
+from app.utils.response_cache import async_cached_response
+
+locations_bp = Blueprint('locations', __name__)
+
+# GEOCODING IS IN MEMORY - /api/geocode AND /api/geocode/batch STAY ON THE SYNC HANDLERS
+@locations_bp.route('/api/districts', methods=['GET'])
+@async_cached_response
+async def get_districts():
+    try:
+        pool = get_async_pool()
+        if not await pool.available():
+            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
+
+        districts = await pool.fetch_all(DISTRICTS_QUERY)
+        return jsonify({'success': True, 'data': districts})
+    except Exception as e:
+        print(f"Error in get_districts: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,159 @@
+import asyncio
+from typing import Dict, Optional, Tuple
+
+from quart import Blueprint, jsonify, request
+from app.asgi import run_sync
+from app.async_db import get_async_pool
+from app.utils.facility_query import FACILITY_BY_ID_QUERY
+from app.utils.graph_search import SEARCH_ALGORITHMS
+from app.utils.node_snapper import get_facility_nodes, get_node_snapper
+from app.utils.route_cache import get_route_cache, route_cache_key
+from app.utils.routing_helpers import (
+    NEAREST_NODE_QUERY,
+    ROUTE_GEOMETRY_QUERY,
+    calculate_route,
+    find_facility_road_node,
+    route_edge_ids,
+    route_geometry_feature,
+    snap_limit_km,
+    summarize_route
+)
+from app.utils.topology import get_topology_version
+
+routing_bp = Blueprint('routing', __name__)
+
+# NEAREST ROAD NODE TO A FACILITY, LOOKED UP BY ID (THE SUBQUERY IS EVALUATED ONCE, SO THE KNN INDEX IS USED)
+FACILITY_NODE_QUERY = """
+            SELECT id
+            FROM malawi_roads_nodes
+            ORDER BY the_geom <-> (
+                SELECT ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)
+                FROM malawi_health_facilities
+                WHERE gid = %s
+            )
+            LIMIT 1;
+        """
+
+#IN-MEMORY SNAPS OF THE START POINT AND THE (PRE-SNAPPED) FACILITY; None WHEN THE ROAD GRAPH IS NOT LOADED
+def snap_route_ends(lat: float, lng: float, facility_id: int) -> Optional[Tuple[Optional[int], Optional[int]]]:
+    if get_topology_version() is None:
+        return None, None
+    snapper = get_node_snapper()
+    if snapper is None:
+        return None
+    return snapper.snap(lat, lng, snap_limit_km()), get_facility_nodes().get(facility_id)
+
+async def snap_nodes(pool, lat: float, lng: float, facility_id: int) -> Tuple[Optional[int], Optional[int]]:
+    nodes = await run_sync(snap_route_ends, lat, lng, facility_id)
+    if nodes is not None:
+        return nodes
+    # NO GRAPH IN MEMORY - BOTH NEAREST-NODE QUERIES AT ONCE
+    nearest, facility_node = await asyncio.gather(
+        pool.fetch_one(NEAREST_NODE_QUERY, (lng, lat, lng, lat)),
+        pool.fetch_value(FACILITY_NODE_QUERY, (facility_id,))
+    )
+    max_km = snap_limit_km()
+    if nearest is None or (max_km is not None and nearest['distance_m'] > max_km * 1000):
+        return None, facility_node
+    return nearest['id'], facility_node
+
+#CACHED ROUTE OR A GRAPH SEARCH (CPU, RUNS IN A WORKER THREAD)
+def search_route(start_node: int, end_node: int, algorithm: str):
+    cache = get_route_cache()
+    key = route_cache_key(start_node, end_node, algorithm, get_topology_version())
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        return key, cached, None, None
+    search_stats = {}
+    return key, None, calculate_route(None, start_node, end_node, algorithm, search_stats), search_stats
+
+#SAME RESULT AS calculate_route_with_details; THE GEOMETRY QUERY GOES THROUGH THE asyncpg POOL
+async def async_route_with_details(pool, start_node: int, end_node: int, algorithm: str) -> Optional[Dict]:
+    key, cached, route_segments, search_stats = await run_sync(search_route, start_node, end_node, algorithm)
+    if cached is not None:
+        return dict(cached, search={'algorithm': algorithm, 'cached': True})
+    if not route_segments:
+        return None
+
+    try:
+        geojson = await pool.fetch_value(ROUTE_GEOMETRY_QUERY, (route_edge_ids(route_segments),))
+        geometry = route_geometry_feature(geojson, route_segments)
+    except Exception as e:
+        print(f"Error formatting route geometry: {e}")
+        geometry = None
+
+    route_info = summarize_route(route_segments, geometry, algorithm, start_node, end_node)
+    cache = get_route_cache()
+    if cache is not None and geometry is not None:
+        cache.put(key, route_info)
+    return dict(route_info, search=dict(search_stats, cached=False))
+
+# MATRIX, MULTIPLE AND OPTIMIZE ARE GRAPH SEARCHES (CPU) - THEY STAY ON THE SYNC HANDLERS
+@routing_bp.route('/api/route', methods=['POST'])
+async def calculate_single_route():
+    try:
+        data = await request.get_json()
+
+        if not data:
+            return jsonify({'success': False, 'error': 'No data provided'}), 400
+
+        required_fields = ['start_lat', 'start_lng', 'facility_id']
+        for field in required_fields:
+            if field not in data:
+                return jsonify({'success': False, 'error': f'Missing required field: {field}'}), 400
+
+        start_lat = float(data['start_lat'])
+        start_lng = float(data['start_lng'])
+        facility_id = int(data['facility_id'])
+        algorithm = data.get('algorithm', 'dijkstra')
+
+        if algorithm not in SEARCH_ALGORITHMS:
+            return jsonify({'success': False, 'error': 'Invalid algorithm. Use "dijkstra", "astar", "bidirectional" or "ch"'}), 400
+
+        pool = get_async_pool()
+        if not await pool.available():
+            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
+
+        # FACILITY LOOKUP AND BOTH NODE SNAPS ARE INDEPENDENT - ISSUE THEM TOGETHER
+        facility, (start_node, end_node) = await asyncio.gather(
+            pool.fetch_one(FACILITY_BY_ID_QUERY, (facility_id,)),
+            snap_nodes(pool, start_lat, start_lng, facility_id)
+        )
+
+        if not facility:
+            return jsonify({'success': False, 'error': 'Facility not found'}), 404
+
+        # FACILITY MISSING FROM THE PRE-SNAPPED INDEX (ADDED SINCE THE LAST RELOAD)
+        if end_node is None and start_node is not None:
+            end_node = await run_sync(find_facility_road_node, None, facility)
+
+        if not start_node or not end_node:
+            return jsonify({
+                'success': False,
+                'error': 'Could not calculate route. No road network path found between locations.',
+                'details': {
+                    'start_node_found': bool(start_node),
+                    'end_node_found': bool(end_node)
+                }
+            }), 200
+
+        route_info = await async_route_with_details(pool, start_node, end_node, algorithm)
+        if not route_info:
+            return jsonify({
+                'success': False,
+                'error': 'Could not calculate route. No road network path found or route could not be formed between the two points.'
+            }), 200
+
+        return jsonify({
+            'success': True,
+            'data': {
+                'facility': facility,
+                'route': route_info
+            }
+        })
+
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f'Invalid data format: {str(e)}'}), 400
+    except Exception as e:
+        print(f"Error in calculate_single_route: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,64 @@
+from quart import Blueprint, jsonify, request
+from app.async_db import get_async_pool
+from app.utils.data_version import current_data_version
+from app.utils.response_cache import async_cached_response
+from app.utils.stats_summary import (
+    DIMENSIONS, STATS_QUERY, StatsSummary, install_stats_summary, loaded_stats_summary
+)
+
+stats_bp = Blueprint('stats', __name__)
+
+#SHARED SUMMARY WITH THE SYNC APP; AFTER A RELOAD THE GROUPING SETS SCAN RUNS ON THE asyncpg POOL
+async def get_async_stats_summary():
+    summary = loaded_stats_summary()
+    if summary is not None:
+        return summary
+    pool = get_async_pool()
+    if not await pool.available():
+        return None
+    version = current_data_version()
+    return install_stats_summary(StatsSummary(await pool.fetch_all(STATS_QUERY), version))
+
+@stats_bp.route('/api/stats', methods=['GET'])
+@async_cached_response
+async def get_statistics():
+    try:
+        summary = await get_async_stats_summary()
+        if summary is None:
+            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
+
+        return jsonify({
+            'success': True,
+            'stats': summary.totals,
+            'by_type': summary.breakdown('type'),
+            'by_district': summary.breakdown('district', limit=10),
+            'by_ownership': summary.breakdown('ownership'),
+            'by_zone': summary.breakdown('zone')
+        })
+    except Exception as e:
+        print(f"Error in get_statistics: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@stats_bp.route('/api/stats/<dimension>', methods=['GET'])
+@async_cached_response
+async def get_statistics_breakdown(dimension):
+    try:
+        if dimension not in DIMENSIONS:
+            return jsonify({'success': False, 'error': f'Unknown breakdown. Use one of: {", ".join(DIMENSIONS)}'}), 404
+
+        summary = await get_async_stats_summary()
+        if summary is None:
+            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
+
+        filters = {}
+        if dimension == 'district_type':
+            filters = {
+                'district': request.args.get('district', None),
+                'facility_type': request.args.get('facility_type', None)
+            }
+
+        data = summary.breakdown(dimension, **filters)
+        return jsonify({'success': True, 'data': data, 'count': len(data)})
+    except Exception as e:
+        print(f"Error in get_statistics_breakdown: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,100 @@
+# FLASK CLI COMMANDS FOR DEPLOY-TIME DATA PREPARATION
+import time
+
+import click
+from app.db import get_db_connection
+
+def register_commands(app):
+    @app.cli.command('build-topology')
+    @click.option('--tolerance', type=float, default=None,
+                  help='Snapping distance in degrees for joining road endpoints')
+    def build_topology_command(tolerance):
+        """Rebuild malawi_roads_clean / malawi_roads_nodes and record a new topology version"""
+        from app.utils.topology import build_routing_topology
+        conn = get_db_connection()
+        if not conn:
+            raise click.ClickException('Database connection failed')
+        version = build_routing_topology(conn, tolerance)
+        click.echo(f'Topology version {version} ready')
+
+    @app.cli.command('build-ch')
+    @click.option('--output', type=click.Path(dir_okay=False), default=None,
+                  help='Where to write the hierarchy (default: ROUTING_CH_PATH)')
+    @click.option('--settle-limit', type=int, default=500,
+                  help='Nodes a witness search may settle before a shortcut is added anyway')
+    def build_ch_command(output, settle_limit):
+        """Contract the current road graph and write the hierarchy used by algorithm 'ch'"""
+        from app.utils.contraction import build_contraction_hierarchy, hierarchy_path
+        from app.utils.road_graph import get_road_graph
+        graph = get_road_graph()
+        if graph is None:
+            raise click.ClickException('Road graph could not be loaded')
+
+        started = time.perf_counter()
+        hierarchy = build_contraction_hierarchy(
+            graph, settle_limit,
+            progress=lambda done, total: click.echo(f'  contracted {done}/{total} nodes')
+        )
+        path = output or hierarchy_path()
+        hierarchy.save(path)
+        click.echo(f'Contraction hierarchy for topology version {hierarchy.topology_version} written to {path}: '
+                   f'{hierarchy.shortcut_count} shortcuts, {time.perf_counter() - started:.1f}s')
+
+    @app.cli.command('build-snapshot')
+    @click.option('--output', type=click.Path(dir_okay=False), default=None,
+                  help='Where to publish the snapshot (default: SNAPSHOT_PATH)')
+    def build_snapshot_command(output):
+        """Write the facility registry and road graph to a new snapshot and publish it to running workers"""
+        from app.utils.snapshot import build_snapshot, snapshot_path
+        conn = get_db_connection()
+        if not conn:
+            raise click.ClickException('Database connection failed')
+
+        started = time.perf_counter()
+        path = output or snapshot_path()
+        published = build_snapshot(conn, path)
+        click.echo(f"Snapshot {published['path']} published as {path}: {published['facilities']} facilities, "
+                   f"{published['nodes']} nodes, {published['edges']} edges"
+                   f"{', contraction hierarchy' if published['hierarchy'] else ''}, "
+                   f"{published['bytes'] / 1048576:.1f} MB, {time.perf_counter() - started:.1f}s")
+
+    @app.cli.command('verify-ch')
+    @click.option('--pairs', type=int, default=200, help='Random node pairs to compare')
+    @click.option('--seed', type=int, default=0, help='Random seed for the node pairs')
+    @click.option('--path', type=click.Path(dir_okay=False), default=None,
+                  help='Hierarchy file to check (default: ROUTING_CH_PATH)')
+    def verify_ch_command(pairs, seed, path):
+        """Compare contraction hierarchy routes with plain Dijkstra on random node pairs"""
+        from app.utils.contraction import ContractionHierarchy, hierarchy_path
+        from app.utils.graph_search import verify_contraction_hierarchy
+        from app.utils.road_graph import get_road_graph
+        graph = get_road_graph()
+        if graph is None:
+            raise click.ClickException('Road graph could not be loaded')
+
+        hierarchy = ContractionHierarchy.load(path or hierarchy_path())
+        if not hierarchy.matches(graph):
+            raise click.ClickException('Hierarchy was built for a different topology version - run "flask build-ch"')
+
+        report = verify_contraction_hierarchy(graph, hierarchy, pairs, seed)
+        click.echo(f"{report['pairs']} pairs, {report['mismatches']} mismatches")
+        click.echo(f"avg settled nodes: dijkstra {report['avg_settled']['dijkstra']}, ch {report['avg_settled']['ch']}")
+        click.echo(f"avg query ms: dijkstra {report['avg_ms']['dijkstra']}, ch {report['avg_ms']['ch']}")
+        for example in report['examples']:
+            click.echo(f"  {example['source']} -> {example['target']}: {example['problem']}")
+        if report['mismatches']:
+            raise click.ClickException('Contraction hierarchy disagrees with Dijkstra')
+
+    @app.cli.command('seed-tiles')
+    @click.option('--max-zoom', type=int, default=None,
+                  help='Render every zoom level up to this one (default: TILE_SEED_MAX_ZOOM)')
+    def seed_tiles_command(max_zoom):
+        """Render facility vector tiles over the registry's extent into TILE_CACHE_DIR"""
+        from flask import current_app
+        from app.utils.vector_tiles import seed_tiles
+        if max_zoom is None:
+            max_zoom = current_app.config['TILE_SEED_MAX_ZOOM']
+        count = seed_tiles(max_zoom)
+        if not count:
+            raise click.ClickException('No tiles rendered - check the database connection and facility data')
+        click.echo(f'{count} tiles ready for zoom 0-{max_zoom}')
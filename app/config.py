@@ -1,4 +1,10 @@
 import os
+from flask import current_app, has_app_context
+
+try:
+    from quart import current_app as current_async_app, has_app_context as has_async_app_context
+except ImportError:  # ONLY THE ASGI APP (app.asgi) NEEDS quart
+    has_async_app_context = None
 
 #DATABASE CONFIGURATION
 class Config:
@@ -7,5 +13,130 @@ class Config:
         'user': 'progress',
         'password': 'dayire',
         'host': 'localhost',
-        'port': 5432
+        'port': 5432,
+        'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 10))   # SECONDS BEFORE AN UNREACHABLE SERVER COUNTS AS DOWN
     }
+
+    #CONNECTION POOL
+    DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 1))
+    DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 10))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5.0))          # SECONDS TO WAIT FOR A FREE CONNECTION
+    DB_POOL_MAX_IDLE = float(os.environ.get('DB_POOL_MAX_IDLE', 300.0))      # CLOSE CONNECTIONS IDLE LONGER THAN THIS
+    DB_POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', 3600.0))
+    DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', 30.0))   # VALIDATE WITH SELECT 1 AFTER THIS IDLE TIME
+
+    #IN-MEMORY FACILITY INDEX
+    FACILITY_INDEX_PRELOAD = os.environ.get('FACILITY_INDEX_PRELOAD', 'true').lower() == 'true'
+    FACILITY_INDEX_CELL_DEG = float(os.environ.get('FACILITY_INDEX_CELL_DEG', 0.1))
+
+    #IN-MEMORY ROAD GRAPH FOR ROUTING
+    ROUTING_GRAPH_PRELOAD = os.environ.get('ROUTING_GRAPH_PRELOAD', 'true').lower() == 'true'
+
+    #ROUTING TOPOLOGY (BUILT AT DEPLOY WITH "flask build-topology")
+    ROUTING_TOPOLOGY_TOLERANCE = float(os.environ.get('ROUTING_TOPOLOGY_TOLERANCE', 0.00001))  # DEGREES
+    #BUILD AT STARTUP WHEN MISSING - SINGLE-PROCESS DEV SERVERS ONLY, EVERY WORKER WOULD RACE THE DROP/CREATE
+    ROUTING_TOPOLOGY_BUILD_IF_MISSING = os.environ.get('ROUTING_TOPOLOGY_BUILD_IF_MISSING', 'false').lower() == 'true'
+
+    #ROAD NODE SNAPPING (COORDINATES ROUNDED TO THIS MANY DECIMALS SHARE A CACHE ENTRY)
+    ROUTING_SNAP_PRECISION = int(os.environ.get('ROUTING_SNAP_PRECISION', 4))
+    ROUTING_SNAP_CACHE_SIZE = int(os.environ.get('ROUTING_SNAP_CACHE_SIZE', 50000))
+    ROUTING_SNAP_CELL_DEG = float(os.environ.get('ROUTING_SNAP_CELL_DEG', 0.02))            # GRID CELL OF THE IN-MEMORY NODE INDEX
+    ROUTING_SNAP_MAX_DISTANCE = float(os.environ.get('ROUTING_SNAP_MAX_DISTANCE', 1000))   # METRES FROM A POINT TO ITS ROAD NODE, 0 DISABLES
+
+    #CONTRACTION HIERARCHY FILE (WRITTEN BY "flask build-ch", LOADED WITH THE ROAD GRAPH)
+    ROUTING_CH_PATH = os.environ.get('ROUTING_CH_PATH', os.path.join('data', 'road_graph.ch'))
+
+    #NEAREST FACILITIES BY TRAVEL TIME (k FUNCTIONAL FACILITIES PRECOMPUTED PER ROAD NODE)
+    NEAREST_TRAVEL_TIME_K = int(os.environ.get('NEAREST_TRAVEL_TIME_K', 5))
+
+    #FACILITY CATCHMENTS (GRID ISOCHRONES, CACHED PER FACILITY AND TIME BAND)
+    CATCHMENT_CELL_DEG = float(os.environ.get('CATCHMENT_CELL_DEG', 0.01))      # ~1.1 KM CELLS
+    CATCHMENT_MAX_MINUTES = int(os.environ.get('CATCHMENT_MAX_MINUTES', 240))
+    CATCHMENT_CACHE_MAX_ENTRIES = int(os.environ.get('CATCHMENT_CACHE_MAX_ENTRIES', 3000))
+    CATCHMENT_CACHE_MAX_MB = float(os.environ.get('CATCHMENT_CACHE_MAX_MB', 128))
+
+    #TRAVEL MATRIX (MAXIMUM ORIGINS / DESTINATIONS PER REQUEST)
+    ROUTING_MATRIX_MAX_SIZE = int(os.environ.get('ROUTING_MATRIX_MAX_SIZE', 250))
+
+    #ROUTE OPTIMISATION (EXACT HELD-KARP UP TO ROUTING_OPTIMIZE_EXACT_MAX STOPS, 2-OPT/OR-OPT ABOVE)
+    ROUTING_OPTIMIZE_MAX_FACILITIES = int(os.environ.get('ROUTING_OPTIMIZE_MAX_FACILITIES', 50))
+    ROUTING_OPTIMIZE_EXACT_MAX = int(os.environ.get('ROUTING_OPTIMIZE_EXACT_MAX', 10))
+
+    #PARALLEL ROUTE DETAILS FOR /api/routes/multiple AND /api/route/optimize (EACH TASK USES ITS OWN POOLED CONNECTION)
+    ROUTING_PARALLEL_WORKERS = int(os.environ.get('ROUTING_PARALLEL_WORKERS', 16))                  # SHARED BY ALL REQUESTS
+    ROUTING_PARALLEL_MAX_CONCURRENCY = int(os.environ.get('ROUTING_PARALLEL_MAX_CONCURRENCY', 10))  # IN FLIGHT ACROSS ALL REQUESTS
+    ROUTING_PARALLEL_TIMEOUT = float(os.environ.get('ROUTING_PARALLEL_TIMEOUT', 20.0))              # SECONDS, 0 DISABLES
+
+    #ROUTING WORKER PROCESSES (0 RUNS SEARCHES IN THE REQUEST THREAD) - GRAPH ARRAYS ARE SHARED THROUGH ONE MAPPED SNAPSHOT FILE
+    ROUTING_WORKERS = int(os.environ.get('ROUTING_WORKERS', 0))
+    ROUTING_WORKER_TIMEOUT = float(os.environ.get('ROUTING_WORKER_TIMEOUT', 30.0))              # SECONDS, THEN THE WORKER IS KILLED
+    ROUTING_WORKER_QUEUE_TIMEOUT = float(os.environ.get('ROUTING_WORKER_QUEUE_TIMEOUT', 10.0))  # SECONDS TO WAIT FOR A FREE WORKER
+    ROUTING_WORKER_MAX_JOBS = int(os.environ.get('ROUTING_WORKER_MAX_JOBS', 1000))              # RESTART A WORKER AFTER THIS MANY
+    ROUTING_WORKER_DIR = os.environ.get('ROUTING_WORKER_DIR', '')                                # GRAPH FILE ('' = /dev/shm OR TEMP DIR)
+
+    #ROUTE RESULT CACHE (SET ROUTE_CACHE_MAX_ENTRIES=0 TO DISABLE)
+    ROUTE_CACHE_MAX_ENTRIES = int(os.environ.get('ROUTE_CACHE_MAX_ENTRIES', 5000))
+    ROUTE_CACHE_TTL = float(os.environ.get('ROUTE_CACHE_TTL', 3600))        # SECONDS
+    ROUTE_CACHE_MAX_MB = float(os.environ.get('ROUTE_CACHE_MAX_MB', 64))
+
+    #CACHED LOOKUP RESPONSES (DISTRICTS, FACILITY TYPES, OWNERSHIPS, STATS) - REFRESHED ON DATA RELOAD
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 500))
+    RESPONSE_CACHE_MAX_AGE = int(os.environ.get('RESPONSE_CACHE_MAX_AGE', 300))   # SECONDS CLIENTS MAY REUSE WITHOUT REVALIDATING
+
+    #JSON ENCODING ("fast" USES orjson WHEN INSTALLED, "default" IS FLASK'S STDLIB ENCODER)
+    JSON_PROVIDER = os.environ.get('JSON_PROVIDER', 'fast')
+
+    #STREAMED FACILITY LISTINGS (ROWS FETCHED PER ROUND TRIP FROM THE SERVER-SIDE CURSOR)
+    FACILITY_STREAM_BATCH_SIZE = int(os.environ.get('FACILITY_STREAM_BATCH_SIZE', 2000))
+
+    #FACILITY LISTING PAGES (?page_size / ?cursor) AND CACHED TOTALS (?include_total=true)
+    FACILITY_PAGE_DEFAULT_SIZE = int(os.environ.get('FACILITY_PAGE_DEFAULT_SIZE', 100))
+    FACILITY_PAGE_MAX_SIZE = int(os.environ.get('FACILITY_PAGE_MAX_SIZE', 1000))
+    FACILITY_COUNT_CACHE_MAX_ENTRIES = int(os.environ.get('FACILITY_COUNT_CACHE_MAX_ENTRIES', 1000))
+
+    #FACILITY VECTOR TILES (MEMORY + DISK CACHE, LOW ZOOMS RENDERED AT STARTUP AND AFTER A DATA RELOAD)
+    TILE_CACHE_DIR = os.environ.get('TILE_CACHE_DIR', os.path.join(                    # EMPTY DISABLES THE DISK CACHE
+        os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'health-facility-finder', 'tiles'))
+    TILE_CACHE_MAX_ENTRIES = int(os.environ.get('TILE_CACHE_MAX_ENTRIES', 20000))
+    TILE_CACHE_MAX_MB = float(os.environ.get('TILE_CACHE_MAX_MB', 128))
+    TILE_SEED_MAX_ZOOM = int(os.environ.get('TILE_SEED_MAX_ZOOM', 8))                  # -1 DISABLES SEEDING
+    TILE_MAX_ZOOM = int(os.environ.get('TILE_MAX_ZOOM', 20))
+
+    #VIEWPORT CLUSTERS (GRID CELLS OF VIEWPORT_CLUSTER_CELL_PX SCREEN PIXELS, A POWER OF TWO)
+    VIEWPORT_CLUSTER_MAX_ZOOM = int(os.environ.get('VIEWPORT_CLUSTER_MAX_ZOOM', 14))     # SINGLE FACILITIES ABOVE THIS ZOOM
+    VIEWPORT_CLUSTER_CELL_PX = int(os.environ.get('VIEWPORT_CLUSTER_CELL_PX', 64))
+    VIEWPORT_CLUSTER_CACHE_MAX_ENTRIES = int(os.environ.get('VIEWPORT_CLUSTER_CACHE_MAX_ENTRIES', 64))   # FILTER COMBINATIONS
+    VIEWPORT_MAX_FACILITIES = int(os.environ.get('VIEWPORT_MAX_FACILITIES', 2000))
+
+    #GEOCODER (KNOWN PLACES, DISTRICTS AND FACILITY NAMES IN MEMORY)
+    GEOCODER_MIN_SIMILARITY = float(os.environ.get('GEOCODER_MIN_SIMILARITY', 0.3))   # TRIGRAM SIMILARITY FOR FUZZY MATCHES
+    GEOCODE_BATCH_MAX_SIZE = int(os.environ.get('GEOCODE_BATCH_MAX_SIZE', 100))
+
+    #FACILITY SEARCH (/api/search) - SCORE = (1 - WEIGHT) * TEXT + WEIGHT * SCALE / (SCALE + DISTANCE KM)
+    SEARCH_PROXIMITY_WEIGHT = float(os.environ.get('SEARCH_PROXIMITY_WEIGHT', 0.3))
+    SEARCH_PROXIMITY_SCALE_KM = float(os.environ.get('SEARCH_PROXIMITY_SCALE_KM', 25.0))
+
+    #ASYNC SERVING (app.asgi:create_asgi_app) - asyncpg POOL AND THREADS FOR THE SYNC FALLBACK ROUTES
+    ASYNC_DB_POOL_MIN_SIZE = int(os.environ.get('ASYNC_DB_POOL_MIN_SIZE', 2))
+    ASYNC_DB_POOL_MAX_SIZE = int(os.environ.get('ASYNC_DB_POOL_MAX_SIZE', 20))
+    ASGI_SYNC_WORKERS = int(os.environ.get('ASGI_SYNC_WORKERS', 16))   # THREADS RUNNING FLASK ROUTES AND IN-MEMORY SEARCHES
+
+    #SNAPSHOT OF THE FACILITY REGISTRY AND ROAD GRAPH ("flask build-snapshot"), MAPPED READ-ONLY BY EVERY WORKER PROCESS
+    SNAPSHOT_PATH = os.environ.get('SNAPSHOT_PATH', os.path.join('data', 'snapshot.bin'))   # SYMLINK TO THE CURRENT VERSION
+    SNAPSHOT_CHECK_INTERVAL = float(os.environ.get('SNAPSHOT_CHECK_INTERVAL', 5.0))        # SECONDS BETWEEN CHECKS FOR A NEW ONE, -1 DISABLES
+    SNAPSHOT_KEEP = int(os.environ.get('SNAPSHOT_KEEP', 3))                                 # PUBLISHED VERSIONS KEPT ON DISK
+
+    #OFFLINE SERVING FROM THE SNAPSHOT - "off", "fallback" (WHILE THE DATABASE IS UNREACHABLE) OR "always" (NO DATABASE)
+    OFFLINE_MODE = os.environ.get('OFFLINE_MODE', 'off').lower()
+    OFFLINE_RETRY_INTERVAL = float(os.environ.get('OFFLINE_RETRY_INTERVAL', 30.0))   # SECONDS BEFORE AN UNREACHABLE DATABASE IS TRIED AGAIN
+
+    #ADMIN ENDPOINTS (RELOAD DATA, METRICS) - REQUIRED IN THE X-Admin-Token HEADER; EMPTY DISABLES THE ENDPOINTS
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+#READ A SETTING FROM THE RUNNING APP, FALLING BACK TO THE DEFAULT CONFIG
+def get_setting(name: str):
+    if has_app_context():
+        return current_app.config.get(name, getattr(Config, name, None))
+    if has_async_app_context is not None and has_async_app_context():
+        return current_async_app.config.get(name, getattr(Config, name, None))
+    return getattr(Config, name, None)
@@ -1,12 +1,332 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
 import psycopg2
+from psycopg2 import extensions
 from psycopg2.extras import RealDictCursor
-from app.config import Config
+from flask import current_app, g, has_app_context
+from app.config import Config, get_setting
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes free within the checkout timeout"""
+
+
+#THREAD SAFE POSTGRES CONNECTION POOL
+class ConnectionPool:
+    def __init__(self, db_config: dict, min_size: int = 1, max_size: int = 10,
+                 timeout: float = 5.0, max_idle: float = 300.0,
+                 max_lifetime: float = 3600.0, ping_after: float = 30.0):
+        self.db_config = dict(db_config)
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+
+        self._cond = threading.Condition()
+        self._idle = deque()     # (conn, created_at, returned_at) - MOST RECENTLY USED ON THE RIGHT
+        self._created = {}       # id(conn) -> created_at FOR CHECKED OUT CONNECTIONS
+        self._size = 0           # OPEN CONNECTIONS (IDLE + IN USE + BEING OPENED)
+        self._in_use = 0
+        self._waiting = 0
+
+        self._checkouts = 0
+        self._timeouts = 0
+        self._opened = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.db_config)
+        with self._cond:
+            self._opened += 1
+        return conn
+
+    def _close_quietly(self, conn):
+        with self._cond:
+            self._discarded += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, conn, created_at: float, returned_at: float, now: float) -> bool:
+        if conn.closed:
+            return False
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            return False
+        if self.max_idle and now - returned_at > self.max_idle:
+            return False
+        if self.ping_after is not None and now - returned_at > self.ping_after:
+            # CONNECTION SAT IDLE FOR A WHILE, MAKE SURE THE SERVER STILL HAS IT
+            try:
+                cur = conn.cursor()
+                cur.execute('SELECT 1;')
+                cur.close()
+                conn.rollback()
+            except Exception:
+                return False
+        return True
+
+    def getconn(self):
+        """Check out a connection, waiting up to `timeout` seconds for one to free up"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        entry = None
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f'No database connection available after {self.timeout}s '
+                                      f'(pool size {self.max_size})')
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._in_use += 1
+
+        # VALIDATE OR OPEN OUTSIDE THE LOCK SO OTHER THREADS ARE NOT BLOCKED ON NETWORK IO
+        try:
+            now = time.monotonic()
+            if entry is not None:
+                conn, created_at, returned_at = entry
+                if not self._is_usable(conn, created_at, returned_at, now):
+                    self._close_quietly(conn)
+                    conn, created_at = self._connect(), time.monotonic()
+            else:
+                conn, created_at = self._connect(), time.monotonic()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        waited = time.monotonic() - start
+        with self._cond:
+            self._created[id(conn)] = created_at
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def putconn(self, conn, discard: bool = False):
+        """Return a connection to the pool, dropping it if it is broken"""
+        with self._cond:
+            created_at = self._created.pop(id(conn), time.monotonic())
+
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        else:
+            discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            if discard:
+                self._size -= 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+                self._prune_idle()
+            self._cond.notify()
+
+    def _prune_idle(self):
+        # CLOSE THE LEAST RECENTLY USED CONNECTIONS ONCE THEY EXCEED MAX IDLE, KEEPING MIN SIZE (0 DISABLES, AS IN _is_usable)
+        if not self.max_idle:
+            return
+        now = time.monotonic()
+        while self._idle and self._size > self.min_size:
+            conn, created_at, returned_at = self._idle[0]
+            if now - returned_at <= self.max_idle:
+                break
+            self._idle.popleft()
+            self._size -= 1
+            self._close_quietly(conn)
+
+    def warm(self):
+        """Open connections up to min_size"""
+        conns = []
+        try:
+            while len(conns) < self.min_size:
+                conns.append(self.getconn())
+        finally:
+            for conn in conns:
+                self.putconn(conn)
+
+    def closeall(self):
+        with self._cond:
+            while self._idle:
+                conn, _, _ = self._idle.popleft()
+                self._size -= 1
+                self._close_quietly(conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'waiting': self._waiting,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'opened': self._opened,
+                'discarded': self._discarded,
+                'avg_checkout_ms': round(self._wait_total / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                'max_checkout_ms': round(self._wait_max * 1000, 3)
+            }
+
+
+#CONNECTION HANDED TO CALLERS - close() RETURNS IT TO THE POOL INSTEAD OF CLOSING THE SOCKET
+class PooledConnection:
+    def __init__(self, pool: ConnectionPool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    @property
+    def closed(self):
+        return 1 if self._released else self._conn.closed
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool.putconn(self._conn)
+
+
+def create_pool(config) -> ConnectionPool:
+    def setting(name):
+        return config[name] if isinstance(config, dict) else getattr(config, name)
+
+    return ConnectionPool(
+        setting('DB_CONFIG'),
+        min_size=setting('DB_POOL_MIN_SIZE'),
+        max_size=setting('DB_POOL_MAX_SIZE'),
+        timeout=setting('DB_POOL_TIMEOUT'),
+        max_idle=setting('DB_POOL_MAX_IDLE'),
+        max_lifetime=setting('DB_POOL_MAX_LIFETIME'),
+        ping_after=setting('DB_POOL_PING_AFTER')
+    )
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    if has_app_context() and 'db_pool' in current_app.extensions:
+        return current_app.extensions['db_pool']
+
+    # SCRIPTS AND BACKGROUND JOBS OUTSIDE AN APP CONTEXT SHARE ONE POOL BUILT FROM Config
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = create_pool(Config)
+        return _default_pool
+
+def init_app(app):
+    pool = create_pool(app.config)
+    app.extensions['db_pool'] = pool
+    app.teardown_appcontext(release_db_connection)
+
+    if app.config.get('OFFLINE_MODE') == 'always':
+        return pool
+    try:
+        pool.warm()
+    except psycopg2.OperationalError as e:
+        print(f"Database pool warm-up failed: {e}")
+        with app.app_context():
+            mark_database_unreachable()
+    except Exception as e:
+        print(f"Database pool warm-up failed: {e}")
+
+    return pool
+
+#OFFLINE_MODE "always" NEVER CONNECTS; "fallback" STOPS TRYING FOR OFFLINE_RETRY_INTERVAL SECONDS
+#AFTER A FAILED CONNECT, SO REQUESTS ARE ANSWERED FROM THE SNAPSHOT INSTEAD OF WAITING ON TIMEOUTS
+_unreachable_until = 0.0
+
+def database_offline() -> bool:
+    mode = get_setting('OFFLINE_MODE')
+    return mode == 'always' or (mode == 'fallback' and time.monotonic() < _unreachable_until)
+
+def mark_database_unreachable():
+    global _unreachable_until
+    if get_setting('OFFLINE_MODE') == 'fallback':
+        _unreachable_until = time.monotonic() + get_setting('OFFLINE_RETRY_INTERVAL')
+    if has_app_context():
+        g.db_unreachable = True
+
+#TRUE WHEN A MISSING CONNECTION MEANS THE SERVER IS DOWN (NOT A BUSY POOL) - ONLY THEN MAY THE SNAPSHOT ANSWER
+def database_unreachable() -> bool:
+    return database_offline() or (has_app_context() and g.get('db_unreachable', False))
 
 #DATABASE CONNECTION
 def get_db_connection():
+    """Return the connection for the current request, checking one out of the pool on first use
+    (None when the database is unreachable or offline)"""
     try:
-        conn = psycopg2.connect(**Config.DB_CONFIG)
-        return conn
+        if has_app_context():
+            conn = g.get('db_conn')
+            if conn is None or conn.closed:
+                if database_offline():
+                    return None
+                pool = get_pool()
+                conn = PooledConnection(pool, pool.getconn())
+                g.db_conn = conn
+            return conn
+
+        if database_offline():
+            return None
+        pool = get_pool()
+        return PooledConnection(pool, pool.getconn())
+    except psycopg2.OperationalError as e:
+        print(f"Database connection error: {e}")
+        mark_database_unreachable()
+        return None
     except Exception as e:
         print(f"Database connection error: {e}")
         return None
+
+#RETURN REQUEST CONNECTION TO POOL ON TEARDOWN
+def release_db_connection(exception=None):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        conn.close()
+
+#CONNECTION FOR CACHE LOADERS - OUTSIDE A REQUEST IT IS RETURNED TO THE POOL ON EXIT
+@contextmanager
+def connection_scope(conn=None):
+    if conn is not None:
+        yield conn
+        return
+
+    conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        # REQUEST CONNECTIONS MAY STILL BE IN USE BY THE HANDLER, TEARDOWN RELEASES THEM
+        if conn is not None and not has_app_context():
+            conn.close()
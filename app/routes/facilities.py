@@ -1,7 +1,22 @@
-from flask import Blueprint, jsonify, request
+import time
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
 from psycopg2.extras import RealDictCursor
 from app.db import get_db_connection
 from app.utils.helpers import get_services_by_type, get_working_hours, get_contact_info
+from app.utils.catchment import get_facility_catchment
+from app.utils.clustering import get_cluster_index
+from app.utils.facility_index import get_facility_index
+from app.utils.facility_query import (
+    FACILITY_BY_ID_QUERY, FACILITY_TYPES_QUERY, OWNERSHIPS_QUERY,
+    decode_cursor, encode_cursor, facility_count, facility_filter_clause, facility_listing_query, parse_fields
+)
+from app.utils.facility_search import get_facility_search
+from app.utils.geo import haversine_km
+from app.utils.network_voronoi import nearest_by_travel_time
+from app.utils.offline import facility_by_id, facility_listing, facility_total, offline_registry
+from app.utils.response_cache import cached_response
+from app.utils.streaming import NDJSON_MIMETYPE, iter_batches, json_envelope_stream, ndjson_stream, open_stream_cursor
 
 facilities_bp = Blueprint('facilities', __name__)
 
@@ -13,96 +28,257 @@ def get_all_facilities():
         facility_type = request.args.get('facility_type', None)
         ownership = request.args.get('ownership', None)
         
-        #GET DATABASE CONNECTION
+        #FIELD PROJECTION (?fields=id,name,lat,lng) TRIMS BOTH THE SELECT LIST AND THE JSON
+        fields = parse_fields(request.args.get('fields', None))
+        
+        #KEYSET PAGINATION: ?page_size=N, THEN ?cursor=<next_cursor> FROM THE PREVIOUS PAGE
+        cursor = request.args.get('cursor', None)
+        page_size = request.args.get('page_size', None, type=int)
+        paginated = page_size is not None or cursor is not None
+        if paginated:
+            max_page_size = current_app.config['FACILITY_PAGE_MAX_SIZE']
+            if page_size is None:
+                page_size = current_app.config['FACILITY_PAGE_DEFAULT_SIZE']
+            if not 1 <= page_size <= max_page_size:
+                return jsonify({'success': False, 'error': f'page_size must be between 1 and {max_page_size}'}), 400
+        include_total = request.args.get('include_total', 'false').lower() == 'true'
+        
+        #STREAMED OUTPUT: ?stream=json (CHUNKED) OR ?stream=ndjson / Accept: application/x-ndjson
+        stream = request.args.get('stream', '').lower()
+        if not stream and request.accept_mimetypes.best == NDJSON_MIMETYPE:
+            stream = 'ndjson'
+        if stream not in ('', 'json', 'ndjson'):
+            return jsonify({'success': False, 'error': 'stream must be "json" or "ndjson"'}), 400
+        if stream and paginated:
+            return jsonify({'success': False, 'error': 'stream cannot be combined with page_size or cursor'}), 400
+        
+        #GET DATABASE CONNECTION (OR THE SNAPSHOT REGISTRY WHILE THE DATABASE IS UNREACHABLE)
         conn = get_db_connection()
-        if not conn:
+        registry = offline_registry() if not conn else None
+        if not conn and registry is None:
             return jsonify({'success': False, 'error': 'Database connection failed'}), 500
-            
-        cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        query = """
-            SELECT 
-                gid as id,
-                code,
-                name,
-                "common nam" as common_name,
-                ownership,
-                type as facility_type,
-                status,
-                zone,
-                district,
-                latitude as lat,
-                longitude as lng
-            FROM malawi_health_facilities
-            WHERE latitude IS NOT NULL 
-            AND longitude IS NOT NULL
-            AND name IS NOT NULL
-        """
-        
-        params = []
-        
-        if functional_only:
-            query += " AND status = 'Functional'"
-        if district:
-            query += " AND district = %s"
-            params.append(district)
-        if facility_type:
-            query += " AND type = %s"
-            params.append(facility_type)
-        if ownership:
-            query += " AND ownership = %s"
-            params.append(ownership)
-        
-        query += " ORDER BY name;"
-        
-        cur.execute(query, params)
-        facilities = cur.fetchall()
-        cur.close()
-        conn.close()
+        where, where_params = facility_filter_clause(functional_only, district, facility_type, ownership)
+        filters = {
+            'functional_only': functional_only,
+            'district': district,
+            'facility_type': facility_type,
+            'ownership': ownership
+        }
         
-        return jsonify({
+        if stream:
+            batch_size = current_app.config['FACILITY_STREAM_BATCH_SIZE']
+            if registry is not None:
+                rows = facility_listing(registry, fields, filters)
+                batches = (rows[i:i + batch_size] for i in range(0, len(rows), batch_size))
+            else:
+                #ROWS ARE ENCODED AS THEY ARRIVE FROM A SERVER-SIDE CURSOR; MEMORY STAYS AT ONE BATCH
+                query, params = facility_listing_query(fields, where, where_params)
+                cur = open_stream_cursor(conn, query, params, batch_size)
+                batches = iter_batches(conn, cur, batch_size)
+            dumps = current_app.json.dumps
+            if stream == 'ndjson':
+                return Response(stream_with_context(ndjson_stream(batches, dumps)), mimetype=NDJSON_MIMETYPE)
+            body = json_envelope_stream(batches, dumps, success=True, filters=filters)
+            return Response(stream_with_context(body), mimetype='application/json')
+        
+        after, limit, select = None, None, fields
+        if paginated:
+            #THE CURSOR NEEDS name AND id EVEN WHEN THEY ARE NOT REQUESTED; THEY ARE DROPPED FROM THE OUTPUT
+            after = decode_cursor(cursor) if cursor else None
+            select = fields + [f for f in ('name', 'id') if f not in fields]
+            limit = page_size + 1
+        
+        if registry is not None:
+            facilities = facility_listing(registry, select, filters, after=after, limit=limit)
+        else:
+            query, params = facility_listing_query(select, where, where_params, after=after, limit=limit)
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute(query, params)
+            facilities = cur.fetchall()
+            cur.close()
+        
+        result = {
             'success': True,
             'data': facilities,
             'count': len(facilities),
-            'filters': {
-                'functional_only': functional_only,
-                'district': district,
-                'facility_type': facility_type,
-                'ownership': ownership
+            'filters': filters
+        }
+        
+        if paginated:
+            has_more = len(facilities) > page_size
+            facilities = facilities[:page_size]
+            last = facilities[-1] if facilities else None
+            result.update({
+                'data': [{f: row[f] for f in fields} for row in facilities],
+                'count': len(facilities),
+                'page_size': page_size,
+                'has_more': has_more,
+                'next_cursor': encode_cursor(last['name'], last['id']) if has_more else None
+            })
+        
+        if include_total:
+            #COUNTED ONCE PER FILTER AND DATA VERSION, NOT ON EVERY PAGE
+            if registry is not None:
+                result['total'] = facility_total(registry, filters)
+            else:
+                result['total'] = facility_count(conn, where, where_params)
+        
+        if conn:
+            conn.close()
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error in get_all_facilities: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+#FACILITIES INSIDE A MAP VIEWPORT - CLUSTERS UP TO VIEWPORT_CLUSTER_MAX_ZOOM, SINGLE FACILITIES ABOVE IT
+@facilities_bp.route('/api/facilities/viewport', methods=['GET'])
+def get_facilities_in_viewport():
+    try:
+        bbox = request.args.get('bbox', None)
+        zoom = request.args.get('zoom', None, type=int)
+        if not bbox or zoom is None:
+            return jsonify({'success': False, 'error': 'bbox (west,south,east,north) and zoom are required'}), 400
+        
+        try:
+            west, south, east, north = (float(v) for v in bbox.split(','))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'bbox must be four numbers: west,south,east,north'}), 400
+        if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+            return jsonify({'success': False, 'error': 'bbox must satisfy west <= east and south <= north'}), 400
+        if not 0 <= zoom <= 24:
+            return jsonify({'success': False, 'error': 'zoom must be between 0 and 24'}), 400
+        
+        filters = {
+            'functional_only': request.args.get('functional_only', 'false').lower() == 'true',
+            'district': request.args.get('district', None),
+            'facility_type': request.args.get('facility_type', None),
+            'ownership': request.args.get('ownership', None)
+        }
+        fields = parse_fields(request.args.get('fields', None))
+        
+        #HIERARCHY IS BUILT ONCE PER DATA VERSION AND FILTER; THIS IS ONLY A CELL LOOKUP
+        cluster_index = get_cluster_index(**filters)
+        if cluster_index is None:
+            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
+        clusters, facilities = cluster_index.query(west, south, east, north, zoom)
+        
+        max_facilities = current_app.config['VIEWPORT_MAX_FACILITIES']
+        truncated = len(facilities) > max_facilities
+        
+        data = [
+            {
+                'kind': 'cluster',
+                'id': f'{zoom}/{cx}/{cy}',
+                'lat': round(cluster.lat, 6),
+                'lng': round(cluster.lng, 6),
+                'count': cluster.count,
+                'by_type': cluster.by_type,
+                'by_status': cluster.by_status,
+                'bounds': [cluster.west, cluster.south, cluster.east, cluster.north],
+                'expansion_zoom': cluster.expansion_zoom
             }
+            for (cx, cy), cluster in clusters
+        ]
+        data.extend(dict({f: facility[f] for f in fields}, kind='facility') for facility in facilities[:max_facilities])
+        
+        return jsonify({
+            'success': True,
+            'data': data,
+            'count': len(data),
+            'clustered': zoom <= cluster_index.max_zoom,
+            'zoom': zoom,
+            'truncated': truncated,
+            'filters': filters
         })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
-        print(f"Error in get_all_facilities: {e}")
+        print(f"Error in get_facilities_in_viewport: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+#AUTOCOMPLETE SEARCH ON FACILITY NAMES, OPTIONALLY BIASED TOWARDS THE USER'S LOCATION
+@facilities_bp.route('/api/search', methods=['GET'])
+def search_facilities():
+    try:
+        started = time.perf_counter()
+        query = request.args.get('q', '').strip()
+        limit = request.args.get('limit', 10, type=int)
+        lat = request.args.get('lat', None, type=float)
+        lng = request.args.get('lng', None, type=float)
+        
+        if not query:
+            return jsonify({'success': False, 'error': 'q cannot be empty'}), 400
+        if not 1 <= limit <= 50:
+            return jsonify({'success': False, 'error': 'limit must be between 1 and 50'}), 400
+        if (lat is None) != (lng is None):
+            return jsonify({'success': False, 'error': 'lat and lng must be given together'}), 400
+        
+        filters = {
+            'functional_only': request.args.get('functional_only', 'false').lower() == 'true',
+            'district': request.args.get('district', None),
+            'facility_type': request.args.get('facility_type', None),
+            'ownership': request.args.get('ownership', None)
+        }
+        fields = parse_fields(request.args.get('fields', None))
+        
+        #IN-MEMORY NAME INDEX (PREFIX, WORD PREFIX AND TRIGRAM MATCHES) OVER THE FACILITY SNAPSHOT
+        search = get_facility_search()
+        if search is None:
+            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
+        
+        results = search.search(
+            query, limit, lat, lng,
+            weight=current_app.config['SEARCH_PROXIMITY_WEIGHT'],
+            scale_km=current_app.config['SEARCH_PROXIMITY_SCALE_KM'],
+            **filters
+        )
+        
+        data = []
+        for score, text_score, distance, facility in results:
+            item = {f: facility[f] for f in fields}
+            item['score'] = round(score, 4)
+            item['text_score'] = round(text_score, 4)
+            if distance is not None:
+                item['distance_km'] = round(distance, 2)
+            data.append(item)
+        
+        return jsonify({
+            'success': True,
+            'data': data,
+            'count': len(data),
+            'query': query,
+            'location_bias': lat is not None,
+            'took_ms': round((time.perf_counter() - started) * 1000, 3)
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error in search_facilities: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 #GET DETAILED INFO ABOUT SPECIFIC FACILITY
 @facilities_bp.route('/api/facility/<int:facility_id>', methods=['GET'])
 def get_facility_details(facility_id):
     try:
-        #GET DATABASE CONNECTION
+        #GET DATABASE CONNECTION (OR THE SNAPSHOT REGISTRY WHILE THE DATABASE IS UNREACHABLE)
         conn = get_db_connection()
-        if not conn:
+        registry = offline_registry() if not conn else None
+        if not conn and registry is None:
             return jsonify({'success': False, 'error': 'Database connection failed'}), 500
+        
+        if registry is not None:
+            facility = facility_by_id(registry, facility_id)
+        else:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute(FACILITY_BY_ID_QUERY, (facility_id,))
+            facility = cur.fetchone()
             
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("""
-            SELECT 
-                gid as id,
-                code,
-                name,
-                "common nam" as common_name,
-                ownership,
-                type as facility_type,
-                status,
-                zone,
-                district,
-                latitude as lat,
-                longitude as lng
-            FROM malawi_health_facilities
-            WHERE gid = %s;
-        """, (facility_id,))
-        
-        facility = cur.fetchone()
+            #CLOSE DATABASE CONNECTION
+            cur.close()
+            conn.close()
         
         if facility:
             # MOCK SERVICE
@@ -110,10 +286,6 @@ def get_facility_details(facility_id):
             facility['working_hours'] = get_working_hours(facility['facility_type'])
             facility['contact'] = get_contact_info(facility['district'])
         
-        #CLOSE DATABASE CONNECTION
-        cur.close()
-        conn.close()
-        
         #RETURN FACILITY DETAILS
         if facility:
             return jsonify({'success': True, 'data': facility})
@@ -124,8 +296,55 @@ def get_facility_details(facility_id):
         print(f"Error in get_facility_details: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+#SERVICE AREA (ISOCHRONES) - WHERE CAN REACH THE FACILITY BY ROAD WITHIN EACH TIME BAND
+@facilities_bp.route('/api/facility/<int:facility_id>/catchment', methods=['GET'])
+def get_facility_catchment_area(facility_id):
+    try:
+        bands = sorted({int(b) for b in request.args.get('bands', '30,60,90').split(',') if b.strip()})
+        max_minutes = current_app.config['CATCHMENT_MAX_MINUTES']
+        
+        if not bands or len(bands) > 6 or bands[0] < 1 or bands[-1] > max_minutes:
+            return jsonify({'success': False, 'error': f'bands must be 1-6 values between 1 and {max_minutes} minutes'}), 400
+        
+        #GET IN-MEMORY FACILITY INDEX (LOADED AT STARTUP)
+        index = get_facility_index()
+        if index is None:
+            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
+        
+        facility = index.by_id.get(facility_id)
+        if not facility:
+            return jsonify({'success': False, 'error': 'Facility not found'}), 404
+        
+        #ONE BOUNDED ROAD SEARCH FOR THE UNCACHED BANDS
+        features = get_facility_catchment(facility_id, bands)
+        if features is None:
+            return jsonify({'success': False, 'error': 'Road network not available'}), 500
+        if not features:
+            return jsonify({'success': False, 'error': 'Facility is not connected to the road network'}), 404
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'facility': {
+                    'id': facility['id'],
+                    'name': facility['name'],
+                    'lat': facility['lat'],
+                    'lng': facility['lng']
+                },
+                'type': 'FeatureCollection',
+                'features': features
+            }
+        })
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f'Invalid bands: {str(e)}'}), 400
+    except Exception as e:
+        print(f"Error in get_facility_catchment_area: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 #GET FACILITY TYPES
 @facilities_bp.route('/api/facility-types', methods=['GET'])
+@cached_response
 def get_facility_types():
     try:
         #GET DATABASE CONNECTION
@@ -135,15 +354,7 @@ def get_facility_types():
         
         #GET FACILITY TYPES
         cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("""
-            SELECT DISTINCT type as facility_type, COUNT(*) as count
-            FROM malawi_health_facilities
-            WHERE type IS NOT NULL 
-            AND latitude IS NOT NULL 
-            AND longitude IS NOT NULL
-            GROUP BY type
-            ORDER BY type;
-        """)
+        cur.execute(FACILITY_TYPES_QUERY)
         
         types = cur.fetchall()
         
@@ -159,6 +370,7 @@ def get_facility_types():
 
 #GET FACILITY OWNERSHIPS
 @facilities_bp.route('/api/ownerships', methods=['GET'])
+@cached_response
 def get_ownerships():
     try:
         #GET DATABASE CONNECTION
@@ -168,15 +380,7 @@ def get_ownerships():
 
         #GET FACILITY OWNERSHIPS    
         cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("""
-            SELECT DISTINCT ownership, COUNT(*) as count
-            FROM malawi_health_facilities
-            WHERE ownership IS NOT NULL 
-            AND latitude IS NOT NULL 
-            AND longitude IS NOT NULL
-            GROUP BY ownership
-            ORDER BY ownership;
-        """)
+        cur.execute(OWNERSHIPS_QUERY)
         
         ownerships = cur.fetchall()
 
@@ -206,76 +410,52 @@ def find_nearest_facilities():
         district = data.get('district', None)
         facility_type = data.get('facility_type', None)
         ownership = data.get('ownership', None)
+        by = data.get('by', 'distance')
         
         if limit < 1 or limit > 50:
             limit = 5
         
-        #GET DATABASE CONNECTION
-        conn = get_db_connection()
-        if not conn:
+        if by not in ('distance', 'travel_time'):
+            return jsonify({'success': False, 'error': 'Invalid "by". Use "distance" or "travel_time"'}), 400
+        
+        #GET IN-MEMORY FACILITY INDEX (LOADED AT STARTUP)
+        index = get_facility_index()
+        if index is None:
             return jsonify({'success': False, 'error': 'Database connection failed'}), 500
-            
-        cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        query = """
-            SELECT 
-                gid as id,
-                code,
-                name,
-                "common nam" as common_name,
-                ownership,
-                type as facility_type,
-                status,
-                zone,
-                district,
-                latitude as lat,
-                longitude as lng,
-                ROUND(
-                    CAST(
-                        ST_Distance(
-                            ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography,
-                            ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography
-                        ) / 1000 AS numeric
-                    ), 2
-                ) as distance_km
-            FROM malawi_health_facilities
-            WHERE latitude IS NOT NULL 
-            AND longitude IS NOT NULL
-            AND name IS NOT NULL
-        """
-        
-        params = [lng, lat]
-        
-        if functional_only:
-            query += " AND status = 'Functional'"
-        if district:
-            query += " AND district = %s"
-            params.append(district)
-        if facility_type:
-            query += " AND type = %s"
-            params.append(facility_type)
-        if ownership:
-            query += " AND ownership = %s"
-            params.append(ownership)
-        
-        query += """
-            ORDER BY ST_SetSRID(ST_MakePoint(longitude, latitude), 4326) <-> 
-                     ST_SetSRID(ST_MakePoint(%s, %s), 4326)
-            LIMIT %s;
-        """
-        
-        params.extend([lng, lat, limit])
-        cur.execute(query, params)
-        facilities = cur.fetchall()
-        
-        # ADD WORKING HOURS
-        for facility in facilities:
-            facility['services'] = get_services_by_type(facility['facility_type'])
-            facility['working_hours'] = get_working_hours(facility['facility_type'])
+        filters = {
+            'functional_only': functional_only,
+            'district': district,
+            'facility_type': facility_type,
+            'ownership': ownership
+        }
         
-        #CLOSE DATABASE CONNECTION
-        cur.close()
-        conn.close()
+        facilities = []
+        if by == 'travel_time':
+            #PRECOMPUTED NETWORK VORONOI (OR AN ON-DEMAND ROAD SEARCH FOR OTHER FILTERS)
+            nearest = nearest_by_travel_time(lat, lng, limit, **filters)
+            if nearest is None:
+                return jsonify({'success': False, 'error': 'Road network not available'}), 500
+            
+            for minutes, road_km, indexed in nearest:
+                facility = dict(indexed)
+                facility['distance_km'] = round(haversine_km(lat, lng, float(facility['lat']), float(facility['lng'])), 2)
+                facility['road_distance_km'] = round(road_km, 2)
+                facility['travel_time_minutes'] = round(minutes, 1)
+                facility['services'] = get_services_by_type(facility['facility_type'])
+                facility['working_hours'] = get_working_hours(facility['facility_type'])
+                facilities.append(facility)
+        else:
+            #K-NEAREST SEARCH ON THE GRID, RANKED BY HAVERSINE DISTANCE
+            nearest = index.nearest(lat, lng, limit, **filters)
+            
+            # ADD DISTANCE AND WORKING HOURS
+            for distance_km, indexed in nearest:
+                facility = dict(indexed)
+                facility['distance_km'] = round(distance_km, 2)
+                facility['services'] = get_services_by_type(facility['facility_type'])
+                facility['working_hours'] = get_working_hours(facility['facility_type'])
+                facilities.append(facility)
         
         #RETURN FACILITIES (JSON RESPONSE)
         return jsonify({
@@ -283,12 +463,8 @@ def find_nearest_facilities():
             'data': facilities,
             'count': len(facilities),
             'query_point': {'lat': lat, 'lng': lng},
-            'filters': {
-                'functional_only': functional_only,
-                'district': district,
-                'facility_type': facility_type,
-                'ownership': ownership
-            }
+            'sorted_by': by,
+            'filters': filters
         })
     except Exception as e:
         print(f"Error in find_nearest_facilities: {e}")
@@ -1,4 +1,21 @@
-from flask import Blueprint, jsonify
+import hmac
+
+from flask import Blueprint, current_app, jsonify, request
+from app.db import get_pool
+from app.utils.catchment import catchment_cache_stats
+from app.utils.clustering import cluster_cache_stats
+from app.utils.data_version import current_data_version, reload_data
+from app.utils.contraction import contraction_stats
+from app.utils.facility_query import facility_count_stats
+from app.utils.graph_search import search_counters
+from app.utils.offline import offline_stats
+from app.utils.node_snapper import snapping_stats
+from app.utils.response_cache import response_cache_stats
+from app.utils.route_cache import route_cache_stats
+from app.utils.route_executor import route_executor_stats
+from app.utils.routing_workers import routing_worker_stats
+from app.utils.snapshot import snapshot_stats
+from app.utils.vector_tiles import tile_cache_stats
 
 main_bp = Blueprint('main', __name__)
 
@@ -18,15 +35,24 @@ def home():
         ],
         'endpoints': {
             'GET /api/facilities': 'Get all facilities with filters',
+            'GET /api/facilities/viewport': 'Facilities and clusters inside a map bbox at a zoom level',
+            'GET /api/search': 'Autocomplete facility names, nearest matches first when lat/lng are given',
             'GET /api/districts': 'Get list of all districts',
             'GET /api/facility-types': 'Get list of all facility types',
             'GET /api/ownerships': 'Get list of ownership types',
             'POST /api/nearest': 'Find nearest facilities',
             'POST /api/geocode': 'Convert address to coordinates',
+            'POST /api/geocode/batch': 'Geocode a list of locations',
             'POST /api/route': 'Get optimized route to facility',
+            'POST /api/route/matrix': 'Travel distance/time matrix between many points',
             'GET /api/facility/<id>': 'Get facility details with services',
+            'GET /api/facility/<id>/catchment': 'Areas that reach the facility by road within 30/60/90 minutes',
             'GET /api/stats': 'Get statistics',
-            'GET /health': 'Health check'
+            'GET /tiles/facilities/<z>/<x>/<y>.mvt': 'Facility vector tiles for web maps',
+            'GET /api/stats/<breakdown>': 'Full type, district, ownership, zone or district_type breakdown',
+            'GET /health': 'Health check',
+            'GET /api/metrics': 'Runtime metrics (connection pool, routing search, node snapping) - admin token',
+            'POST /api/admin/reload': 'Reload cached facility data after the tables change'
         }
     })
 
@@ -38,3 +64,51 @@ def health_check():
         'message': 'Health Facility Finder API is running',
         'data_source': 'Malawi Ministry of Health Registry 2023'
     })
+
+#X-Admin-Token CHECK SHARED BY THE ADMIN AND METRICS ENDPOINTS - None WHEN THE REQUEST MAY PROCEED
+def admin_token_error():
+    #FAILS CLOSED - NO ADMIN_TOKEN CONFIGURED MEANS NO ACCESS OVER HTTP
+    token = current_app.config.get('ADMIN_TOKEN')
+    if not token:
+        return jsonify({'success': False, 'error': 'Admin endpoints are disabled (ADMIN_TOKEN is not set)'}), 403
+    supplied = request.headers.get('X-Admin-Token', '')
+    if not hmac.compare_digest(supplied.encode('utf-8'), token.encode('utf-8')):
+        return jsonify({'success': False, 'error': 'Invalid admin token'}), 403
+    return None
+
+#RUNTIME METRICS FOR SCRAPING (POOL SIZES, CACHE KEYS AND TIMINGS ARE NOT FOR THE PUBLIC)
+@main_bp.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    denied = admin_token_error()
+    if denied is not None:
+        return denied
+    async_pool = current_app.extensions.get('async_db_pool')
+    return jsonify({
+        'success': True,
+        'db_pool': get_pool().stats(),
+        'async_db_pool': async_pool.stats() if async_pool is not None else None,
+        'routing_search': search_counters(),
+        'routing_workers': routing_worker_stats(),
+        'contraction_hierarchy': contraction_stats(),
+        'node_snapping': snapping_stats(),
+        'route_cache': route_cache_stats(),
+        'route_executor': route_executor_stats(),
+        'catchment_cache': catchment_cache_stats(),
+        'response_cache': response_cache_stats(),
+        'facility_counts': facility_count_stats(),
+        'tile_cache': tile_cache_stats(),
+        'snapshot': snapshot_stats(),
+        'offline': offline_stats(),
+        'viewport_clusters': cluster_cache_stats(),
+        'data_version': current_data_version()
+    })
+
+#RELOAD IN-MEMORY CACHES AFTER THE FACILITY TABLE CHANGES
+@main_bp.route('/api/admin/reload', methods=['POST'])
+def reload_cached_data():
+    denied = admin_token_error()
+    if denied is not None:
+        return denied
+    
+    version = reload_data()
+    return jsonify({'success': True, 'data_version': version})
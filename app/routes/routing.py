@@ -1,11 +1,20 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 from psycopg2.extras import RealDictCursor
-from app.db import get_db_connection
+from app.db import connection_scope, get_db_connection
+from app.utils.facility_index import get_facility_index
+from app.utils.facility_query import FACILITY_BY_ID_QUERY
+from app.utils.graph_search import MATRIX_METRICS, SEARCH_ALGORITHMS
+from app.utils.offline import facility_by_id, offline_registry
 from app.utils.routing_helpers import (
     find_nearest_road_node,
+    find_nearest_road_nodes,
+    find_facility_road_node,
     calculate_route_with_details,
+    calculate_travel_matrix,
     estimate_travel_time
 )
+from app.utils.route_optimizer import optimize_order
+from app.utils.route_executor import run_routes
 
 routing_bp = Blueprint('routing', __name__)
 
@@ -30,46 +39,37 @@ def calculate_single_route():
         algorithm = data.get('algorithm', 'dijkstra')
         
         # VALIDATE ALGORITHM
-        if algorithm not in ['dijkstra', 'astar']:
-            return jsonify({'success': False, 'error': 'Invalid algorithm. Use "dijkstra" or "astar"'}), 400
+        if algorithm not in SEARCH_ALGORITHMS:
+            return jsonify({'success': False, 'error': 'Invalid algorithm. Use "dijkstra", "astar", "bidirectional" or "ch"'}), 400
         
-        # GET DATABASE CONNECTION
+        # GET DATABASE CONNECTION (OR THE SNAPSHOT REGISTRY AND ROAD GRAPH WHILE THE DATABASE IS UNREACHABLE)
         conn = get_db_connection()
-        if not conn:
+        registry = offline_registry() if not conn else None
+        if not conn and registry is None:
             return jsonify({'success': False, 'error': 'Database connection failed'}), 500
         
         #GET FACILITY DETAILS
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("""
-            SELECT 
-                gid as id,
-                code,
-                name,
-                "common nam" as common_name,
-                ownership,
-                type as facility_type,
-                status,
-                zone,
-                district,
-                latitude as lat,
-                longitude as lng
-            FROM malawi_health_facilities
-            WHERE gid = %s;
-        """, (facility_id,))
-        
-        facility = cur.fetchone()
-        cur.close()
+        if registry is not None:
+            facility = facility_by_id(registry, facility_id)
+        else:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute(FACILITY_BY_ID_QUERY, (facility_id,))
+            
+            facility = cur.fetchone()
+            cur.close()
         
         if not facility:
-            conn.close()
+            if conn:
+                conn.close()
             return jsonify({'success': False, 'error': 'Facility not found'}), 404
         
         # QUICKLY CHECK ROAD NETWORK AVAILABILITY NEAR POINTS (give better error messages)
         start_node = find_nearest_road_node(conn, start_lat, start_lng)
-        end_node = find_nearest_road_node(conn, facility['lat'], facility['lng'])
+        end_node = find_facility_road_node(conn, facility)
 
         if not start_node or not end_node:
-            conn.close()
+            if conn:
+                conn.close()
             return jsonify({
                 'success': False,
                 'error': 'Could not calculate route. No road network path found between locations.',
@@ -79,17 +79,20 @@ def calculate_single_route():
                 }
             }), 200
 
-        # CALCULATE ROUTE
+        # CALCULATE ROUTE (REUSING THE NODES SNAPPED ABOVE)
         route_info = calculate_route_with_details(
             conn,
             start_lat,
             start_lng,
             facility['lat'],
             facility['lng'],
-            algorithm
+            algorithm,
+            start_node=start_node,
+            end_node=end_node
         )
         
-        conn.close()
+        if conn:
+            conn.close()
         
         if not route_info:
             return jsonify({
@@ -111,6 +114,16 @@ def calculate_single_route():
         print(f"Error in calculate_single_route: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+#ROUTE DETAILS AS A run_routes TASK - THE WORKER CHECKS OUT ITS OWN POOLED CONNECTION
+def route_details_task(start_lat, start_lng, end_lat, end_lng, algorithm, start_node, end_node):
+    def task():
+        with connection_scope() as conn:
+            if conn is None:
+                raise RuntimeError('Database connection failed')
+            return calculate_route_with_details(conn, start_lat, start_lng, end_lat, end_lng, algorithm,
+                                                start_node=start_node, end_node=end_node)
+    return task
+
 #MULTIPLE ROUTES FOR FACILITIES
 @routing_bp.route('/api/routes/multiple', methods=['POST'])
 def calculate_multiple_routes():
@@ -135,8 +148,11 @@ def calculate_multiple_routes():
         if not isinstance(facility_ids, list) or len(facility_ids) == 0:
             return jsonify({'success': False, 'error': 'facility_ids must be a non-empty array'}), 400
         
-        # LIMIT NUMBER OF FACILITIES
-        facility_ids = facility_ids[:limit]
+        if algorithm not in SEARCH_ALGORITHMS:
+            return jsonify({'success': False, 'error': 'Invalid algorithm. Use "dijkstra", "astar", "bidirectional" or "ch"'}), 400
+        
+        # LIMIT NUMBER OF FACILITIES RANKED BY THE MATRIX
+        facility_ids = facility_ids[:current_app.config['ROUTING_MATRIX_MAX_SIZE']]
         
         # GET DATABASE CONNECTION
         conn = get_db_connection()
@@ -169,33 +185,53 @@ def calculate_multiple_routes():
             conn.close()
             return jsonify({'success': False, 'error': 'No facilities found'}), 404
         
-        # CALCULATE ROUTES TO ALL FACILITIES
+        # SNAP THE START ONCE, FACILITY NODES ARE PRE-SNAPPED
+        start_node = find_nearest_road_node(conn, start_lat, start_lng)
+        end_nodes = [find_facility_road_node(conn, facility) for facility in facilities]
+        
+        # ONE-TO-MANY SEARCH OVER ARC MINUTES RANKS EVERY FACILITY BY ITS FASTEST TRAVEL TIME
+        matrix = calculate_travel_matrix(conn, [start_node], end_nodes, metric='time')
+        if not matrix:
+            conn.close()
+            return jsonify({'success': False, 'error': 'Road network not available'}), 500
+        
+        times = matrix['times_minutes'][0]
+        ranked = sorted(
+            (i for i in range(len(facilities)) if times[i] is not None),
+            key=lambda i: times[i]
+        )[:limit]
+        
+        # HAND THE CONNECTION BACK BEFORE THE WORKERS CHECK OUT THEIR OWN
+        conn.close()
+        
+        # FULL ROUTE (GEOMETRY + DIRECTIONS) ONLY FOR THE FACILITIES RETURNED, COMPUTED IN PARALLEL
+        outcomes = run_routes([
+            route_details_task(start_lat, start_lng, facilities[i]['lat'], facilities[i]['lng'],
+                               algorithm, start_node, end_nodes[i])
+            for i in ranked
+        ])
+        
+        # RESULTS KEEP THE MATRIX ORDER - THE SAME FASTEST-PATH MINUTES THAT PICKED THEM ARE REPORTED AND SORTED ON
         results = []
-        for facility in facilities:
-            route_info = calculate_route_with_details(
-                conn,
-                start_lat,
-                start_lng,
-                facility['lat'],
-                facility['lng'],
-                algorithm
-            )
-            
+        failed = []
+        for i, (route_info, error) in zip(ranked, outcomes):
             if route_info:
                 results.append({
-                    'facility': facility,
+                    'facility': facilities[i],
+                    'travel_time_minutes': times[i],
                     'route': route_info
                 })
-        
-        conn.close()
-        
-        # SORT BY TRAVEL TIME
-        results.sort(key=lambda x: x['route']['estimated_time_minutes'])
+            else:
+                failed.append({
+                    'facility_id': facilities[i]['id'],
+                    'error': error or 'No road network path found'
+                })
         
         return jsonify({
             'success': True,
             'data': results,
             'count': len(results),
+            'failed': failed,
             'sorted_by': 'travel_time'
         })
         
@@ -205,6 +241,95 @@ def calculate_multiple_routes():
         print(f"Error in calculate_multiple_routes: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+#RESOLVE MATRIX POINTS ({"lat", "lng"} OR {"facility_id"}) TO COORDINATES AND ROAD NODES
+def resolve_matrix_points(conn, points):
+    index = get_facility_index(conn)
+    resolved = []
+    for point in points:
+        if not isinstance(point, dict):
+            raise ValueError('Each point must be an object with lat/lng or facility_id')
+        if 'facility_id' in point:
+            facility = index.by_id.get(int(point['facility_id'])) if index else None
+            if not facility:
+                raise LookupError(f"Facility {point['facility_id']} not found")
+            resolved.append({
+                'facility_id': facility['id'],
+                'lat': float(facility['lat']),
+                'lng': float(facility['lng']),
+                'node': find_facility_road_node(conn, facility)
+            })
+        else:
+            resolved.append({'lat': float(point['lat']), 'lng': float(point['lng']), 'node': None})
+    
+    # SNAP ALL COORDINATE POINTS IN ONE BATCH
+    loose = [p for p in resolved if 'facility_id' not in p]
+    for p, node in zip(loose, find_nearest_road_nodes(conn, [(p['lat'], p['lng']) for p in loose])):
+        p['node'] = node
+    return resolved
+
+#TRAVEL DISTANCE / TIME MATRIX (ONE-TO-MANY AND MANY-TO-MANY)
+@routing_bp.route('/api/route/matrix', methods=['POST'])
+def calculate_route_matrix():
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({'success': False, 'error': 'No data provided'}), 400
+        
+        origins = data.get('origins')
+        destinations = data.get('destinations', origins)
+        metric = data.get('metric', 'distance')
+        max_size = current_app.config['ROUTING_MATRIX_MAX_SIZE']
+        
+        if metric not in MATRIX_METRICS:
+            return jsonify({'success': False, 'error': f"metric must be one of {', '.join(MATRIX_METRICS)}"}), 400
+        
+        for name, points in (('origins', origins), ('destinations', destinations)):
+            if not isinstance(points, list) or len(points) == 0:
+                return jsonify({'success': False, 'error': f'{name} must be a non-empty array'}), 400
+            if len(points) > max_size:
+                return jsonify({'success': False, 'error': f'Maximum {max_size} {name} allowed'}), 400
+        
+        # GET DATABASE CONNECTION
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
+        
+        try:
+            origin_points = resolve_matrix_points(conn, origins)
+            destination_points = resolve_matrix_points(conn, destinations)
+        except LookupError as e:
+            conn.close()
+            return jsonify({'success': False, 'error': str(e)}), 404
+        
+        matrix = calculate_travel_matrix(
+            conn,
+            [p['node'] for p in origin_points],
+            [p['node'] for p in destination_points],
+            metric
+        )
+        conn.close()
+        
+        if not matrix:
+            return jsonify({'success': False, 'error': 'Road network not available'}), 500
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'origins': origin_points,
+                'destinations': destination_points,
+                'metric': matrix['metric'],
+                'distances_km': matrix['distances_km'],
+                'times_minutes': matrix['times_minutes']
+            }
+        })
+        
+    except (ValueError, TypeError, KeyError) as e:
+        return jsonify({'success': False, 'error': f'Invalid data format: {str(e)}'}), 400
+    except Exception as e:
+        print(f"Error in calculate_route_matrix: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 #ROUTE OPTMISATION
 @routing_bp.route('/api/route/optimize', methods=['POST'])
 def optimize_multi_facility_route():
@@ -228,8 +353,9 @@ def optimize_multi_facility_route():
         if not isinstance(facility_ids, list) or len(facility_ids) < 2:
             return jsonify({'success': False, 'error': 'facility_ids must contain at least 2 facilities'}), 400
         
-        if len(facility_ids) > 10:
-            return jsonify({'success': False, 'error': 'Maximum 10 facilities allowed for route optimization'}), 400
+        max_facilities = current_app.config['ROUTING_OPTIMIZE_MAX_FACILITIES']
+        if len(facility_ids) > max_facilities:
+            return jsonify({'success': False, 'error': f'Maximum {max_facilities} facilities allowed for route optimization'}), 400
         
         #GET DATABASE CONNECTION
         conn = get_db_connection()
@@ -269,73 +395,96 @@ def optimize_multi_facility_route():
             conn.close()
             return jsonify({'success': False, 'error': 'Could not find road network near start location'}), 404
         
-        # BUILD DISTANCE MATRIX BETWEEN ALL POINTS (START + FACILITIES)
-        # FOR SIMPLICITY, WE'LL USE A GREEDY NEAREST-NEIGHBOR APPROACH
-        unvisited = list(facilities)
-        current_lat, current_lng = start_lat, start_lng
+        # BUILD THE DISTANCE MATRIX BETWEEN ALL POINTS (START + FACILITIES) ONCE
+        nodes = [start_node] + [find_facility_road_node(conn, f) for f in facilities]
+        matrix = calculate_travel_matrix(conn, nodes, nodes)
+        
+        if not matrix:
+            conn.close()
+            return jsonify({'success': False, 'error': 'Road network not available'}), 500
+        
+        # FACILITIES THE START CANNOT REACH ARE LEFT OUT OF THE TRIP
+        distances = matrix['distances_km']
+        reachable = [i for i in range(1, len(nodes)) if distances[0][i] is not None]
+        unreachable = [facilities[i - 1]['id'] for i in range(1, len(nodes)) if distances[0][i] is None]
+        points = [0] + reachable
+        
+        order, _, method = optimize_order(
+            [[distances[i][j] for j in points] for i in points],
+            return_to_start,
+            current_app.config['ROUTING_OPTIMIZE_EXACT_MAX']
+        )
+        stops = [points[k] for k in order]
+        
+        # BUILD GEOMETRY AND DIRECTIONS FOR THE CHOSEN LEGS ONLY
+        targets = [(i, facilities[i - 1]) for i in stops]
+        if return_to_start and stops:
+            targets.append((0, {'lat': start_lat, 'lng': start_lng}))
+        
+        # EVERY LEG STARTS WHERE THE PREVIOUS ONE ENDED, SO ALL OF THEM ARE KNOWN UP FRONT
+        legs = []
+        current_lat, current_lng, current = start_lat, start_lng, 0
+        for i, target in targets:
+            legs.append((current_lat, current_lng, current, i, target))
+            current_lat, current_lng, current = target['lat'], target['lng'], i
+        
+        conn.close()
+        
+        # LEGS BETWEEN STOPS SNAPPED TO THE SAME ROAD NODE NEED NO SEARCH; THE REST RUN IN PARALLEL
+        searched = [k for k, (_, _, current, i, _) in enumerate(legs) if nodes[i] != nodes[current]]
+        outcomes = dict(zip(searched, run_routes([
+            route_details_task(legs[k][0], legs[k][1], legs[k][4]['lat'], legs[k][4]['lng'],
+                               'dijkstra', nodes[legs[k][2]], nodes[legs[k][3]])
+            for k in searched
+        ])))
+        
+        # THE TOUR STOPS AT THE FIRST FAILED LEG - LATER LEGS START FROM A STOP THAT WAS NEVER REACHED
         optimized_order = []
         routes = []
+        failed_legs = []
+        unvisited = []
         total_distance = 0
         total_time = 0
         
-        # GREEDY NEAREST NEIGBOUR ALGORITHM
-        while unvisited:
-            nearest_facility = None
-            nearest_route = None
-            min_distance = float('inf')
-            
-            for facility in unvisited:
-                route_info = calculate_route_with_details(
-                    conn,
-                    current_lat,
-                    current_lng,
-                    facility['lat'],
-                    facility['lng'],
-                    'dijkstra'
-                )
-                
-                if route_info and route_info['distance_km'] < min_distance:
-                    min_distance = route_info['distance_km']
-                    nearest_facility = facility
-                    nearest_route = route_info
+        for k, (current_lat, current_lng, current, i, target) in enumerate(legs):
+            if failed_legs:
+                if i:
+                    unvisited.append(target['id'])
+                continue
             
-            if nearest_facility:
-                optimized_order.append(nearest_facility['id'])
-                routes.append({
-                    'from': {'lat': current_lat, 'lng': current_lng},
-                    'to': nearest_facility,
-                    'route': nearest_route
-                })
-                total_distance += nearest_route['distance_km']
-                total_time += nearest_route['estimated_time_minutes']
-                
-                current_lat = nearest_facility['lat']
-                current_lng = nearest_facility['lng']
-                unvisited.remove(nearest_facility)
+            if k in outcomes:
+                route_info, error = outcomes[k]
             else:
-                break
-        
-        # RETURN TO START IF REQUESTED
-        if return_to_start and optimized_order:
-            return_route = calculate_route_with_details(
-                conn,
-                current_lat,
-                current_lng,
-                start_lat,
-                start_lng,
-                'dijkstra'
-            )
+                # STOPS SNAPPED TO THE SAME ROAD NODE - NOTHING TO DRIVE
+                route_info, error = {
+                    'geometry': None,
+                    'distance_km': 0.0,
+                    'estimated_time_minutes': 0.0,
+                    'directions': [],
+                    'algorithm': 'dijkstra',
+                    'start_node': nodes[current],
+                    'end_node': nodes[i]
+                }, None
             
-            if return_route:
-                routes.append({
+            if not route_info:
+                failed_legs.append({
                     'from': {'lat': current_lat, 'lng': current_lng},
-                    'to': {'lat': start_lat, 'lng': start_lng},
-                    'route': return_route
+                    'to': target,
+                    'error': error or 'No road network path found'
                 })
-                total_distance += return_route['distance_km']
-                total_time += return_route['estimated_time_minutes']
-        
-        conn.close()
+                if i:
+                    unvisited.append(target['id'])
+                continue
+            
+            if i:
+                optimized_order.append(target['id'])
+            routes.append({
+                'from': {'lat': current_lat, 'lng': current_lng},
+                'to': target,
+                'route': route_info
+            })
+            total_distance += route_info['distance_km']
+            total_time += route_info['estimated_time_minutes']
         
         #RETURN JSON RESPONSE
         return jsonify({
@@ -345,7 +494,12 @@ def optimize_multi_facility_route():
                 'total_distance_km': round(total_distance, 2),
                 'total_time_minutes': round(total_time, 1),
                 'routes': routes,
-                'return_to_start': return_to_start
+                'return_to_start': return_to_start,
+                'method': method,
+                'unreachable_facility_ids': unreachable,
+                'partial': bool(failed_legs),
+                'unvisited_facility_ids': unvisited,
+                'failed_legs': failed_legs
             }
         })
         
@@ -1,85 +1,52 @@
-from flask import Blueprint, jsonify
-from psycopg2.extras import RealDictCursor
-from app.db import get_db_connection
+from flask import Blueprint, jsonify, request
+from app.utils.response_cache import cached_response
+from app.utils.stats_summary import DIMENSIONS, get_stats_summary
 
 stats_bp = Blueprint('stats', __name__)
 
 @stats_bp.route('/api/stats', methods=['GET'])
+@cached_response
 def get_statistics():
     try:
-        conn = get_db_connection()
-        if not conn:
+        #PRECOMPUTED SUMMARY (ONE GROUPING SETS SCAN PER DATA VERSION)
+        summary = get_stats_summary()
+        if summary is None:
             return jsonify({'success': False, 'error': 'Database connection failed'}), 500
-            
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        #EXECUTE QUERY
-        cur.execute("""
-            SELECT 
-                COUNT(*) as total_facilities,
-                COUNT(CASE WHEN status = 'Functional' THEN 1 END) as functional_facilities,
-                COUNT(CASE WHEN status = 'Non-functional' THEN 1 END) as non_functional_facilities,
-                COUNT(DISTINCT district) as total_districts,
-                COUNT(DISTINCT type) as total_types,
-                COUNT(DISTINCT ownership) as ownership_types
-            FROM malawi_health_facilities
-            WHERE latitude IS NOT NULL AND longitude IS NOT NULL;
-        """)
-        
-        stats = cur.fetchone()
-        
-        #EXECUTE QUERY
-        cur.execute("""
-            SELECT 
-                type as facility_type,
-                COUNT(*) as total,
-                COUNT(CASE WHEN status = 'Functional' THEN 1 END) as functional
-            FROM malawi_health_facilities
-            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
-            GROUP BY type
-            ORDER BY total DESC;
-        """)
-        by_type = cur.fetchall()
-        
-        #EXECUTE QUERY
-        cur.execute("""
-            SELECT 
-                district,
-                COUNT(*) as total,
-                COUNT(CASE WHEN status = 'Functional' THEN 1 END) as functional
-            FROM malawi_health_facilities
-            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
-            GROUP BY district
-            ORDER BY total DESC
-            LIMIT 10;
-        """)
-        by_district = cur.fetchall()
-        
-        #EXECUTE QUERY
-        cur.execute("""
-            SELECT 
-                ownership,
-                COUNT(*) as total,
-                COUNT(CASE WHEN status = 'Functional' THEN 1 END) as functional
-            FROM malawi_health_facilities
-            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
-            GROUP BY ownership
-            ORDER BY total DESC;
-        """)
-        by_ownership = cur.fetchall()
-        
-        #CLOSE CURSOR AND CONNECTION
-        cur.close()
-        conn.close()
-        
+
         #RETURN JSON RESPONSE
         return jsonify({
             'success': True,
-            'stats': stats,
-            'by_type': by_type,
-            'by_district': by_district,
-            'by_ownership': by_ownership
+            'stats': summary.totals,
+            'by_type': summary.breakdown('type'),
+            'by_district': summary.breakdown('district', limit=10),
+            'by_ownership': summary.breakdown('ownership'),
+            'by_zone': summary.breakdown('zone')
         })
     except Exception as e:
         print(f"Error in get_statistics: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
+
+#A SINGLE BREAKDOWN FROM THE SAME SUMMARY (type, district, ownership, zone OR district_type)
+@stats_bp.route('/api/stats/<dimension>', methods=['GET'])
+@cached_response
+def get_statistics_breakdown(dimension):
+    try:
+        if dimension not in DIMENSIONS:
+            return jsonify({'success': False, 'error': f'Unknown breakdown. Use one of: {", ".join(DIMENSIONS)}'}), 404
+
+        summary = get_stats_summary()
+        if summary is None:
+            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
+
+        filters = {}
+        if dimension == 'district_type':
+            filters = {
+                'district': request.args.get('district', None),
+                'facility_type': request.args.get('facility_type', None)
+            }
+
+        data = summary.breakdown(dimension, **filters)
+        return jsonify({'success': True, 'data': data, 'count': len(data)})
+    except Exception as e:
+        print(f"Error in get_statistics_breakdown: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,25 @@
+from flask import Blueprint, current_app, jsonify, request
+from app.utils.vector_tiles import MVT_MIMETYPE, get_tile
+
+tiles_bp = Blueprint('tiles', __name__)
+
+#FACILITY VECTOR TILE (LAYER "facilities", ATTRIBUTES id, name, facility_type, status, functional, ownership, district, zone)
+@tiles_bp.route('/tiles/facilities/<int:z>/<int:x>/<int:y>.mvt', methods=['GET'])
+def get_facility_tile(z, x, y):
+    try:
+        if z > current_app.config['TILE_MAX_ZOOM'] or x >= 2 ** z or y >= 2 ** z:
+            return jsonify({'success': False, 'error': 'Tile not found'}), 404
+        
+        tile = get_tile(z, x, y)
+        if tile is None:
+            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
+        data, signature = tile
+        
+        #EMPTY TILES ARE SENT AS AN EMPTY 200 BODY SO CLIENTS CACHE THEM TOO
+        response = current_app.response_class(data, mimetype=MVT_MIMETYPE)
+        response.set_etag(f'{signature}-{z}-{x}-{y}')
+        response.headers['Cache-Control'] = f"public, max-age={current_app.config['RESPONSE_CACHE_MAX_AGE']}"
+        return response.make_conditional(request)
+    except Exception as e:
+        print(f"Error in get_facility_tile: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,214 @@
+# FACILITY CATCHMENTS - AREA THAT CAN REACH A FACILITY BY ROAD WITHIN A TIME BAND, AS GRID ISOCHRONES
+import heapq
+import math
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.config import get_setting
+from app.utils.data_version import on_data_reload
+from app.utils.geo import EARTH_RADIUS_KM
+from app.utils.node_snapper import get_facility_nodes
+from app.utils.road_graph import get_road_graph
+from app.utils.topology import on_topology_rebuild
+from app.utils.ttl_cache import TTLCache
+
+INF = float('inf')
+
+#BOUNDED DIJKSTRA OVER INCOMING ARCS - MINUTES FROM EVERY NODE TO THE SOURCE (ROAD-TYPE SPEEDS)
+def reach_times(graph, source: int, max_minutes: float) -> Dict[int, float]:
+    rev_offsets, rev_tail, rev_arc = graph.reverse_adjacency()
+    arc_minutes = graph.arc_minutes()
+    settled = {}
+    best = {source: 0.0}
+    heap = [(0.0, source)]
+    while heap:
+        t, u = heapq.heappop(heap)
+        if u in settled:
+            continue
+        settled[u] = t
+        for i in range(rev_offsets[u], rev_offsets[u + 1]):
+            x = rev_tail[i]
+            nt = t + arc_minutes[rev_arc[i]]
+            if nt <= max_minutes and nt < best.get(x, INF):
+                best[x] = nt
+                heapq.heappush(heap, (nt, x))
+    return settled
+
+#FASTEST TIME PER GRID CELL (ROW = LATITUDE, COLUMN = LONGITUDE), INCLUDING POINTS ALONG REACHED ROADS
+def grid_minutes(graph, times: Dict[int, float], cell_size: float, max_minutes: float) -> Dict[Tuple[int, int], float]:
+    rev_offsets, rev_tail, rev_arc = graph.reverse_adjacency()
+    arc_minutes = graph.arc_minutes()
+    lats, lngs = graph.node_lat, graph.node_lng
+    cells = {}
+
+    def mark(lat, lng, t):
+        cell = (math.floor(lat / cell_size), math.floor(lng / cell_size))
+        if t < cells.get(cell, INF):
+            cells[cell] = t
+
+    for u, t in times.items():
+        mark(lats[u], lngs[u], t)
+        # WALK BACK ALONG EACH INCOMING ROAD (STRAIGHT LINE BETWEEN ITS ENDS) WHILE STILL INSIDE THE BAND
+        for i in range(rev_offsets[u], rev_offsets[u + 1]):
+            x = rev_tail[i]
+            m = arc_minutes[rev_arc[i]]
+            steps = int(max(abs(lats[x] - lats[u]), abs(lngs[x] - lngs[u])) / (cell_size / 2))
+            for step in range(1, steps + 1):
+                f = step / (steps + 1)
+                tf = t + f * m
+                if tf > max_minutes:
+                    break
+                mark(lats[u] + f * (lats[x] - lats[u]), lngs[u] + f * (lngs[x] - lngs[u]), tf)
+    return cells
+
+def _ring_area(ring: Sequence[Tuple[int, int]]) -> float:
+    # SHOELACE FORMULA ON LATTICE (x = COLUMN, y = ROW); POSITIVE FOR COUNTER-CLOCKWISE RINGS
+    return sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(ring, ring[1:])) / 2.0
+
+def _contains(ring: Sequence[Tuple[int, int]], x: float, y: float) -> bool:
+    inside = False
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:]):
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+    return inside
+
+def _trace_rings(cells) -> List[List[Tuple[int, int]]]:
+    # BOUNDARY EDGES OF THE CELL SET, DIRECTED WITH THE FILLED SIDE ON THE LEFT
+    outgoing: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+    for r, c in cells:
+        if (r - 1, c) not in cells:
+            outgoing.setdefault((c, r), []).append((c + 1, r))
+        if (r, c + 1) not in cells:
+            outgoing.setdefault((c + 1, r), []).append((c + 1, r + 1))
+        if (r + 1, c) not in cells:
+            outgoing.setdefault((c + 1, r + 1), []).append((c, r + 1))
+        if (r, c - 1) not in cells:
+            outgoing.setdefault((c, r + 1), []).append((c, r))
+
+    rings = []
+    while outgoing:
+        start = next(iter(outgoing))
+        ring = [start]
+        prev, point = None, start
+        while True:
+            choices = outgoing[point]
+            nxt = choices[0]
+            if len(choices) > 1 and prev is not None:
+                # TWO CELLS TOUCH ONLY AT THIS CORNER - TURN LEFT SO EACH RING STAYS SIMPLE
+                dx, dy = point[0] - prev[0], point[1] - prev[1]
+                left = (point[0] - dy, point[1] + dx)
+                if left in choices:
+                    nxt = left
+            choices.remove(nxt)
+            if not choices:
+                del outgoing[point]
+            ring.append(nxt)
+            prev, point = point, nxt
+            if point == start:
+                break
+
+        # DROP VERTICES IN THE MIDDLE OF STRAIGHT RUNS
+        simplified = [ring[0]]
+        for k in range(1, len(ring) - 1):
+            (x0, y0), (x1, y1), (x2, y2) = simplified[-1], ring[k], ring[k + 1]
+            if (x1 - x0) * (y2 - y1) != (y1 - y0) * (x2 - x1):
+                simplified.append(ring[k])
+        simplified.append(ring[-1])
+        rings.append(simplified)
+    return rings
+
+#CELL SET TO A GEOJSON MULTIPOLYGON (HOLES ATTACHED TO THE SMALLEST OUTER RING AROUND THEM)
+def cells_to_multipolygon(cells, cell_size: float) -> Optional[Dict]:
+    if not cells:
+        return None
+    outers, holes = [], []
+    for ring in _trace_rings(set(cells)):
+        (outers if _ring_area(ring) > 0 else holes).append(ring)
+
+    polygons = [[outer] for outer in outers]
+    areas = [_ring_area(outer) for outer in outers]
+    for hole in holes:
+        # A FILLED CELL LIES JUST LEFT OF THE HOLE'S FIRST EDGE; ITS CENTRE IS INSIDE THE OWNING POLYGON
+        (x1, y1), (x2, y2) = hole[0], hole[1]
+        dx, dy = (x2 > x1) - (x2 < x1), (y2 > y1) - (y2 < y1)
+        px, py = x1 + dx * 0.5 - dy * 0.5, y1 + dy * 0.5 + dx * 0.5
+        owners = [i for i, outer in enumerate(outers) if _contains(outer, px, py)]
+        if owners:
+            polygons[min(owners, key=lambda i: areas[i])].append(hole)
+
+    return {
+        'type': 'MultiPolygon',
+        'coordinates': [
+            [[[round(x * cell_size, 6), round(y * cell_size, 6)] for x, y in ring] for ring in polygon]
+            for polygon in polygons
+        ]
+    }
+
+def _cells_area_km2(cells, cell_size: float) -> float:
+    side = EARTH_RADIUS_KM * math.radians(cell_size)
+    return sum(side * side * math.cos(math.radians((r + 0.5) * cell_size)) for r, _ in cells)
+
+def catchment_features(graph, source: int, bands: Sequence[int], cell_size: float) -> Dict[int, Dict]:
+    """One GeoJSON feature per band from a single search bounded by the largest band"""
+    cells = grid_minutes(graph, reach_times(graph, source, max(bands)), cell_size, max(bands))
+    features = {}
+    for band in bands:
+        inside = [cell for cell, t in cells.items() if t <= band]
+        features[band] = {
+            'type': 'Feature',
+            'geometry': cells_to_multipolygon(inside, cell_size),
+            'properties': {
+                'minutes': band,
+                'cells': len(inside),
+                'area_km2': round(_cells_area_km2(inside, cell_size), 1)
+            }
+        }
+    return features
+
+
+_lock = threading.Lock()
+_cache: Optional[TTLCache] = None
+
+def get_catchment_cache() -> TTLCache:
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = TTLCache(
+                    max_entries=get_setting('CATCHMENT_CACHE_MAX_ENTRIES'),
+                    max_bytes=int(get_setting('CATCHMENT_CACHE_MAX_MB') * 1024 * 1024)
+                )
+    return _cache
+
+#CATCHMENT FEATURES FOR A FACILITY, CACHED PER (FACILITY, BAND, TOPOLOGY VERSION, CELL SIZE)
+def get_facility_catchment(facility_id: int, bands: Sequence[int], conn=None) -> Optional[List[Dict]]:
+    """Return features in band order, [] when the facility has no road node, None when routing is unavailable"""
+    graph = get_road_graph(conn)
+    if graph is None:
+        return None
+    node = get_facility_nodes(conn).get(facility_id)
+    if node is None:
+        return []
+
+    cell_size = get_setting('CATCHMENT_CELL_DEG')
+    cache = get_catchment_cache()
+    keys = {band: (facility_id, band, graph.topology_version, cell_size) for band in bands}
+    features = {band: cache.get(key) for band, key in keys.items()}
+
+    missing = [band for band, feature in features.items() if feature is None]
+    if missing:
+        for band, feature in catchment_features(graph, graph.node_index[node], missing, cell_size).items():
+            cache.put(keys[band], feature)
+            features[band] = feature
+    return [features[band] for band in bands]
+
+#FACILITY LOCATIONS OR THE ROAD NETWORK CHANGED - EVERY CACHED CATCHMENT MAY BE STALE
+@on_data_reload
+def clear_catchment_cache(conn=None, version: Optional[int] = None):
+    if _cache is not None:
+        _cache.clear()
+
+on_topology_rebuild(clear_catchment_cache)
+
+def catchment_cache_stats() -> Dict:
+    return _cache.stats() if _cache is not None else {'entries': 0, 'hits': 0, 'misses': 0, 'hit_rate': 0.0}
@@ -0,0 +1,157 @@
+# FACILITY CLUSTERS FOR MAP VIEWPORTS - NESTED WEB MERCATOR GRID, BUILT ONCE PER DATA VERSION AND FILTER
+import math
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from app.config import get_setting
+from app.utils.data_version import current_data_version, on_data_reload
+from app.utils.facility_index import get_facility_index
+from app.utils.ttl_cache import TTLCache
+
+MAX_LAT = 85.0511287798
+TILE_PX = 256
+
+
+#FRACTION OF THE WORLD (0..1) ACROSS AND DOWN THE WEB MERCATOR SQUARE
+def mercator_xy(lat: float, lng: float) -> Tuple[float, float]:
+    lat = math.radians(max(-MAX_LAT, min(MAX_LAT, lat)))
+    return (lng + 180.0) / 360.0, (1 - math.asinh(math.tan(lat)) / math.pi) / 2
+
+
+class Cluster:
+    __slots__ = ('count', 'lat', 'lng', 'west', 'south', 'east', 'north', 'by_type', 'by_status',
+                 'single', 'expansion_zoom')
+
+    def __init__(self, count, lat, lng, bounds, by_type, by_status, single, expansion_zoom):
+        self.count = count
+        self.lat, self.lng = lat, lng
+        self.west, self.south, self.east, self.north = bounds
+        self.by_type = by_type
+        self.by_status = by_status
+        self.single = single                  # FACILITY POSITION WHEN count == 1, ELSE -1
+        self.expansion_zoom = expansion_zoom  # FIRST ZOOM WHERE THE CLUSTER SPLITS
+
+    @classmethod
+    def merge(cls, children: List['Cluster'], zoom: int) -> 'Cluster':
+        if len(children) == 1:
+            return children[0]
+        count = sum(c.count for c in children)
+        by_type, by_status = {}, {}
+        for c in children:
+            for key, n in c.by_type.items():
+                by_type[key] = by_type.get(key, 0) + n
+            for key, n in c.by_status.items():
+                by_status[key] = by_status.get(key, 0) + n
+        return cls(
+            count,
+            sum(c.lat * c.count for c in children) / count,
+            sum(c.lng * c.count for c in children) / count,
+            (min(c.west for c in children), min(c.south for c in children),
+             max(c.east for c in children), max(c.north for c in children)),
+            by_type, by_status, -1, zoom + 1
+        )
+
+
+class ClusterIndex:
+    """Level z holds one cluster per occupied cell of 2^(z + shift) x 2^(z + shift) cells, so a cell
+    is cell_px screen pixels wide at zoom z. Each level is built by merging four cells of the level below"""
+    def __init__(self, facilities: List[Dict], max_zoom: int, cell_px: int):
+        shift = math.log2(TILE_PX / cell_px)
+        if shift != int(shift) or shift < 0:
+            raise ValueError('VIEWPORT_CLUSTER_CELL_PX must be a power of two no larger than 256')
+        self.facilities = facilities
+        self.max_zoom = max_zoom
+        self.shift = int(shift)
+        self.points = [mercator_xy(float(f['lat']), float(f['lng'])) for f in facilities]
+
+        # LEAF CELLS AT max_zoom KEEP THEIR MEMBERS FOR THE UNCLUSTERED ZOOMS ABOVE IT
+        scale = 2 ** (max_zoom + self.shift)
+        self.members: Dict[Tuple[int, int], List[int]] = {}
+        for i, (x, y) in enumerate(self.points):
+            self.members.setdefault((int(x * scale), int(y * scale)), []).append(i)
+
+        leaves = {}
+        for key, members in self.members.items():
+            leaves[key] = Cluster.merge([self._point_cluster(i) for i in members], max_zoom)
+        self.levels: List[Dict[Tuple[int, int], Cluster]] = [{} for _ in range(max_zoom + 1)]
+        self.levels[max_zoom] = leaves
+
+        for z in range(max_zoom - 1, -1, -1):
+            groups: Dict[Tuple[int, int], List[Cluster]] = {}
+            for (cx, cy), cluster in self.levels[z + 1].items():
+                groups.setdefault((cx >> 1, cy >> 1), []).append(cluster)
+            self.levels[z] = {key: Cluster.merge(children, z) for key, children in groups.items()}
+
+    def _point_cluster(self, i: int) -> Cluster:
+        f = self.facilities[i]
+        lat, lng = float(f['lat']), float(f['lng'])
+        return Cluster(1, lat, lng, (lng, lat, lng, lat), {f['facility_type']: 1}, {f['status']: 1},
+                       i, self.max_zoom + 1)
+
+    def _cells(self, level: Dict, z: int, west: float, south: float, east: float, north: float):
+        scale = 2 ** (z + self.shift)
+        (x0, y0), (x1, y1) = mercator_xy(north, west), mercator_xy(south, east)
+        cx0, cy0, cx1, cy1 = int(x0 * scale), int(y0 * scale), int(x1 * scale), int(y1 * scale)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(level):
+            # VIEWPORT COVERS MORE CELLS THAN ARE OCCUPIED - SCAN THE LEVEL INSTEAD
+            return [(key, value) for key, value in level.items()
+                    if cx0 <= key[0] <= cx1 and cy0 <= key[1] <= cy1]
+        return [((cx, cy), level[(cx, cy)]) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)
+                if (cx, cy) in level]
+
+    def query(self, west: float, south: float, east: float, north: float,
+              zoom: int) -> Tuple[List[Tuple[Tuple[int, int], Cluster]], List[Dict]]:
+        """([(cell, cluster)], facilities) whose position lies inside the bbox at this zoom"""
+        def inside(lat, lng):
+            return west <= lng <= east and south <= lat <= north
+
+        clusters, facilities = [], []
+        if zoom > self.max_zoom:
+            for _, members in self._cells(self.members, self.max_zoom, west, south, east, north):
+                facilities.extend(self.facilities[i] for i in members
+                                  if inside(float(self.facilities[i]['lat']), float(self.facilities[i]['lng'])))
+            return clusters, facilities
+
+        for key, cluster in self._cells(self.levels[zoom], zoom, west, south, east, north):
+            if not inside(cluster.lat, cluster.lng):
+                continue
+            if cluster.single >= 0:
+                facilities.append(self.facilities[cluster.single])
+            else:
+                clusters.append((key, cluster))
+        return clusters, facilities
+
+
+_lock = threading.Lock()
+_cache: Optional[TTLCache] = None
+
+def get_cluster_cache() -> TTLCache:
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = TTLCache(max_entries=get_setting('VIEWPORT_CLUSTER_CACHE_MAX_ENTRIES'))
+    return _cache
+
+#HIERARCHY FOR THE CURRENT DATA VERSION AND FILTER COMBINATION (BUILT ON FIRST USE)
+def get_cluster_index(conn=None, **filters) -> Optional[ClusterIndex]:
+    index = get_facility_index(conn)
+    if index is None:
+        return None
+    cache = get_cluster_cache()
+    key = (current_data_version(), tuple(sorted(filters.items())))
+    clusters = cache.get(key)
+    if clusters is None:
+        facilities = [f for f in index.facilities if index.matches(f, **filters)]
+        clusters = ClusterIndex(facilities, get_setting('VIEWPORT_CLUSTER_MAX_ZOOM'),
+                                get_setting('VIEWPORT_CLUSTER_CELL_PX'))
+        cache.put(key, clusters)
+    return clusters
+
+@on_data_reload
+def clear_cluster_indexes(conn=None):
+    if _cache is not None:
+        _cache.clear()
+
+def cluster_cache_stats() -> Dict:
+    return _cache.stats() if _cache is not None else {'entries': 0, 'hits': 0, 'misses': 0, 'hit_rate': 0.0}
@@ -0,0 +1,359 @@
+# CONTRACTION HIERARCHIES OVER THE IN-MEMORY ROAD GRAPH (OFFLINE BUILD, ON-DISK FORMAT, QUERY)
+import heapq
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.config import get_setting
+from app.utils.data_version import on_data_reload
+
+INF = float('inf')
+
+# FILE LAYOUT: HEADER, THEN THE ARRAYS OF ContractionHierarchy.ARRAYS IN ORDER (LITTLE-ENDIAN)
+MAGIC = b'MWCH'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sIqIIII')   # MAGIC, FORMAT, TOPOLOGY VERSION (-1 = NONE), NODES, GRAPH ARCS, UP ARCS, DOWN ARCS
+
+
+#UPWARD/DOWNWARD ARC ARRAYS OF A CONTRACTED GRAPH
+class ContractionHierarchy:
+    """Forward search from the source uses up_* arcs (u -> head, rank rises); backward search
+    from the target uses down_* arcs stored at their head (tail -> u, rank rises towards tail).
+    *_via is the contracted node a shortcut skips, or -(arc + 1) for an arc of the road graph."""
+
+    ARRAYS = (
+        ('rank', 'i'),
+        ('up_offsets', 'i'), ('up_head', 'i'), ('up_weight', 'd'), ('up_via', 'i'),
+        ('down_offsets', 'i'), ('down_tail', 'i'), ('down_weight', 'd'), ('down_via', 'i')
+    )
+
+    def __init__(self, rank, up_offsets, up_head, up_weight, up_via,
+                 down_offsets, down_tail, down_weight, down_via,
+                 topology_version: Optional[int] = None, graph_arc_count: int = 0):
+        self.rank = rank
+        self.up_offsets, self.up_head, self.up_weight, self.up_via = up_offsets, up_head, up_weight, up_via
+        self.down_offsets, self.down_tail, self.down_weight, self.down_via = down_offsets, down_tail, down_weight, down_via
+        self.topology_version = topology_version
+        self.graph_arc_count = graph_arc_count
+
+    @property
+    def node_count(self) -> int:
+        return len(self.rank)
+
+    @property
+    def shortcut_count(self) -> int:
+        return sum(1 for via in self.up_via if via >= 0) + sum(1 for via in self.down_via if via >= 0)
+
+    def matches(self, graph) -> bool:
+        return (self.node_count == graph.node_count and self.graph_arc_count == len(graph.arc_head)
+                and self.topology_version == graph.topology_version)
+
+    def query(self, source: int, target: int) -> Optional[Tuple[float, List[int], int]]:
+        """Return (cost, road graph arcs in travel order, settled nodes) or None if unreachable"""
+        if source == target:
+            return 0.0, [], 1
+
+        offsets = (self.up_offsets, self.down_offsets)
+        nodes = (self.up_head, self.down_tail)
+        weights = (self.up_weight, self.down_weight)
+        dist = ({source: 0.0}, {target: 0.0})
+        pred = ({}, {})   # node -> (previous node, arc index in that direction's arrays)
+        settled = (set(), set())
+        heaps = ([(0.0, source)], [(0.0, target)])
+        best, meeting = INF, None
+
+        while heaps[0] or heaps[1]:
+            if not heaps[1] or (heaps[0] and heaps[0][0][0] <= heaps[1][0][0]):
+                side = 0
+            else:
+                side = 1
+            # BOTH SEARCHES ONLY CLIMB, SO ONCE THE SMALLER KEY REACHES best NOTHING CAN IMPROVE IT
+            if heaps[side][0][0] >= best:
+                break
+
+            d, u = heapq.heappop(heaps[side])
+            if u in settled[side]:
+                continue
+            settled[side].add(u)
+
+            this_dist, other_dist = dist[side], dist[1 - side]
+            if u in other_dist and d + other_dist[u] < best:
+                best, meeting = d + other_dist[u], u
+
+            # STALL ON DEMAND - A HIGHER NODE ALREADY REACHES u MORE CHEAPLY, SO u IS NOT ON A SHORTEST UP-PATH
+            stall_offsets, stall_nodes, stall_weights = offsets[1 - side], nodes[1 - side], weights[1 - side]
+            if any(this_dist.get(stall_nodes[k], INF) + stall_weights[k] < d
+                   for k in range(stall_offsets[u], stall_offsets[u + 1])):
+                continue
+
+            side_offsets, side_nodes, side_weights = offsets[side], nodes[side], weights[side]
+            for k in range(side_offsets[u], side_offsets[u + 1]):
+                v = side_nodes[k]
+                nd = d + side_weights[k]
+                if nd < this_dist.get(v, INF):
+                    this_dist[v] = nd
+                    pred[side][v] = (u, k)
+                    heapq.heappush(heaps[side], (nd, v))
+
+        if meeting is None:
+            return None
+
+        arcs = []
+        chain = []
+        node = meeting
+        while node != source:
+            prev, k = pred[0][node]
+            chain.append((prev, node, self.up_via[k]))
+            node = prev
+        for tail, head, via in reversed(chain):
+            self._unpack(tail, head, via, arcs)
+
+        node = meeting
+        while node != target:
+            nxt, k = pred[1][node]
+            self._unpack(node, nxt, self.down_via[k], arcs)
+            node = nxt
+
+        return best, arcs, len(settled[0]) + len(settled[1])
+
+    def _unpack(self, tail: int, head: int, via: int, arcs: List[int]):
+        # EXPAND A SHORTCUT tail -> via -> head INTO ROAD GRAPH ARCS (ITERATIVE, DEPTH CAN BE LARGE)
+        stack = [(tail, head, via)]
+        while stack:
+            tail, head, via = stack.pop()
+            if via < 0:
+                arcs.append(-via - 1)
+                continue
+            stack.append((via, head, self._via_of(self.up_offsets, self.up_head, self.up_via, via, head)))
+            stack.append((tail, via, self._via_of(self.down_offsets, self.down_tail, self.down_via, via, tail)))
+
+    @staticmethod
+    def _via_of(offsets, nodes, vias, u: int, other: int) -> int:
+        for k in range(offsets[u], offsets[u + 1]):
+            if nodes[k] == other:
+                return vias[k]
+        raise KeyError(f'Contraction hierarchy is missing the arc between {u} and {other}')
+
+    def save(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        version = self.topology_version if self.topology_version is not None else -1
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, version, self.node_count, self.graph_arc_count,
+                                len(self.up_head), len(self.down_tail)))
+            for name, typecode in self.ARRAYS:
+                values = getattr(self, name)
+                if sys.byteorder == 'big':
+                    values = array(typecode, values)
+                    values.byteswap()
+                values.tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'ContractionHierarchy':
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        magic, fmt, version, nodes, graph_arcs, up_arcs, down_arcs = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or fmt != FORMAT_VERSION:
+            raise ValueError(f'{path} is not a contraction hierarchy file (format {FORMAT_VERSION})')
+
+        lengths = {
+            'rank': nodes,
+            'up_offsets': nodes + 1, 'up_head': up_arcs, 'up_weight': up_arcs, 'up_via': up_arcs,
+            'down_offsets': nodes + 1, 'down_tail': down_arcs, 'down_weight': down_arcs, 'down_via': down_arcs
+        }
+        arrays = {}
+        pos = HEADER.size
+        for name, typecode in cls.ARRAYS:
+            values = array(typecode)
+            end = pos + lengths[name] * values.itemsize
+            values.frombytes(data[pos:end])
+            if sys.byteorder == 'big':
+                values.byteswap()
+            arrays[name] = values
+            pos = end
+        if pos != len(data):
+            raise ValueError(f'{path} is truncated or has trailing data')
+
+        return cls(**arrays, topology_version=version if version >= 0 else None, graph_arc_count=graph_arcs)
+
+
+def _witness_distances(out: List[Dict], source: int, skip: int, max_cost: float,
+                       targets: List[int], settle_limit: int) -> Dict[int, float]:
+    # BOUNDED DIJKSTRA THAT AVOIDS THE NODE BEING CONTRACTED
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    remaining = set(targets)
+    settled = 0
+    while heap and remaining:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        if d > max_cost or settled >= settle_limit:
+            break
+        settled += 1
+        remaining.discard(u)
+        for v, (w, _) in out[u].items():
+            if v == skip:
+                continue
+            nd = d + w
+            if nd < dist.get(v, INF):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return dist
+
+def _shortcuts_for(out: List[Dict], inn: List[Dict], x: int, settle_limit: int) -> List[Tuple[int, int, float]]:
+    # SHORTCUT u -> v IS NEEDED WHEN NO PATH AVOIDING x IS AS SHORT AS u -> x -> v
+    shortcuts = []
+    outs = out[x]
+    for u, (w_in, _) in inn[x].items():
+        targets = [v for v in outs if v != u]
+        if not targets:
+            continue
+        max_cost = w_in + max(outs[v][0] for v in targets)
+        dist = _witness_distances(out, u, x, max_cost, targets, settle_limit)
+        for v in targets:
+            w = w_in + outs[v][0]
+            if dist.get(v, INF) > w:
+                shortcuts.append((u, v, w))
+    return shortcuts
+
+#CONTRACT EVERY NODE IN EDGE-DIFFERENCE ORDER (LAZY UPDATES) AND COLLECT THE UPWARD/DOWNWARD ARCS
+def build_contraction_hierarchy(graph, settle_limit: int = 500,
+                                progress: Optional[Callable[[int, int], None]] = None) -> ContractionHierarchy:
+    n = graph.node_count
+    offsets, heads, weights = graph.offsets, graph.arc_head, graph.arc_weight
+
+    # WORKING GRAPH: CHEAPEST ARC PER NODE PAIR AS {neighbour: (weight, via)}
+    out = [{} for _ in range(n)]
+    inn = [{} for _ in range(n)]
+    for u in range(n):
+        for a in range(offsets[u], offsets[u + 1]):
+            v = heads[a]
+            if v == u:
+                continue
+            current = out[u].get(v)
+            if current is None or weights[a] < current[0]:
+                out[u][v] = inn[v][u] = (weights[a], -(a + 1))
+
+    contracted_neighbours = [0] * n
+
+    def priority(x, shortcuts):
+        return len(shortcuts) - len(inn[x]) - len(out[x]) + contracted_neighbours[x]
+
+    heap = [(priority(x, _shortcuts_for(out, inn, x, settle_limit)), x) for x in range(n)]
+    heapq.heapify(heap)
+
+    rank = array('i', [0]) * n
+    up = [None] * n
+    down = [None] * n
+    order = 0
+    while heap:
+        _, x = heapq.heappop(heap)
+        shortcuts = _shortcuts_for(out, inn, x, settle_limit)
+        p = priority(x, shortcuts)
+        if heap and p > heap[0][0]:
+            heapq.heappush(heap, (p, x))
+            continue
+
+        rank[x] = order
+        order += 1
+        up[x] = [(v, w, via) for v, (w, via) in out[x].items()]
+        down[x] = [(u, w, via) for u, (w, via) in inn[x].items()]
+        for v in out[x]:
+            del inn[v][x]
+            contracted_neighbours[v] += 1
+        for u in inn[x]:
+            del out[u][x]
+            contracted_neighbours[u] += 1
+        out[x], inn[x] = {}, {}
+
+        for u, v, w in shortcuts:
+            current = out[u].get(v)
+            if current is None or w < current[0]:
+                out[u][v] = inn[v][u] = (w, x)
+
+        if progress is not None and order % 10000 == 0:
+            progress(order, n)
+
+    def pack(lists):
+        offsets = array('i', [0]) * (n + 1)
+        nodes, arc_weights, vias = array('i'), array('d'), array('i')
+        for x in range(n):
+            for node, w, via in lists[x]:
+                nodes.append(node)
+                arc_weights.append(w)
+                vias.append(via)
+            offsets[x + 1] = len(nodes)
+        return offsets, nodes, arc_weights, vias
+
+    return ContractionHierarchy(rank, *pack(up), *pack(down),
+                                topology_version=graph.topology_version, graph_arc_count=len(heads))
+
+
+def hierarchy_path() -> str:
+    return get_setting('ROUTING_CH_PATH')
+
+_lock = threading.Lock()
+_loaded: Optional[Dict] = None   # {'graph': ..., 'hierarchy': ContractionHierarchy or None}
+
+#HIERARCHY FOR THE CURRENT ROAD GRAPH, READ FROM DISK ONCE PER GRAPH (None IF MISSING OR STALE)
+def get_contraction_hierarchy(graph) -> Optional[ContractionHierarchy]:
+    global _loaded
+    if graph is None:
+        return None
+    loaded = _loaded
+    if loaded is not None and loaded['graph'] is graph:
+        return loaded['hierarchy']
+
+    with _lock:
+        if _loaded is None or _loaded['graph'] is not graph:
+            _loaded = {'graph': graph, 'hierarchy': _load_for(graph, hierarchy_path())}
+        return _loaded['hierarchy']
+
+def _load_for(graph, path: str) -> Optional[ContractionHierarchy]:
+    if graph.hierarchy is not None:
+        return graph.hierarchy   # MAPPED ALONG WITH THE GRAPH FROM A SNAPSHOT
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        started = time.perf_counter()
+        hierarchy = ContractionHierarchy.load(path)
+    except Exception as e:
+        print(f"Error loading contraction hierarchy {path}: {e}")
+        return None
+    if not hierarchy.matches(graph):
+        print(f"Contraction hierarchy {path} was built for topology version {hierarchy.topology_version}, "
+              f"graph is version {graph.topology_version} - rebuild it with \"flask build-ch\"")
+        return None
+    print(f"Contraction hierarchy loaded: {len(hierarchy.up_head) + len(hierarchy.down_tail)} arcs "
+          f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return hierarchy
+
+#RE-READ THE FILE ON THE NEXT QUERY (PICKS UP A HIERARCHY WRITTEN BY "flask build-ch" WITHOUT A RESTART)
+@on_data_reload
+def reset_contraction_hierarchy(conn=None):
+    global _loaded
+    with _lock:
+        _loaded = None
+
+def contraction_stats() -> Dict:
+    loaded = _loaded
+    hierarchy = loaded['hierarchy'] if loaded else None
+    if hierarchy is None:
+        return {'loaded': False}
+    return {
+        'loaded': True,
+        'topology_version': hierarchy.topology_version,
+        'nodes': hierarchy.node_count,
+        'up_arcs': len(hierarchy.up_head),
+        'down_arcs': len(hierarchy.down_tail)
+    }
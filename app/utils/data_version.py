@@ -0,0 +1,33 @@
+# DATA VERSION AND RELOAD HOOKS FOR IN-MEMORY CACHES OF THE FACILITY REGISTRY
+import threading
+from typing import Callable, List
+
+_lock = threading.Lock()
+_version = 1
+_listeners: List[Callable] = []
+
+def current_data_version() -> int:
+    return _version
+
+#REGISTER A CALLBACK TO RUN WHEN THE FACILITY DATA IS RELOADED
+def on_data_reload(callback: Callable) -> Callable:
+    """Register callback(conn) to run after the data version is bumped"""
+    with _lock:
+        _listeners.append(callback)
+    return callback
+
+#BUMP THE DATA VERSION AND REFRESH EVERY REGISTERED CACHE
+def reload_data(conn=None) -> int:
+    global _version
+    with _lock:
+        _version += 1
+        version = _version
+        listeners = list(_listeners)
+
+    for callback in listeners:
+        try:
+            callback(conn)
+        except Exception as e:
+            print(f"Error in data reload hook {getattr(callback, '__name__', callback)}: {e}")
+
+    return version
@@ -0,0 +1,115 @@
+# IN-MEMORY SPATIAL INDEX OVER THE FACILITY REGISTRY
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from psycopg2.extras import RealDictCursor
+from app.config import get_setting
+from app.db import connection_scope
+from app.utils.data_version import on_data_reload
+from app.utils.grid_index import GridIndex
+
+FACILITY_QUERY = """
+    SELECT
+        gid as id,
+        code,
+        name,
+        "common nam" as common_name,
+        ownership,
+        type as facility_type,
+        status,
+        zone,
+        district,
+        latitude as lat,
+        longitude as lng
+    FROM malawi_health_facilities
+    WHERE latitude IS NOT NULL
+    AND longitude IS NOT NULL
+    AND name IS NOT NULL
+    ORDER BY gid;
+"""
+
+#FACILITY REGISTRY SNAPSHOT WITH A GRID INDEX FOR K-NEAREST QUERIES
+class FacilityIndex:
+    def __init__(self, facilities: List[Dict], cell_size: float = 0.1):
+        self.facilities = facilities
+        self.by_id = {f['id']: f for f in facilities}
+        self.lats = [float(f['lat']) for f in facilities]
+        self.lngs = [float(f['lng']) for f in facilities]
+        self.grid = GridIndex(self.lats, self.lngs, cell_size)
+
+    def __len__(self):
+        return len(self.facilities)
+
+    @staticmethod
+    def matches(facility: Dict, functional_only: bool = False, district: Optional[str] = None,
+                facility_type: Optional[str] = None, ownership: Optional[str] = None) -> bool:
+        if functional_only and facility['status'] != 'Functional':
+            return False
+        if district and facility['district'] != district:
+            return False
+        if facility_type and facility['facility_type'] != facility_type:
+            return False
+        if ownership and facility['ownership'] != ownership:
+            return False
+        return True
+
+    def nearest(self, lat: float, lng: float, limit: int = 5, **filters) -> List[Tuple[float, Dict]]:
+        """Return up to `limit` (distance_km, facility) pairs ordered by great circle distance"""
+        facilities = self.facilities
+        predicate = (lambda i: self.matches(facilities[i], **filters)) if any(filters.values()) else None
+        return [(d, facilities[i]) for d, i in self.grid.nearest(lat, lng, limit, predicate)]
+
+
+def load_facility_index(conn, cell_size: Optional[float] = None) -> FacilityIndex:
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur.execute(FACILITY_QUERY)
+    facilities = [dict(row) for row in cur.fetchall()]
+    cur.close()
+    conn.rollback()
+    return FacilityIndex(facilities, cell_size or get_setting('FACILITY_INDEX_CELL_DEG') or 0.1)
+
+#FROM THE PUBLISHED SNAPSHOT WHEN THERE IS ONE, OTHERWISE FROM THE DATABASE (None WITHOUT A CONNECTION)
+def read_facility_index(conn=None) -> Optional[FacilityIndex]:
+    from app.utils.snapshot import get_snapshot
+    snapshot = get_snapshot()
+    if snapshot is not None and snapshot.has_facilities():
+        return FacilityIndex(snapshot.facilities(), get_setting('FACILITY_INDEX_CELL_DEG') or 0.1)
+
+    with connection_scope(conn) as db:
+        if db is None:
+            return None
+        return load_facility_index(db)
+
+
+_index: Optional[FacilityIndex] = None
+_index_lock = threading.Lock()
+
+#GET THE SHARED INDEX, LOADING IT ON FIRST USE
+def get_facility_index(conn=None) -> Optional[FacilityIndex]:
+    global _index
+    if _index is not None:
+        return _index
+
+    with _index_lock:
+        if _index is None:
+            try:
+                _index = read_facility_index(conn)
+            except Exception as e:
+                print(f"Error loading facility index: {e}")
+                return None
+            if _index is not None:
+                print(f"Facility index loaded: {len(_index)} facilities")
+        return _index
+
+#REBUILD THE INDEX AND SWAP IT IN (CALLED WHEN THE FACILITY TABLE CHANGES)
+@on_data_reload
+def refresh_facility_index(conn=None) -> Optional[FacilityIndex]:
+    global _index
+    index = read_facility_index(conn)
+    if index is None:
+        return None
+
+    with _index_lock:
+        _index = index
+    print(f"Facility index refreshed: {len(index)} facilities")
+    return index
@@ -0,0 +1,193 @@
+# FACILITY LISTING QUERIES - COLUMN PROJECTION, KEYSET (name, gid) PAGINATION AND CACHED TOTALS
+import base64
+import json
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.config import get_setting
+from app.utils.data_version import current_data_version, on_data_reload
+from app.utils.ttl_cache import TTLCache
+
+# OUTPUT FIELD -> COLUMN IN malawi_health_facilities
+FACILITY_COLUMNS = {
+    'id': 'gid',
+    'code': 'code',
+    'name': 'name',
+    'common_name': '"common nam"',
+    'ownership': 'ownership',
+    'facility_type': 'type',
+    'status': 'status',
+    'zone': 'zone',
+    'district': 'district',
+    'lat': 'latitude',
+    'lng': 'longitude'
+}
+
+# ONE FACILITY WITH EVERY FIELD (DETAILS PAGE, ROUTE DESTINATION)
+FACILITY_BY_ID_QUERY = """
+            SELECT 
+                gid as id,
+                code,
+                name,
+                "common nam" as common_name,
+                ownership,
+                type as facility_type,
+                status,
+                zone,
+                district,
+                latitude as lat,
+                longitude as lng
+            FROM malawi_health_facilities
+            WHERE gid = %s;
+        """
+
+# LOOKUP LISTS WITH A FACILITY COUNT PER VALUE
+DISTRICTS_QUERY = """
+            SELECT DISTINCT district, COUNT(*) as count
+            FROM malawi_health_facilities
+            WHERE district IS NOT NULL 
+            AND latitude IS NOT NULL 
+            AND longitude IS NOT NULL
+            GROUP BY district
+            ORDER BY district;
+        """
+
+FACILITY_TYPES_QUERY = """
+            SELECT DISTINCT type as facility_type, COUNT(*) as count
+            FROM malawi_health_facilities
+            WHERE type IS NOT NULL 
+            AND latitude IS NOT NULL 
+            AND longitude IS NOT NULL
+            GROUP BY type
+            ORDER BY type;
+        """
+
+OWNERSHIPS_QUERY = """
+            SELECT DISTINCT ownership, COUNT(*) as count
+            FROM malawi_health_facilities
+            WHERE ownership IS NOT NULL 
+            AND latitude IS NOT NULL 
+            AND longitude IS NOT NULL
+            GROUP BY ownership
+            ORDER BY ownership;
+        """
+
+#PARSE ?fields=id,name,lat,lng (EMPTY MEANS EVERY FIELD, IN THE USUAL ORDER)
+def parse_fields(value: Optional[str]) -> List[str]:
+    if not value:
+        return list(FACILITY_COLUMNS)
+    fields = []
+    for field in value.split(','):
+        field = field.strip()
+        if not field:
+            continue
+        if field not in FACILITY_COLUMNS:
+            raise ValueError(f'Unknown field "{field}". Use any of: {", ".join(FACILITY_COLUMNS)}')
+        if field not in fields:
+            fields.append(field)
+    if not fields:
+        raise ValueError('fields must name at least one field')
+    return fields
+
+#OPAQUE CURSOR = URL-SAFE BASE64 OF THE LAST (name, gid) ON THE PAGE
+def encode_cursor(name: str, gid: int) -> str:
+    raw = json.dumps([name, gid], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        name, gid = json.loads(raw)
+        if not isinstance(name, str) or not isinstance(gid, int):
+            raise TypeError
+        return name, gid
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+#WHERE CLAUSE SHARED BY THE PAGE QUERY AND THE COUNT QUERY
+def facility_filter_clause(functional_only: bool = False, district: Optional[str] = None,
+                           facility_type: Optional[str] = None, ownership: Optional[str] = None) -> Tuple[str, List]:
+    where = """
+            WHERE latitude IS NOT NULL
+            AND longitude IS NOT NULL
+            AND name IS NOT NULL
+        """
+    params = []
+
+    if functional_only:
+        where += " AND status = 'Functional'"
+    if district:
+        where += " AND district = %s"
+        params.append(district)
+    if facility_type:
+        where += " AND type = %s"
+        params.append(facility_type)
+    if ownership:
+        where += " AND ownership = %s"
+        params.append(ownership)
+    return where, params
+
+#SELECT ONLY THE REQUESTED COLUMNS, ORDERED BY (name, gid); AFTER/LIMIT FOR ONE KEYSET PAGE
+def facility_listing_query(fields: Sequence[str], where: str, params: List,
+                           after: Optional[Tuple[str, int]] = None, limit: Optional[int] = None) -> Tuple[str, List]:
+    columns = ',\n                '.join(
+        column if column == field else f'{column} as {field}'
+        for field, column in ((f, FACILITY_COLUMNS[f]) for f in fields)
+    )
+    query = f"""
+            SELECT
+                {columns}
+            FROM malawi_health_facilities{where}"""
+    params = list(params)
+
+    # PAGES USE BYTE ORDER, NOT THE DATABASE COLLATION, SO CURSORS MATCH THE OFFLINE LISTING (app/utils/offline.py);
+    # idx_malawi_health_facilities_name_c ON (name COLLATE "C", gid) SERVES IT. FULL LISTINGS KEEP THE COLLATION
+    name = 'name COLLATE "C"' if after is not None or limit is not None else 'name'
+    if after is not None:
+        # ROW COMPARISON WALKS THE (name, gid) ORDER WITHOUT OFFSET
+        query += f' AND ({name}, gid) > (%s, %s)'
+        params.extend(after)
+    query += f' ORDER BY {name}, gid'
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query + ';', params
+
+
+_lock = threading.Lock()
+_counts: Optional[TTLCache] = None
+
+def get_count_cache() -> TTLCache:
+    global _counts
+    if _counts is None:
+        with _lock:
+            if _counts is None:
+                _counts = TTLCache(max_entries=get_setting('FACILITY_COUNT_CACHE_MAX_ENTRIES'))
+    return _counts
+
+def facility_count_query(where: str) -> str:
+    return f"SELECT COUNT(*) FROM malawi_health_facilities{where};"
+
+def facility_count_key(where: str, params: List) -> Tuple:
+    return where, tuple(params), current_data_version()
+
+#TOTAL ROWS FOR A FILTER, COUNTED ONCE PER DATA VERSION INSTEAD OF ON EVERY PAGE
+def facility_count(conn, where: str, params: List) -> int:
+    cache = get_count_cache()
+    key = facility_count_key(where, params)
+    total = cache.get(key)
+    if total is None:
+        cur = conn.cursor()
+        cur.execute(facility_count_query(where), params)
+        total = cur.fetchone()[0]
+        cur.close()
+        cache.put(key, total)
+    return total
+
+@on_data_reload
+def clear_facility_counts(conn=None):
+    if _counts is not None:
+        _counts.clear()
+
+def facility_count_stats() -> Dict:
+    return _counts.stats() if _counts is not None else {'entries': 0, 'hits': 0, 'misses': 0, 'hit_rate': 0.0}
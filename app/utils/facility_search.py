@@ -0,0 +1,63 @@
+# FACILITY NAME SEARCH (AUTOCOMPLETE) - TEXT RELEVANCE BLENDED WITH DISTANCE FROM THE USER
+import heapq
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from app.config import get_setting
+from app.utils.facility_index import get_facility_index
+from app.utils.geo import haversine_km
+from app.utils.text_index import TextIndex
+
+
+class FacilitySearchIndex:
+    """Facility names and common names over one facility index snapshot"""
+    def __init__(self, index, min_similarity: float = 0.3):
+        self.index = index
+        self.text = TextIndex(min_similarity)
+        for i, facility in enumerate(index.facilities):
+            self.text.add(facility['name'], i)
+            if facility.get('common_name'):
+                self.text.add(facility['common_name'], i)
+        self.text.build()
+
+    def search(self, query: str, limit: int = 10, lat: Optional[float] = None, lng: Optional[float] = None,
+               weight: float = 0.3, scale_km: float = 25.0,
+               **filters) -> List[Tuple[float, float, Optional[float], Dict]]:
+        """Top `limit` (score, text_score, distance_km, facility). With a location the score is
+        (1 - weight) * text_score + weight * scale_km / (scale_km + distance_km)"""
+        facilities = self.index.facilities
+        predicate = (lambda i: self.index.matches(facilities[i], **filters)) if any(filters.values()) else None
+        scores = self.text.scores(query, predicate)
+
+        biased = lat is not None and lng is not None
+        ranked = []
+        for i, text_score in scores.items():
+            facility = facilities[i]
+            if biased:
+                distance = haversine_km(lat, lng, float(facility['lat']), float(facility['lng']))
+                score = (1 - weight) * text_score + weight * scale_km / (scale_km + distance)
+            else:
+                distance, score = None, text_score
+            ranked.append((score, text_score, distance, i))
+
+        top = heapq.nsmallest(limit, ranked, key=lambda r: (-r[0], r[3]))
+        return [(score, text_score, distance, facilities[i]) for score, text_score, distance, i in top]
+
+
+_lock = threading.Lock()
+_search: Optional[FacilitySearchIndex] = None
+
+#SEARCH INDEX FOR THE CURRENT FACILITY SNAPSHOT (REBUILT WHEN A DATA RELOAD SWAPS THE INDEX)
+def get_facility_search(conn=None) -> Optional[FacilitySearchIndex]:
+    global _search
+    index = get_facility_index(conn)
+    if index is None:
+        return None
+    search = _search
+    if search is not None and search.index is index:
+        return search
+
+    with _lock:
+        if _search is None or _search.index is not index:
+            _search = FacilitySearchIndex(index, get_setting('GEOCODER_MIN_SIMILARITY'))
+        return _search
@@ -0,0 +1,24 @@
+# GEODESIC HELPERS SHARED BY THE IN-MEMORY INDEXES
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+
+#GREAT CIRCLE DISTANCE BETWEEN TWO POINTS
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+#LOWER BOUND ON DISTANCE FOR A GIVEN LATITUDE/LONGITUDE GAP (DEGREES)
+def min_distance_km(dlat: float, dlng: float, max_abs_lat: float) -> float:
+    """Smallest great circle distance between two points that are at least dlat degrees
+    apart in latitude or at least dlng degrees apart in longitude, when neither point
+    lies further than max_abs_lat degrees from the equator"""
+    by_lat = EARTH_RADIUS_KM * math.radians(max(dlat, 0.0))
+    cos_max = math.cos(math.radians(min(max_abs_lat, 90.0)))
+    s = cos_max * math.sin(math.radians(min(max(dlng, 0.0), 180.0)) / 2)
+    by_lng = 2 * EARTH_RADIUS_KM * math.asin(min(1.0, s))
+    return min(by_lat, by_lng)
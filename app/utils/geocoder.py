@@ -0,0 +1,153 @@
+# GEOCODER - KNOWN PLACES, DATABASE DISTRICTS AND FACILITY NAMES IN ONE IN-MEMORY TEXT INDEX
+import threading
+import time
+from typing import Dict, List, Optional
+
+from psycopg2.extras import RealDictCursor
+from app.config import get_setting
+from app.db import connection_scope
+from app.utils.data_version import current_data_version
+from app.utils.facility_index import get_facility_index
+from app.utils.text_index import TextIndex
+
+# ALL 28 DISTRICTS, THE MAJOR CITIES AND COMMON ALTERNATIVE SPELLINGS
+KNOWN_PLACES = {
+    # Major cities
+    'lilongwe': {'lat': -13.9626, 'lng': 33.7741, 'name': 'Lilongwe'},
+    'blantyre': {'lat': -15.7861, 'lng': 35.0058, 'name': 'Blantyre'},
+    'mzuzu': {'lat': -11.4597, 'lng': 34.0201, 'name': 'Mzuzu'},
+    'zomba': {'lat': -15.3860, 'lng': 35.3188, 'name': 'Zomba'},
+
+    # All 28 districts of Malawi
+    'balaka': {'lat': -14.9833, 'lng': 34.9500, 'name': 'Balaka'},
+    'blantyre district': {'lat': -15.7861, 'lng': 35.0058, 'name': 'Blantyre'},
+    'chikwawa': {'lat': -16.0369, 'lng': 34.7986, 'name': 'Chikwawa'},
+    'chiradzulu': {'lat': -15.6833, 'lng': 35.1333, 'name': 'Chiradzulu'},
+    'chitipa': {'lat': -9.7036, 'lng': 33.2697, 'name': 'Chitipa'},
+    'dedza': {'lat': -14.3779, 'lng': 34.3333, 'name': 'Dedza'},
+    'dowa': {'lat': -13.6500, 'lng': 33.9333, 'name': 'Dowa'},
+    'karonga': {'lat': -9.9333, 'lng': 33.9333, 'name': 'Karonga'},
+    'kasungu': {'lat': -13.0333, 'lng': 33.4833, 'name': 'Kasungu'},
+    'likoma': {'lat': -12.0583, 'lng': 34.7333, 'name': 'Likoma'},
+    'lilongwe district': {'lat': -13.9626, 'lng': 33.7741, 'name': 'Lilongwe'},
+    'machinga': {'lat': -14.9667, 'lng': 35.5167, 'name': 'Machinga'},
+    'mangochi': {'lat': -14.4784, 'lng': 35.2644, 'name': 'Mangochi'},
+    'mchinji': {'lat': -13.8000, 'lng': 32.9000, 'name': 'Mchinji'},
+    'mulanje': {'lat': -16.0167, 'lng': 35.5000, 'name': 'Mulanje'},
+    'mwanza': {'lat': -15.6103, 'lng': 34.5269, 'name': 'Mwanza'},
+    'mzimba': {'lat': -11.9000, 'lng': 33.6000, 'name': 'Mzimba'},
+    'neno': {'lat': -15.4000, 'lng': 34.6167, 'name': 'Neno'},
+    'nkhata bay': {'lat': -11.6061, 'lng': 34.2931, 'name': 'Nkhata Bay'},
+    'nkhotakota': {'lat': -12.9167, 'lng': 34.3000, 'name': 'Nkhotakota'},
+    'nsanje': {'lat': -16.9200, 'lng': 35.2628, 'name': 'Nsanje'},
+    'ntcheu': {'lat': -14.8167, 'lng': 34.6333, 'name': 'Ntcheu'},
+    'ntchisi': {'lat': -13.5167, 'lng': 33.9167, 'name': 'Ntchisi'},
+    'phalombe': {'lat': -15.8000, 'lng': 35.6500, 'name': 'Phalombe'},
+    'rumphi': {'lat': -10.8833, 'lng': 33.8500, 'name': 'Rumphi'},
+    'salima': {'lat': -13.7804, 'lng': 34.4360, 'name': 'Salima'},
+    'thyolo': {'lat': -16.0667, 'lng': 35.1333, 'name': 'Thyolo'},
+    'zomba district': {'lat': -15.3860, 'lng': 35.3188, 'name': 'Zomba'},
+
+    # Alternative spellings
+    'nkatabay': {'lat': -11.6061, 'lng': 34.2931, 'name': 'Nkhata Bay'},
+    'mzimba north': {'lat': -11.4000, 'lng': 33.6000, 'name': 'Mzimba'},
+    'mzimba south': {'lat': -12.2000, 'lng': 33.6000, 'name': 'Mzimba'},
+}
+
+DISTRICT_QUERY = """
+    SELECT
+        district,
+        AVG(latitude) as lat,
+        AVG(longitude) as lng,
+        COUNT(*) as facility_count
+    FROM malawi_health_facilities
+    WHERE district IS NOT NULL
+    AND latitude IS NOT NULL
+    AND longitude IS NOT NULL
+    GROUP BY district;
+"""
+
+# ON EQUAL TEXT SCORES A KNOWN PLACE WINS OVER A DATABASE DISTRICT, WHICH WINS OVER A FACILITY
+KIND_BONUS = {'place': 0.02, 'district': 0.01, 'facility': 0.0}
+
+
+class Geocoder:
+    def __init__(self, places: Dict[str, Dict], districts: List[Dict], facilities: List[Dict],
+                 min_similarity: float = 0.3, data_version: int = 0):
+        self.data_version = data_version
+        self.results: List[Dict] = []
+        self.text = TextIndex(min_similarity)
+
+        # ONE RESULT PER PLACE NAME AND POSITION, SEARCHABLE BY EVERY KEY THAT POINTS AT IT
+        # ("mzimba north" / "mzimba south" ARE NOT ALIASES OF "mzimba", SO THE DISPLAY NAME IS NOT INDEXED)
+        seen = {}
+        for key, place in places.items():
+            ident = (place['name'], place['lat'], place['lng'])
+            if ident not in seen:
+                seen[ident] = self._add({'name': place['name'], 'lat': place['lat'], 'lng': place['lng'],
+                                         'kind': 'place'})
+            self.text.add(key, seen[ident])
+
+        for row in districts:
+            self._add({'name': row['district'], 'lat': float(row['lat']), 'lng': float(row['lng']),
+                       'facility_count': row['facility_count'], 'kind': 'district'}, row['district'])
+
+        for f in facilities:
+            item = self._add({'name': f['name'], 'lat': float(f['lat']), 'lng': float(f['lng']),
+                              'facility_id': f['id'], 'district': f['district'], 'kind': 'facility'}, f['name'])
+            if f.get('common_name'):
+                self.text.add(f['common_name'], item)
+        self.text.build()
+
+    def _add(self, result: Dict, name: Optional[str] = None) -> int:
+        self.results.append(result)
+        if name:
+            self.text.add(name, len(self.results) - 1)
+        return len(self.results) - 1
+
+    def geocode(self, query: str, limit: int = 5, kinds: Optional[List[str]] = None) -> List[Dict]:
+        """Ranked matches, best first, each a copy of the result with its score"""
+        predicate = (lambda item: self.results[item]['kind'] in kinds) if kinds else None
+        ranked = sorted(
+            ((score + KIND_BONUS[self.results[item]['kind']], item)
+             for item, score in self.text.scores(query, predicate).items()),
+            key=lambda pair: (-pair[0], pair[1])
+        )
+        return [dict(self.results[item], score=round(score, 4)) for score, item in ranked[:limit]]
+
+
+def load_geocoder(conn) -> Geocoder:
+    started = time.perf_counter()
+    version = current_data_version()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur.execute(DISTRICT_QUERY)
+    districts = cur.fetchall()
+    cur.close()
+    conn.rollback()
+
+    index = get_facility_index(conn)
+    geocoder = Geocoder(KNOWN_PLACES, districts, index.facilities if index is not None else [],
+                        get_setting('GEOCODER_MIN_SIMILARITY'), version)
+    print(f"Geocoder index built: {len(geocoder.results)} places, {len(geocoder.text)} names "
+          f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return geocoder
+
+
+_geocoder: Optional[Geocoder] = None
+_lock = threading.Lock()
+
+#GET THE INDEX FOR THE CURRENT DATA VERSION (REBUILT ON THE FIRST LOOKUP AFTER A RELOAD)
+def get_geocoder(conn=None) -> Geocoder:
+    """Without a database connection only the known places are searchable, and the next call retries"""
+    global _geocoder
+    geocoder = _geocoder
+    if geocoder is not None and geocoder.data_version == current_data_version():
+        return geocoder
+
+    with _lock:
+        if _geocoder is None or _geocoder.data_version != current_data_version():
+            with connection_scope(conn) as db:
+                if db is None:
+                    return Geocoder(KNOWN_PLACES, [], [], get_setting('GEOCODER_MIN_SIMILARITY'), -1)
+                _geocoder = load_geocoder(db)
+        return _geocoder
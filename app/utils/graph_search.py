@@ -0,0 +1,324 @@
+# SHORTEST PATH SEARCHES OVER THE IN-MEMORY ROAD GRAPH
+import heapq
+import random
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from app.utils.contraction import get_contraction_hierarchy
+from app.utils.geo import haversine_km
+
+INF = float('inf')
+MATRIX_METRICS = ('distance', 'time')   # WHAT A MATRIX SEARCH MINIMISES - SHORTEST OR FASTEST PATH
+
+
+class SearchResult(NamedTuple):
+    arcs: List[int]      # ARCS OF THE PATH IN TRAVEL ORDER
+    cost: float          # TOTAL PATH COST
+    settled: int         # NODES POPPED FROM THE QUEUE
+
+
+def _unwind(graph, pred_arc: Dict[int, int], source: int, target: int) -> List[int]:
+    arcs = []
+    node = target
+    while node != source:
+        a = pred_arc[node]
+        arcs.append(a)
+        node = graph.arc_tail(a)
+    arcs.reverse()
+    return arcs
+
+#PLAIN DIJKSTRA WITH EARLY EXIT WHEN THE TARGET IS SETTLED
+def dijkstra(graph, source: int, target: int) -> Optional[SearchResult]:
+    offsets, heads, weights = graph.offsets, graph.arc_head, graph.arc_weight
+    dist = {source: 0.0}
+    pred_arc = {}
+    settled = set()
+    heap = [(0.0, source)]
+
+    while heap:
+        d, u = heapq.heappop(heap)
+        if u in settled:
+            continue
+        settled.add(u)
+        if u == target:
+            return SearchResult(_unwind(graph, pred_arc, source, target), d, len(settled))
+
+        for a in range(offsets[u], offsets[u + 1]):
+            v = heads[a]
+            nd = d + weights[a]
+            if nd < dist.get(v, INF):
+                dist[v] = nd
+                pred_arc[v] = a
+                heapq.heappush(heap, (nd, v))
+
+    return None
+
+#A* WITH A STRAIGHT-LINE LOWER BOUND ON THE REMAINING COST
+def astar(graph, source: int, target: int) -> Optional[SearchResult]:
+    offsets, heads, weights = graph.offsets, graph.arc_head, graph.arc_weight
+    lats, lngs = graph.node_lat, graph.node_lng
+    scale = graph.heuristic_scale()
+    t_lat, t_lng = lats[target], lngs[target]
+
+    def h(v):
+        return scale * haversine_km(lats[v], lngs[v], t_lat, t_lng)
+
+    dist = {source: 0.0}
+    pred_arc = {}
+    settled = set()
+    heap = [(h(source), 0.0, source)]
+
+    while heap:
+        _, d, u = heapq.heappop(heap)
+        if u in settled:
+            continue
+        settled.add(u)
+        if u == target:
+            return SearchResult(_unwind(graph, pred_arc, source, target), d, len(settled))
+
+        for a in range(offsets[u], offsets[u + 1]):
+            v = heads[a]
+            nd = d + weights[a]
+            if nd < dist.get(v, INF):
+                dist[v] = nd
+                pred_arc[v] = a
+                heapq.heappush(heap, (nd + h(v), nd, v))
+
+    return None
+
+#BIDIRECTIONAL DIJKSTRA - FORWARD FROM THE SOURCE, BACKWARD FROM THE TARGET OVER INCOMING ARCS
+def bidirectional_dijkstra(graph, source: int, target: int) -> Optional[SearchResult]:
+    if source == target:
+        return SearchResult([], 0.0, 1)
+
+    f_offsets, f_heads, f_weights = graph.offsets, graph.arc_head, graph.arc_weight
+    b_offsets, b_tails, b_arcs = graph.reverse_adjacency()
+
+    dist = ({source: 0.0}, {target: 0.0})
+    pred_arc = ({}, {})
+    settled = (set(), set())
+    heaps = ([(0.0, source)], [(0.0, target)])
+    best, meeting = INF, None
+
+    while heaps[0] and heaps[1]:
+        # STOP ONCE NO UNSETTLED PAIR OF LABELS CAN BEAT THE BEST MEETING POINT
+        if heaps[0][0][0] + heaps[1][0][0] >= best:
+            break
+
+        side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+        d, u = heapq.heappop(heaps[side])
+        if u in settled[side]:
+            continue
+        settled[side].add(u)
+
+        this_dist, other_dist = dist[side], dist[1 - side]
+        if side == 0:
+            arcs = ((f_heads[a], f_weights[a], a) for a in range(f_offsets[u], f_offsets[u + 1]))
+        else:
+            arcs = ((b_tails[i], f_weights[b_arcs[i]], b_arcs[i]) for i in range(b_offsets[u], b_offsets[u + 1]))
+
+        for v, w, a in arcs:
+            nd = d + w
+            if nd < this_dist.get(v, INF):
+                this_dist[v] = nd
+                pred_arc[side][v] = a
+                heapq.heappush(heaps[side], (nd, v))
+            total = this_dist[v] + other_dist.get(v, INF)
+            if total < best:
+                best, meeting = total, v
+
+    if meeting is None:
+        return None
+
+    arcs = _unwind(graph, pred_arc[0], source, meeting)
+    node = meeting
+    while node != target:
+        a = pred_arc[1][node]
+        arcs.append(a)
+        node = graph.arc_head[a]
+    return SearchResult(arcs, best, len(settled[0]) + len(settled[1]))
+
+#CONTRACTION HIERARCHY QUERY (FALLS BACK TO BIDIRECTIONAL DIJKSTRA WHEN NO HIERARCHY MATCHES THE GRAPH)
+def contraction_hierarchy(graph, source: int, target: int) -> Optional[SearchResult]:
+    hierarchy = get_contraction_hierarchy(graph)
+    if hierarchy is None:
+        return bidirectional_dijkstra(graph, source, target)
+    found = hierarchy.query(source, target)
+    if found is None:
+        return None
+    cost, arcs, settled = found
+    return SearchResult(arcs, cost, settled)
+
+#ONE-TO-MANY DIJKSTRA - ONE SEARCH SETTLES EVERY TARGET (reverse=True SEARCHES MANY-TO-ONE OVER INCOMING ARCS)
+def one_to_many(graph, source: int, targets, reverse: bool = False,
+                metric: str = 'distance') -> Dict[int, Tuple[float, float]]:
+    """Return {target: (km, minutes)} for every reachable target along the path minimising metric
+    ('distance' = shortest path in km, 'time' = fastest path in minutes); the other value accumulates along it"""
+    if metric not in MATRIX_METRICS:
+        raise ValueError(f'Unknown matrix metric: {metric}')
+    weights, minutes = graph.arc_weight, graph.arc_minutes()
+    primary, secondary = (minutes, weights) if metric == 'time' else (weights, minutes)
+    if reverse:
+        offsets, nodes, arc_ids = graph.reverse_adjacency()
+    else:
+        offsets, nodes, arc_ids = graph.offsets, graph.arc_head, None
+
+    remaining = set(targets)
+    found = {}
+    dist = {source: 0.0}
+    other = {source: 0.0}
+    settled = set()
+    heap = [(0.0, source)]
+
+    while heap and remaining:
+        d, u = heapq.heappop(heap)
+        if u in settled:
+            continue
+        settled.add(u)
+        if u in remaining:
+            found[u] = (other[u], d) if metric == 'time' else (d, other[u])
+            remaining.discard(u)
+
+        o = other[u]
+        for i in range(offsets[u], offsets[u + 1]):
+            a = arc_ids[i] if reverse else i
+            v = nodes[i]
+            nd = d + primary[a]
+            if nd < dist.get(v, INF):
+                dist[v] = nd
+                other[v] = o + secondary[a]
+                heapq.heappush(heap, (nd, v))
+
+    return found
+
+#MANY-TO-MANY COST MATRIX - ONE SEARCH PER DISTINCT NODE ON THE SMALLER SIDE
+def cost_matrix(graph, sources: List[int], targets: List[int],
+                metric: str = 'distance') -> Tuple[List[List[Optional[float]]], List[List[Optional[float]]]]:
+    """Return (km, minutes) as len(sources) x len(targets) lists along the paths minimising metric, None where unreachable"""
+    costs = [[None] * len(targets) for _ in sources]
+    minutes = [[None] * len(targets) for _ in sources]
+
+    rows, cols = {}, {}
+    for i, s in enumerate(sources):
+        rows.setdefault(s, []).append(i)
+    for j, t in enumerate(targets):
+        cols.setdefault(t, []).append(j)
+
+    if len(rows) <= len(cols):
+        for s, row_ids in rows.items():
+            for t, (cost, mins) in one_to_many(graph, s, cols, metric=metric).items():
+                for i in row_ids:
+                    for j in cols[t]:
+                        costs[i][j], minutes[i][j] = cost, mins
+    else:
+        for t, col_ids in cols.items():
+            for s, (cost, mins) in one_to_many(graph, t, rows, reverse=True, metric=metric).items():
+                for j in col_ids:
+                    for i in rows[s]:
+                        costs[i][j], minutes[i][j] = cost, mins
+
+    return costs, minutes
+
+
+SEARCH_ALGORITHMS = {
+    'dijkstra': dijkstra,
+    'astar': astar,
+    'bidirectional': bidirectional_dijkstra,
+    'ch': contraction_hierarchy
+}
+
+_counters_lock = threading.Lock()
+_counters = {name: {'queries': 0, 'settled_nodes': 0, 'search_ms': 0.0} for name in SEARCH_ALGORITHMS}
+
+#RUN A SEARCH BY NAME AND RECORD HOW MUCH OF THE GRAPH IT EXPLORED
+def shortest_path(graph, source: int, target: int, algorithm: str = 'dijkstra',
+                  stats: Optional[Dict] = None) -> Optional[SearchResult]:
+    search = SEARCH_ALGORITHMS.get(algorithm)
+    if search is None:
+        raise ValueError(f'Unknown routing algorithm: {algorithm}')
+
+    started = time.perf_counter()
+    result = search(graph, source, target)
+    record_search(algorithm, result.settled if result else 0, (time.perf_counter() - started) * 1000, stats)
+    return result
+
+#ADD ONE SEARCH TO THE COUNTERS (ALSO CALLED FOR SEARCHES RUN BY ROUTING WORKER PROCESSES)
+def record_search(algorithm: str, settled: int, elapsed_ms: float, stats: Optional[Dict] = None):
+    with _counters_lock:
+        counter = _counters[algorithm]
+        counter['queries'] += 1
+        counter['settled_nodes'] += settled
+        counter['search_ms'] += elapsed_ms
+
+    if stats is not None:
+        stats.update({
+            'algorithm': algorithm,
+            'settled_nodes': settled,
+            'search_ms': round(elapsed_ms, 3)
+        })
+
+def search_counters() -> Dict:
+    with _counters_lock:
+        return {
+            name: {
+                'queries': c['queries'],
+                'avg_settled_nodes': round(c['settled_nodes'] / c['queries'], 1) if c['queries'] else 0,
+                'avg_search_ms': round(c['search_ms'] / c['queries'], 3) if c['queries'] else 0
+            }
+            for name, c in _counters.items()
+        }
+
+#COMPARE CONTRACTION HIERARCHY ANSWERS WITH PLAIN DIJKSTRA ON RANDOM NODE PAIRS
+def verify_contraction_hierarchy(graph, hierarchy, pairs: int = 200, seed: int = 0,
+                                 tolerance: float = 1e-6) -> Dict:
+    rng = random.Random(seed)
+    mismatches = []
+    settled = {'dijkstra': 0, 'ch': 0}
+    elapsed = {'dijkstra': 0.0, 'ch': 0.0}
+
+    for _ in range(pairs):
+        s, t = rng.randrange(graph.node_count), rng.randrange(graph.node_count)
+
+        started = time.perf_counter()
+        expected = dijkstra(graph, s, t)
+        elapsed['dijkstra'] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        found = hierarchy.query(s, t)
+        elapsed['ch'] += time.perf_counter() - started
+
+        if expected is not None:
+            settled['dijkstra'] += expected.settled
+        if found is not None:
+            settled['ch'] += found[2]
+
+        problem = None
+        if (expected is None) != (found is None):
+            problem = 'reachability differs'
+        elif expected is not None:
+            cost, arcs, _ = found
+            path_cost = sum(graph.arc_weight[a] for a in arcs)
+            node = s
+            for a in arcs:
+                if graph.arc_tail(a) != node:
+                    problem = 'unpacked path is not contiguous'
+                    break
+                node = graph.arc_head[a]
+            if problem is None:
+                if node != t:
+                    problem = 'unpacked path does not end at the target'
+                elif abs(cost - expected.cost) > tolerance * max(1.0, expected.cost):
+                    problem = f'cost {cost} != {expected.cost}'
+                elif abs(path_cost - cost) > tolerance * max(1.0, cost):
+                    problem = f'unpacked path costs {path_cost}, query reported {cost}'
+        if problem:
+            mismatches.append({'source': int(graph.node_ids[s]), 'target': int(graph.node_ids[t]), 'problem': problem})
+
+    return {
+        'pairs': pairs,
+        'mismatches': len(mismatches),
+        'examples': mismatches[:10],
+        'avg_settled': {name: round(count / pairs, 1) for name, count in settled.items()},
+        'avg_ms': {name: round(seconds * 1000 / pairs, 3) for name, seconds in elapsed.items()}
+    }
@@ -0,0 +1,78 @@
+# UNIFORM LAT/LNG GRID FOR K-NEAREST QUERIES WITH EXACT HAVERSINE RANKING
+import heapq
+import math
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.utils.geo import haversine_km, min_distance_km
+
+
+class GridIndex:
+    def __init__(self, lats: Sequence[float], lngs: Sequence[float], cell_size: float = 0.1):
+        self.lats = lats
+        self.lngs = lngs
+        self.cell_size = cell_size
+
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        for i in range(len(lats)):
+            self.cells.setdefault(self.cell(lats[i], lngs[i]), []).append(i)
+
+        rows = [cell[0] for cell in self.cells] or [0]
+        cols = [cell[1] for cell in self.cells] or [0]
+        self.min_row, self.max_row = min(rows), max(rows)
+        self.min_col, self.max_col = min(cols), max(cols)
+        self.max_abs_lat = max((abs(lat) for lat in lats), default=0.0)
+
+    def __len__(self):
+        return len(self.lats)
+
+    def cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def _ring(self, ci: int, cj: int, r: int):
+        # CELLS AT CHEBYSHEV DISTANCE r FROM (ci, cj), CLIPPED TO THE OCCUPIED GRID
+        for row in range(max(ci - r, self.min_row), min(ci + r, self.max_row) + 1):
+            if row == ci - r or row == ci + r:
+                for col in range(max(cj - r, self.min_col), min(cj + r, self.max_col) + 1):
+                    yield (row, col)
+            else:
+                if self.min_col <= cj - r <= self.max_col:
+                    yield (row, cj - r)
+                if r and self.min_col <= cj + r <= self.max_col:
+                    yield (row, cj + r)
+
+    def nearest(self, lat: float, lng: float, k: int = 1,
+                predicate: Optional[Callable[[int], bool]] = None,
+                max_km: Optional[float] = None) -> List[Tuple[float, int]]:
+        """Return up to k (distance_km, point index) pairs ordered by great circle distance"""
+        if not self.cells or k < 1:
+            return []
+
+        ci, cj = self.cell(lat, lng)
+        cs = self.cell_size
+        max_abs_lat = max(self.max_abs_lat, abs(lat))
+        max_r = max(abs(ci - self.min_row), abs(ci - self.max_row),
+                    abs(cj - self.min_col), abs(cj - self.max_col))
+        limit = max_km if max_km is not None else math.inf
+
+        heap = []  # MAX HEAP OF THE BEST CANDIDATES SO FAR: (-distance, index)
+        for r in range(max_r + 1):
+            for cell in self._ring(ci, cj, r):
+                for i in self.cells.get(cell, ()):
+                    if predicate is not None and not predicate(i):
+                        continue
+                    d = haversine_km(lat, lng, self.lats[i], self.lngs[i])
+                    if d > limit:
+                        continue
+                    if len(heap) < k:
+                        heapq.heappush(heap, (-d, i))
+                    elif d < -heap[0][0]:
+                        heapq.heapreplace(heap, (-d, i))
+
+            # EVERYTHING NOT YET SCANNED LIES OUTSIDE THE SEARCHED BLOCK OF CELLS
+            dlat = min(lat - (ci - r) * cs, (ci + r + 1) * cs - lat)
+            dlng = min(lng - (cj - r) * cs, (cj + r + 1) * cs - lng)
+            bound = min_distance_km(dlat, dlng, max_abs_lat)
+            if bound > limit or (len(heap) == k and -heap[0][0] <= bound):
+                break
+
+        return sorted((-neg_d, i) for neg_d, i in heap)
@@ -0,0 +1,58 @@
+# FASTER JSON FOR API RESPONSES - orjson WHEN INSTALLED, FLASK'S STDLIB ENCODER OTHERWISE
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Drop-in replacement for Flask's provider. Output matches the default one (sorted keys,
+    compact unless debug, dates as HTTP dates, Decimal as string) but encodes straight to bytes"""
+
+    def _options(self, indent=None, sort_keys=None) -> int:
+        # DATETIMES GO THROUGH default() SO THEY KEEP FLASK'S HTTP DATE FORMAT
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys if sort_keys is None else sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps_bytes(self, obj, indent=None) -> bytes:
+        if orjson is None:
+            return super().dumps(obj, indent=indent, separators=None if indent else (',', ':')).encode()
+        return orjson.dumps(obj, default=self.default, option=self._options(indent))
+
+    def dumps(self, obj, **kwargs) -> str:
+        if orjson is None or set(kwargs) - {'indent', 'separators', 'sort_keys'}:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default,
+                            option=self._options(kwargs.get('indent'), kwargs.get('sort_keys'))).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = 2 if (self.compact is None and self._app.debug) or self.compact is False else None
+        return self._app.response_class(self.dumps_bytes(obj, indent) + b'\n', mimetype=self.mimetype)
+
+
+JSON_PROVIDERS = {
+    'fast': FastJSONProvider,
+    'default': DefaultJSONProvider
+}
+
+#INSTALL THE CONFIGURED PROVIDER (JSON_PROVIDER=fast|default) ON THE APP
+def init_json_provider(app):
+    name = app.config.get('JSON_PROVIDER', 'fast')
+    if name not in JSON_PROVIDERS:
+        raise ValueError(f'Unknown JSON_PROVIDER "{name}". Use one of: {", ".join(JSON_PROVIDERS)}')
+    if name == 'fast' and orjson is None:
+        print("orjson is not installed, FastJSONProvider falls back to the standard library encoder")
+    app.json = JSON_PROVIDERS[name](app)
+    return app.json
@@ -0,0 +1,315 @@
+# NETWORK VORONOI - THE k NEAREST FUNCTIONAL FACILITIES BY TRAVEL TIME FOR EVERY ROAD NODE
+import heapq
+import threading
+import time
+from array import array
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from app.config import get_setting
+from app.utils.data_version import on_data_reload
+from app.utils.facility_index import get_facility_index
+from app.utils.node_snapper import get_facility_nodes, get_node_snapper
+from app.utils.routing_helpers import snap_limit_km
+
+INF = float('inf')
+
+
+#k LABELS PER NODE IN FLAT ARRAYS (SLOT u*k + j), EACH ROW SORTED BY TRAVEL TIME
+class NetworkVoronoi:
+    def __init__(self, graph, k: int, sources: Dict[int, int],
+                 facility=None, minutes=None, km=None, nodes_of=None):
+        self.graph = graph
+        self.k = k
+        self.sources = sources    # {facility_id: graph node index}
+        size = graph.node_count * k
+        self.facility = facility if facility is not None else array('q', [-1]) * size
+        self.minutes = minutes if minutes is not None else array('d', [INF]) * size
+        self.km = km if km is not None else array('d', [INF]) * size
+        # {facility_id: nodes listing it} - BUILT BY THE FIRST remove_facility, THEN KEPT IN STEP BY EVERY ROW CHANGE
+        self._nodes_of: Optional[Dict[int, Set[int]]] = nodes_of
+
+    def copy(self) -> 'NetworkVoronoi':
+        nodes_of = {f: set(nodes) for f, nodes in self._nodes_of.items()} if self._nodes_of is not None else None
+        return NetworkVoronoi(self.graph, self.k, dict(self.sources),
+                              array('q', self.facility), array('d', self.minutes), array('d', self.km), nodes_of)
+
+    def _nodes_listing(self, facility_id: int) -> Set[int]:
+        if self._nodes_of is None:
+            nodes_of = {}
+            k = self.k
+            for i, f in enumerate(self.facility):
+                if f >= 0:
+                    nodes_of.setdefault(f, set()).add(i // k)
+            self._nodes_of = nodes_of
+        return self._nodes_of.get(facility_id, set())
+
+    def _listed(self, u: int, facility_id: int):
+        if self._nodes_of is not None:
+            self._nodes_of.setdefault(facility_id, set()).add(u)
+
+    def _unlisted(self, u: int, facility_id: int):
+        if self._nodes_of is not None:
+            nodes = self._nodes_of.get(facility_id)
+            if nodes is not None:
+                nodes.discard(u)
+                if not nodes:
+                    del self._nodes_of[facility_id]
+
+    def labels(self, u: int) -> List[Tuple[float, float, int]]:
+        """(minutes, km, facility_id) from node u to its nearest facilities, fastest first"""
+        base = u * self.k
+        return [(self.minutes[i], self.km[i], self.facility[i])
+                for i in range(base, base + self.k) if self.facility[i] >= 0]
+
+    def _count(self, u: int) -> int:
+        base = u * self.k
+        for j in range(self.k):
+            if self.facility[base + j] < 0:
+                return j
+        return self.k
+
+    def _has(self, u: int, facility_id: int) -> bool:
+        base = u * self.k
+        return facility_id in self.facility[base:base + self.k]
+
+    def _insert(self, u: int, facility_id: int, t: float, km: float):
+        # KEEP THE ROW SORTED; A FULL ROW DROPS ITS SLOWEST LABEL
+        base, k = u * self.k, self.k
+        j = self._count(u)
+        if j == k:
+            j = k - 1
+            self._unlisted(u, self.facility[base + j])
+        while j > 0 and self.minutes[base + j - 1] > t:
+            self.facility[base + j] = self.facility[base + j - 1]
+            self.minutes[base + j] = self.minutes[base + j - 1]
+            self.km[base + j] = self.km[base + j - 1]
+            j -= 1
+        self.facility[base + j], self.minutes[base + j], self.km[base + j] = facility_id, t, km
+        self._listed(u, facility_id)
+
+    def _drop(self, u: int, facility_id: int):
+        base, k = u * self.k, self.k
+        row = [(self.minutes[i], self.km[i], self.facility[i])
+               for i in range(base, base + k) if self.facility[i] >= 0 and self.facility[i] != facility_id]
+        for j in range(k):
+            t, km, f = row[j] if j < len(row) else (INF, INF, -1)
+            self.facility[base + j], self.minutes[base + j], self.km[base + j] = f, t, km
+        self._unlisted(u, facility_id)
+
+    #MULTI-SOURCE DIJKSTRA OVER INCOMING ARCS - EVERY NODE KEEPS THE FIRST k DISTINCT FACILITIES THAT REACH IT
+    def build(self):
+        graph, k = self.graph, self.k
+        rev_offsets, rev_tail, rev_arc = graph.reverse_adjacency()
+        arc_minutes, arc_km = graph.arc_minutes(), graph.arc_weight
+        count = bytearray(graph.node_count)
+        self._nodes_of = None
+
+        heap = [(0.0, 0.0, node, facility_id) for facility_id, node in self.sources.items()]
+        heapq.heapify(heap)
+        while heap:
+            t, km, u, f = heapq.heappop(heap)
+            c = count[u]
+            if c >= k or self._has(u, f):
+                continue
+            slot = u * k + c
+            self.facility[slot], self.minutes[slot], self.km[slot] = f, t, km
+            count[u] = c + 1
+
+            for i in range(rev_offsets[u], rev_offsets[u + 1]):
+                x = rev_tail[i]
+                if count[x] < k:
+                    a = rev_arc[i]
+                    heapq.heappush(heap, (t + arc_minutes[a], km + arc_km[a], x, f))
+        return self
+
+    #INCREMENTAL: A NEW FACILITY ONLY SPREADS WHILE IT BEATS THE SLOWEST LABEL OF THE NODES IT REACHES
+    def add_facility(self, facility_id: int, node: int) -> int:
+        graph, k = self.graph, self.k
+        rev_offsets, rev_tail, rev_arc = graph.reverse_adjacency()
+        arc_minutes, arc_km = graph.arc_minutes(), graph.arc_weight
+
+        self.sources[facility_id] = node
+        best = {node: 0.0}
+        heap = [(0.0, 0.0, node)]
+        changed = 0
+        while heap:
+            t, km, u = heapq.heappop(heap)
+            if t > best[u]:
+                continue
+            if self._count(u) == k and t >= self.minutes[u * k + k - 1]:
+                continue
+            self._insert(u, facility_id, t, km)
+            changed += 1
+
+            for i in range(rev_offsets[u], rev_offsets[u + 1]):
+                x = rev_tail[i]
+                a = rev_arc[i]
+                nt = t + arc_minutes[a]
+                if nt < best.get(x, INF):
+                    best[x] = nt
+                    heapq.heappush(heap, (nt, km + arc_km[a], x))
+        return changed
+
+    #INCREMENTAL: NODES THAT LISTED THE FACILITY REFILL THEIR FREED SLOT FROM THEIR NEIGHBOURS' LABELS
+    def remove_facility(self, facility_id: int) -> int:
+        graph, k = self.graph, self.k
+        self.sources.pop(facility_id, None)
+        affected = set(self._nodes_listing(facility_id))
+        if not affected:
+            return 0
+        for u in affected:
+            self._drop(u, facility_id)
+
+        offsets, heads = graph.offsets, graph.arc_head
+        rev_offsets, rev_tail, rev_arc = graph.reverse_adjacency()
+        arc_minutes, arc_km = graph.arc_minutes(), graph.arc_weight
+
+        heap = []
+        for u in affected:
+            for a in range(offsets[u], offsets[u + 1]):
+                for t, km, g in self.labels(heads[a]):
+                    if not self._has(u, g):
+                        heap.append((t + arc_minutes[a], km + arc_km[a], u, g))
+        heapq.heapify(heap)
+
+        while heap:
+            t, km, u, g = heapq.heappop(heap)
+            if self._count(u) >= k or self._has(u, g):
+                continue
+            self._insert(u, g, t, km)
+
+            for i in range(rev_offsets[u], rev_offsets[u + 1]):
+                x = rev_tail[i]
+                if x in affected:
+                    a = rev_arc[i]
+                    heapq.heappush(heap, (t + arc_minutes[a], km + arc_km[a], x, g))
+        return len(affected)
+
+
+#ON-DEMAND SEARCH FOR FILTERS THE TABLE DOES NOT COVER - FORWARD DIJKSTRA UNTIL `limit` MATCHES ARE SETTLED
+def search_nearest_by_time(graph, source: int, limit: int, facilities_at: Dict[int, List[Dict]],
+                           predicate: Callable[[Dict], bool]) -> List[Tuple[float, float, Dict]]:
+    offsets, heads = graph.offsets, graph.arc_head
+    arc_minutes, arc_km = graph.arc_minutes(), graph.arc_weight
+    found = []
+    best = {source: 0.0}
+    heap = [(0.0, 0.0, source)]
+    while heap and len(found) < limit:
+        t, km, u = heapq.heappop(heap)
+        if t > best[u]:
+            continue
+        for facility in facilities_at.get(u, ()):
+            if predicate(facility):
+                found.append((t, km, facility))
+        for a in range(offsets[u], offsets[u + 1]):
+            v = heads[a]
+            nt = t + arc_minutes[a]
+            if nt < best.get(v, INF):
+                best[v] = nt
+                heapq.heappush(heap, (nt, km + arc_km[a], v))
+    return found[:limit]
+
+
+def _functional_sources(graph, index, facility_nodes: Dict[int, Optional[int]]) -> Dict[int, int]:
+    sources = {}
+    for facility in index.facilities:
+        node = facility_nodes.get(facility['id'])
+        if facility['status'] == 'Functional' and node is not None:
+            sources[facility['id']] = graph.node_index[node]
+    return sources
+
+
+_lock = threading.Lock()
+_table: Optional[NetworkVoronoi] = None
+
+def _build_table(graph, index, conn=None) -> NetworkVoronoi:
+    started = time.perf_counter()
+    sources = _functional_sources(graph, index, get_facility_nodes(conn))
+    table = NetworkVoronoi(graph, get_setting('NEAREST_TRAVEL_TIME_K'), sources).build()
+    print(f"Network voronoi built: {len(sources)} facilities, k={table.k} "
+          f"in {time.perf_counter() - started:.1f}s")
+    return table
+
+#TABLE FOR THE CURRENT ROAD GRAPH, BUILT ON FIRST USE (OR AT STARTUP)
+def get_network_voronoi(conn=None) -> Optional[NetworkVoronoi]:
+    global _table
+    snapper = get_node_snapper(conn)
+    if snapper is None:
+        return None
+    table = _table
+    if table is not None and table.graph is snapper.graph:
+        return table
+
+    with _lock:
+        if _table is None or _table.graph is not snapper.graph:
+            index = get_facility_index(conn)
+            if index is None:
+                return None
+            _table = _build_table(snapper.graph, index, conn)
+        return _table
+
+#APPLY FACILITY STATUS / LOCATION CHANGES INCREMENTALLY AFTER A DATA RELOAD (RUNS AFTER THE INDEX REFRESH);
+#A MISSING TABLE OR A NEW ROAD GRAPH IS BUILT HERE, SO THE NEXT REQUEST DOES NOT PAY FOR IT
+@on_data_reload
+def update_network_voronoi(conn=None) -> Optional[NetworkVoronoi]:
+    global _table
+    table = _table
+    snapper = get_node_snapper(conn)
+    index = get_facility_index(conn)
+    if snapper is None or index is None:
+        return None
+    if table is None or table.graph is not snapper.graph:
+        updated = _build_table(snapper.graph, index, conn)
+        with _lock:
+            if _table is table:
+                _table = updated
+        return updated
+
+    sources = _functional_sources(table.graph, index, get_facility_nodes(conn))
+    removed = [f for f, node in table.sources.items() if sources.get(f) != node]
+    added = [f for f, node in sources.items() if table.sources.get(f) != node]
+    if not removed and not added:
+        return table
+
+    started = time.perf_counter()
+    if len(removed) + len(added) > max(50, len(sources) // 20):
+        updated = NetworkVoronoi(table.graph, table.k, sources).build()
+    else:
+        updated = table.copy()
+        for facility_id in removed:
+            updated.remove_facility(facility_id)
+        for facility_id in added:
+            updated.add_facility(facility_id, sources[facility_id])
+
+    with _lock:
+        if _table is table:
+            _table = updated
+    print(f"Network voronoi updated: -{len(removed)} +{len(added)} facilities "
+          f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return updated
+
+#k NEAREST FACILITIES BY ROAD TRAVEL TIME: [(minutes, km, facility)]
+def nearest_by_travel_time(lat: float, lng: float, limit: int = 5, conn=None,
+                           **filters) -> Optional[List[Tuple[float, float, Dict]]]:
+    snapper = get_node_snapper(conn)
+    index = get_facility_index(conn)
+    if snapper is None or index is None:
+        return None
+    # NO ROAD NODE WITHIN ROUTING_SNAP_MAX_DISTANCE MEANS NO FACILITY IS REACHABLE BY ROAD
+    node = snapper.snap(lat, lng, max_km=snap_limit_km())
+    if node is None:
+        return []
+    u = snapper.graph.node_index[node]
+
+    # THE TABLE HOLDS FUNCTIONAL FACILITIES ONLY; OTHER FILTERS OR LARGER LIMITS SEARCH ON DEMAND
+    table = get_network_voronoi(conn)
+    plain = filters.get('functional_only') and not any(v for key, v in filters.items() if key != 'functional_only')
+    if table is not None and plain and limit <= table.k:
+        return [(t, km, index.by_id[f]) for t, km, f in table.labels(u)[:limit] if f in index.by_id]
+
+    facilities_at = {}
+    for facility_id, facility_node in get_facility_nodes(conn).items():
+        if facility_node is not None and facility_id in index.by_id:
+            facilities_at.setdefault(snapper.graph.node_index[facility_node], []).append(index.by_id[facility_id])
+    return search_nearest_by_time(snapper.graph, u, limit, facilities_at,
+                                  lambda facility: index.matches(facility, **filters))
@@ -0,0 +1,123 @@
+# SNAP COORDINATES TO ROAD NODES IN MEMORY (GRID INDEX + QUANTIZED LRU CACHE OF CANDIDATE NODES)
+import math
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.config import get_setting
+from app.utils.facility_index import get_facility_index
+from app.utils.geo import EARTH_RADIUS_KM, haversine_km
+from app.utils.grid_index import GridIndex
+from app.utils.road_graph import get_road_graph
+
+
+class NodeSnapper:
+    def __init__(self, graph, cell_size: float = 0.02, precision: int = 4, cache_size: int = 50000):
+        self.graph = graph
+        self.precision = precision
+        self.grid = GridIndex(graph.node_lat, graph.node_lng, cell_size)
+        # A POINT LIES WITHIN THIS MANY KM OF ITS ROUNDED KEY (HALF THE DIAGONAL OF A KEY CELL)
+        self.key_radius_km = math.radians(0.5 * 10 ** -precision) * EARTH_RADIUS_KM * math.sqrt(2)
+        self._snap_key = lru_cache(maxsize=cache_size)(self._candidates)
+
+    def _candidates(self, lat: float, lng: float) -> Tuple[int, ...]:
+        # EVERY NODE THAT CAN BE NEAREST TO SOME POINT OF THE KEY CELL: WITHIN (NEAREST TO THE KEY) + 2 * RADIUS
+        found = self.grid.nearest(lat, lng, 1)
+        if not found:
+            return ()
+        reach = found[0][0] + 2 * self.key_radius_km
+        return tuple(i for _, i in self.grid.nearest(lat, lng, len(self.grid), max_km=reach))
+
+    def key(self, lat: float, lng: float) -> Tuple[float, float]:
+        # POINTS IN THE SAME ~10 M CELL (PRECISION 4) SHARE ONE CACHE ENTRY
+        return (round(float(lat), self.precision), round(float(lng), self.precision))
+
+    def _nearest(self, lat: float, lng: float, candidates: Tuple[int, ...],
+                 max_km: Optional[float]) -> Optional[int]:
+        # THE CACHED CANDIDATES ARE RANKED AGAINST THE EXACT POINT, NOT THE ROUNDED KEY
+        lat, lng = float(lat), float(lng)
+        best, best_km = None, math.inf
+        for i in candidates:
+            d = haversine_km(lat, lng, self.graph.node_lat[i], self.graph.node_lng[i])
+            if d < best_km:
+                best, best_km = i, d
+        if best is None or (max_km is not None and best_km > max_km):
+            return None
+        return int(self.graph.node_ids[best])
+
+    def snap(self, lat: float, lng: float, max_km: Optional[float] = None) -> Optional[int]:
+        return self._nearest(lat, lng, self._snap_key(*self.key(lat, lng)), max_km)
+
+    def snap_many(self, points: Iterable[Tuple[float, float]], max_km: Optional[float] = None) -> List[Optional[int]]:
+        """Snap many (lat, lng) points in one call, looking up each distinct cell once"""
+        points = list(points)
+        keys = [self.key(lat, lng) for lat, lng in points]
+        resolved = {key: self._snap_key(*key) for key in set(keys)}
+        return [self._nearest(lat, lng, resolved[key], max_km) for (lat, lng), key in zip(points, keys)]
+
+    def cache_stats(self) -> Dict:
+        info = self._snap_key.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            'hits': info.hits,
+            'misses': info.misses,
+            'hit_rate': round(info.hits / lookups, 4) if lookups else 0.0,
+            'size': info.currsize,
+            'max_size': info.maxsize
+        }
+
+
+_lock = threading.Lock()
+_snapper: Optional[NodeSnapper] = None
+_facility_nodes: Optional[Dict] = None   # {'graph': ..., 'index': ..., 'nodes': {facility_id: node_id}}
+
+#GET THE SNAPPER FOR THE CURRENT ROAD GRAPH
+def get_node_snapper(conn=None) -> Optional[NodeSnapper]:
+    global _snapper
+    graph = get_road_graph(conn)
+    if graph is None:
+        return None
+
+    snapper = _snapper
+    if snapper is not None and snapper.graph is graph:
+        return snapper
+
+    with _lock:
+        if _snapper is None or _snapper.graph is not graph:
+            _snapper = NodeSnapper(
+                graph,
+                cell_size=get_setting('ROUTING_SNAP_CELL_DEG'),
+                precision=get_setting('ROUTING_SNAP_PRECISION'),
+                cache_size=get_setting('ROUTING_SNAP_CACHE_SIZE')
+            )
+        return _snapper
+
+#ROAD NODE OF EVERY INDEXED FACILITY, SNAPPED ONCE PER FACILITY INDEX AND ROAD GRAPH
+def get_facility_nodes(conn=None) -> Dict[int, Optional[int]]:
+    global _facility_nodes
+    snapper = get_node_snapper(conn)
+    index = get_facility_index(conn)
+    if snapper is None or index is None:
+        return {}
+
+    stored = _facility_nodes
+    if stored is not None and stored['graph'] is snapper.graph and stored['index'] is index:
+        return stored['nodes']
+
+    with _lock:
+        stored = _facility_nodes
+        if stored is None or stored['graph'] is not snapper.graph or stored['index'] is not index:
+            nodes = snapper.snap_many(zip(index.lats, index.lngs))
+            stored = _facility_nodes = {
+                'graph': snapper.graph,
+                'index': index,
+                'nodes': {f['id']: node for f, node in zip(index.facilities, nodes)}
+            }
+            print(f"Pre-snapped {len(nodes)} facilities to road nodes")
+        return stored['nodes']
+
+def snapping_stats() -> Dict:
+    snapper = _snapper
+    stats = snapper.cache_stats() if snapper is not None else {}
+    stats['facilities_snapped'] = len(_facility_nodes['nodes']) if _facility_nodes else 0
+    return stats
@@ -0,0 +1,70 @@
+# DB-LESS ANSWERS FOR THE CORE ENDPOINTS - THE SAME ROWS THE SQL QUERIES RETURN, READ FROM THE IN-MEMORY
+# FACILITY REGISTRY (MAPPED FROM THE SNAPSHOT) WHILE THE DATABASE IS UNREACHABLE OR OFFLINE_MODE IS "always"
+import threading
+from bisect import bisect_right
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.config import get_setting
+from app.db import database_offline, database_unreachable
+from app.utils.facility_index import FacilityIndex, get_facility_index
+
+_lock = threading.Lock()
+_order: Optional[tuple] = None   # (index, facilities sorted by (name, id), their (name, id) keys)
+_served = 0
+
+#REGISTRY TO ANSWER FROM ONCE get_db_connection() HAS RETURNED None (None WHEN OFFLINE SERVING IS OFF,
+#OR WHEN THE CONNECTION WAS MISSING FOR ANOTHER REASON SUCH AS AN EXHAUSTED POOL)
+def offline_registry() -> Optional[FacilityIndex]:
+    global _served
+    if get_setting('OFFLINE_MODE') not in ('fallback', 'always') or not database_unreachable():
+        return None
+    index = get_facility_index()
+    if index is not None:
+        with _lock:
+            _served += 1
+    return index
+
+#SAME ORDER AS A PAGE OF facility_listing_query, "ORDER BY name COLLATE "C", gid" (CODE POINT ORDER = UTF-8 BYTE ORDER), SORTED ONCE PER REGISTRY
+def _name_order(index: FacilityIndex) -> Tuple[List[Dict], List[Tuple]]:
+    global _order
+    order = _order
+    if order is None or order[0] is not index:
+        facilities = sorted(index.facilities, key=lambda f: (f['name'], f['id']))
+        order = _order = (index, facilities, [(f['name'], f['id']) for f in facilities])
+    return order[1], order[2]
+
+def facility_listing(index: FacilityIndex, fields: Sequence[str], filters: Dict,
+                     after: Optional[Tuple[str, int]] = None, limit: Optional[int] = None) -> List[Dict]:
+    """Rows of facility_listing_query: the requested fields in (name, id) byte order, after/limit for one page"""
+    facilities, keys = _name_order(index)
+    start = bisect_right(keys, tuple(after)) if after is not None else 0
+    rows = []
+    for i in range(start, len(facilities)):
+        facility = facilities[i]
+        if FacilityIndex.matches(facility, **filters):
+            rows.append({field: facility[field] for field in fields})
+            if limit is not None and len(rows) >= limit:
+                break
+    return rows
+
+def facility_total(index: FacilityIndex, filters: Dict) -> int:
+    if not any(filters.values()):
+        return len(index)
+    return sum(1 for f in index.facilities if FacilityIndex.matches(f, **filters))
+
+def facility_by_id(index: FacilityIndex, facility_id: int) -> Optional[Dict]:
+    facility = index.by_id.get(facility_id)
+    return dict(facility) if facility is not None else None
+
+def district_counts(index: FacilityIndex) -> List[Dict]:
+    counts = Counter(f['district'] for f in index.facilities if f['district'] is not None)
+    # sorted() COMPARES CODE POINTS; DISTRICTS_QUERY'S COLLATION CAN ONLY DIFFER ON CASE AND PUNCTUATION
+    return [{'district': district, 'count': count} for district, count in sorted(counts.items())]
+
+def offline_stats() -> Dict:
+    return {
+        'mode': get_setting('OFFLINE_MODE'),
+        'database_offline': database_offline(),
+        'requests_served': _served
+    }
@@ -0,0 +1,91 @@
+# CACHED, CONDITIONAL (ETAG / 304) RESPONSES FOR LOOKUP ENDPOINTS BACKED BY THE FACILITY TABLE
+import hashlib
+import threading
+from functools import wraps
+from typing import Dict, Optional
+
+from flask import current_app, make_response, request
+
+from app.config import get_setting
+from app.db import database_unreachable
+from app.utils.data_version import current_data_version, on_data_reload
+from app.utils.ttl_cache import TTLCache
+
+_lock = threading.Lock()
+_cache: Optional[TTLCache] = None
+
+def get_response_cache() -> TTLCache:
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = TTLCache(
+                    max_entries=get_setting('RESPONSE_CACHE_MAX_ENTRIES'),
+                    sizeof=lambda entry: len(entry[0])
+                )
+    return _cache
+
+def _cache_key(request, version: int):
+    return request.path, tuple(sorted(request.args.items(multi=True))), version
+
+def _cache_entry(body: bytes, version: int, mimetype: str):
+    return body, f'{version}-{hashlib.sha1(body).hexdigest()[:20]}', mimetype
+
+def _cached_body(app, entry):
+    body, etag, mimetype = entry
+    response = app.response_class(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f"public, max-age={get_setting('RESPONSE_CACHE_MAX_AGE')}"
+    return response
+
+#SERVE A GET VIEW FROM MEMORY UNTIL THE DATA VERSION CHANGES, WITH A STRONG ETAG AND Cache-Control
+def cached_response(view):
+    """Successful (200) responses are stored per path, query string and data version.
+    The ETag combines the data version with a digest of the body, and If-None-Match gets a 304.
+    Answers built from the snapshot while the database is unreachable are neither cached nor tagged"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        cache = get_response_cache()
+        version = current_data_version()
+        key = _cache_key(request, version)
+
+        entry = cache.get(key)
+        if entry is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or database_unreachable():
+                return response
+            entry = _cache_entry(response.get_data(), version, response.mimetype)
+            cache.put(key, entry)
+
+        return _cached_body(current_app, entry).make_conditional(request)
+    return wrapper
+
+#THE SAME CACHE FOR async VIEWS OF THE ASGI APP (quart REQUEST / RESPONSE OBJECTS)
+def async_cached_response(view):
+    from quart import current_app as async_app, make_response as async_make_response, request as async_request
+
+    @wraps(view)
+    async def wrapper(*args, **kwargs):
+        cache = get_response_cache()
+        version = current_data_version()
+        key = _cache_key(async_request, version)
+
+        entry = cache.get(key)
+        if entry is None:
+            response = await async_make_response(await view(*args, **kwargs))
+            if response.status_code != 200 or database_unreachable():
+                return response
+            entry = _cache_entry(await response.get_data(), version, response.mimetype)
+            cache.put(key, entry)
+
+        return await _cached_body(async_app, entry).make_conditional(async_request)
+    return wrapper
+
+#DROP EVERY CACHED PAYLOAD (ALSO CALLED ON DATA RELOAD)
+@on_data_reload
+def invalidate_responses(conn=None):
+    if _cache is not None:
+        _cache.clear()
+
+def response_cache_stats() -> Dict:
+    return _cache.stats() if _cache is not None else {'entries': 0, 'hits': 0, 'misses': 0, 'hit_rate': 0.0}
@@ -0,0 +1,374 @@
+# IN-MEMORY ROAD GRAPH (COMPRESSED SPARSE ROW ADJACENCY) LOADED FROM malawi_roads_clean
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence
+
+from app.db import connection_scope
+from app.utils.geo import haversine_km
+from app.utils.topology import get_topology_version, on_topology_rebuild
+
+# AVERAGE SPEED BY ROAD TYPE (KM/H) USED FOR TRAVEL TIME ESTIMATES
+ROAD_SPEEDS_KMH = {
+    'motorway': 100,
+    'trunk': 80,
+    'primary': 60,
+    'secondary': 50,
+    'tertiary': 40,
+    'residential': 30,
+    'unclassified': 30,
+    'track': 20
+}
+DEFAULT_SPEED_KMH = 30
+
+#EXTERNAL NODE ID -> INTERNAL INDEX BY BINARY SEARCH OVER THE SORTED node_ids ARRAY (NO PER-PROCESS DICT)
+class SortedIndex:
+    def __init__(self, node_ids: Sequence[int]):
+        self.node_ids = node_ids
+
+    def get(self, node_id, default=None):
+        i = bisect_left(self.node_ids, node_id)
+        return i if i < len(self.node_ids) and self.node_ids[i] == node_id else default
+
+    def __getitem__(self, node_id) -> int:
+        i = self.get(node_id)
+        if i is None:
+            raise KeyError(node_id)
+        return i
+
+    def __contains__(self, node_id) -> bool:
+        return self.get(node_id) is not None
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+#COMPACT DIRECTED GRAPH - EVERY ATTRIBUTE IS A FLAT TYPED ARRAY INDEXED BY NODE, EDGE OR ARC
+class RoadGraph:
+    def __init__(self, node_ids: Sequence[int], node_lat: Sequence[float], node_lng: Sequence[float],
+                 edge_ids: Sequence[int], edge_ogc_fid: Sequence[int],
+                 edge_source: Sequence[int], edge_target: Sequence[int],
+                 edge_cost: Sequence[float], edge_reverse_cost: Sequence[float],
+                 edge_name: Sequence[int], edge_type: Sequence[int], strings: List[str],
+                 node_index: Optional[Dict[int, int]] = None):
+        # NODES (INTERNAL INDEX 0..n-1 -> EXTERNAL ID AND COORDINATES)
+        self.node_ids = node_ids
+        self.node_lat = node_lat
+        self.node_lng = node_lng
+
+        # EDGES (ONE PER ROW OF malawi_roads_clean; SOURCE/TARGET ARE INTERNAL NODE INDEXES)
+        self.edge_ids = edge_ids
+        self.edge_ogc_fid = edge_ogc_fid
+        self.edge_source = edge_source
+        self.edge_target = edge_target
+        self.edge_cost = edge_cost
+        self.edge_reverse_cost = edge_reverse_cost
+        self.edge_name = edge_name      # INDEX INTO strings, -1 WHEN UNKNOWN
+        self.edge_type = edge_type      # INDEX INTO strings, -1 WHEN UNKNOWN
+        self.strings = strings
+
+        self.node_index = node_index if node_index is not None else {node_id: i for i, node_id in enumerate(node_ids)}
+        self.topology_version = None
+        self.snapshot_path = None       # SET WHEN THE ARRAYS ARE MAPPED FROM A SNAPSHOT FILE
+        self.hierarchy = None           # CONTRACTION HIERARCHY STORED IN THAT SNAPSHOT
+        self._reverse = None
+        self._arc_minutes = None
+        self._heuristic_scale = None
+        self._lock = threading.Lock()
+        self._build_adjacency()
+
+    @property
+    def node_count(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.edge_ids)
+
+    def _build_adjacency(self):
+        # EXPAND EDGES INTO DIRECTED ARCS (NEGATIVE COST MEANS THE DIRECTION IS CLOSED, AS IN PGROUTING)
+        tails, heads, weights, edges = array('i'), array('i'), array('d'), array('i')
+        for e in range(self.edge_count):
+            s, t = self.edge_source[e], self.edge_target[e]
+            if self.edge_cost[e] >= 0:
+                tails.append(s); heads.append(t); weights.append(self.edge_cost[e]); edges.append(e)
+            if self.edge_reverse_cost[e] >= 0:
+                tails.append(t); heads.append(s); weights.append(self.edge_reverse_cost[e]); edges.append(e)
+
+        self.offsets, self.arc_head, self.arc_weight, self.arc_edge = build_csr(
+            self.node_count, tails, heads, weights, edges)
+
+    def reverse_adjacency(self):
+        """Incoming arcs per node as (offsets, tail node, forward arc index), built on first use"""
+        if self._reverse is None:
+            with self._lock:
+                if self._reverse is None:
+                    arc_count = len(self.arc_head)
+                    tails = array('i', [0]) * arc_count
+                    for u in range(self.node_count):
+                        for a in range(self.offsets[u], self.offsets[u + 1]):
+                            tails[a] = u
+                    offsets, rev_tail, _, rev_arc = build_csr(
+                        self.node_count, self.arc_head, tails, array('d', [0.0]) * arc_count,
+                        array('i', range(arc_count)))
+                    self._reverse = (offsets, rev_tail, rev_arc)
+        return self._reverse
+
+    def arc_minutes(self):
+        """Travel time of every arc in minutes (arc cost in km at the road type's average speed)"""
+        if self._arc_minutes is None:
+            with self._lock:
+                if self._arc_minutes is None:
+                    speeds = [ROAD_SPEEDS_KMH.get(name, DEFAULT_SPEED_KMH) for name in self.strings]
+                    minutes = array('d', [0.0]) * len(self.arc_head)
+                    for a in range(len(self.arc_head)):
+                        t = self.edge_type[self.arc_edge[a]]
+                        minutes[a] = self.arc_weight[a] * 60.0 / (speeds[t] if t >= 0 else DEFAULT_SPEED_KMH)
+                    self._arc_minutes = minutes
+        return self._arc_minutes
+
+    def heuristic_scale(self) -> float:
+        """Largest factor k with k * straight-line distance <= cost on every arc, so that
+        k * haversine(node, target) never overestimates the remaining cost"""
+        if self._heuristic_scale is None:
+            with self._lock:
+                if self._heuristic_scale is None:
+                    scale = 1.0
+                    for u in range(self.node_count):
+                        lat, lng = self.node_lat[u], self.node_lng[u]
+                        for a in range(self.offsets[u], self.offsets[u + 1]):
+                            v = self.arc_head[a]
+                            straight = haversine_km(lat, lng, self.node_lat[v], self.node_lng[v])
+                            if straight > 0 and self.arc_weight[a] < scale * straight:
+                                scale = self.arc_weight[a] / straight
+                    self._heuristic_scale = max(scale, 0.0)
+        return self._heuristic_scale
+
+    #EVERY ARRAY A SEARCH READS (WRITTEN TO THE FILE ROUTING WORKER PROCESSES MAP), DERIVED ONES LAST
+    ARRAYS = (
+        ('node_ids', 'q'), ('node_lat', 'd'), ('node_lng', 'd'),
+        ('edge_ids', 'q'), ('edge_ogc_fid', 'q'), ('edge_source', 'i'), ('edge_target', 'i'),
+        ('edge_cost', 'd'), ('edge_reverse_cost', 'd'), ('edge_name', 'i'), ('edge_type', 'i'),
+        ('offsets', 'i'), ('arc_head', 'i'), ('arc_weight', 'd'), ('arc_edge', 'i')
+    )
+    DERIVED_ARRAYS = (('reverse_offsets', 'i'), ('reverse_tail', 'i'), ('reverse_arc', 'i'), ('arc_minutes', 'd'))
+
+    def search_arrays(self) -> Dict[str, Sequence]:
+        arrays = {name: getattr(self, name) for name, _ in self.ARRAYS}
+        arrays['reverse_offsets'], arrays['reverse_tail'], arrays['reverse_arc'] = self.reverse_adjacency()
+        arrays['arc_minutes'] = self.arc_minutes()
+        return arrays
+
+    @classmethod
+    def from_search_arrays(cls, arrays: Dict[str, Sequence], strings: List[str],
+                           heuristic_scale: float, topology_version: Optional[int]) -> 'RoadGraph':
+        """Graph over arrays built elsewhere (read-only views of a snapshot file); node ids are
+        looked up by binary search instead of a dict"""
+        graph = cls.__new__(cls)
+        for name, _ in cls.ARRAYS:
+            setattr(graph, name, arrays[name])
+        graph.strings = strings
+        graph.node_index = SortedIndex(arrays['node_ids'])
+        graph.topology_version = topology_version
+        graph.snapshot_path = None
+        graph.hierarchy = None
+        graph._reverse = (arrays['reverse_offsets'], arrays['reverse_tail'], arrays['reverse_arc'])
+        graph._arc_minutes = arrays['arc_minutes']
+        graph._heuristic_scale = heuristic_scale
+        graph._lock = threading.Lock()
+        return graph
+
+    def neighbours(self, u: int):
+        for a in range(self.offsets[u], self.offsets[u + 1]):
+            yield self.arc_head[a], self.arc_weight[a], a
+
+    def arc_tail(self, a: int) -> int:
+        e = self.arc_edge[a]
+        return self.edge_source[e] if self.arc_head[a] == self.edge_target[e] else self.edge_target[e]
+
+    def string(self, i: int, default: str) -> str:
+        return self.strings[i] if i >= 0 else default
+
+    def path_segments(self, arcs: List[int]) -> List[Dict]:
+        """Turn a list of arcs (from a search) into route segments in travel order"""
+        segments = []
+        agg_cost = 0.0
+        for seq, a in enumerate(arcs, 1):
+            e = self.arc_edge[a]
+            cost = self.arc_weight[a]
+            agg_cost += cost
+            segments.append({
+                'sequence': seq,
+                'node': int(self.node_ids[self.arc_tail(a)]),
+                'edge': int(self.edge_ids[e]),
+                'ogc_fid': int(self.edge_ogc_fid[e]),
+                'cost': cost,
+                'agg_cost': agg_cost,
+                'edge_length': cost,
+                'name': self.string(self.edge_name[e], 'Road'),
+                'road_type': self.string(self.edge_type[e], 'unclassified')
+            })
+        return segments
+
+
+#COUNTING SORT OF ARCS BY TAIL NODE INTO CSR ARRAYS
+def build_csr(node_count: int, tails, heads, weights, edges):
+    offsets = array('i', [0]) * (node_count + 1)
+    for u in tails:
+        offsets[u + 1] += 1
+    for u in range(node_count):
+        offsets[u + 1] += offsets[u]
+
+    arc_count = len(tails)
+    arc_head = array('i', [0]) * arc_count
+    arc_weight = array('d', [0.0]) * arc_count
+    arc_edge = array('i', [0]) * arc_count
+    fill = array('i', offsets[:-1])
+    for i in range(arc_count):
+        pos = fill[tails[i]]
+        fill[tails[i]] = pos + 1
+        arc_head[pos] = heads[i]
+        arc_weight[pos] = weights[i]
+        arc_edge[pos] = edges[i]
+    return offsets, arc_head, arc_weight, arc_edge
+
+
+def _road_attribute_columns(conn) -> List[str]:
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = 'malawi_roads' AND column_name IN ('name', 'highway');
+    """)
+    columns = [row[0] for row in cur.fetchall()]
+    cur.close()
+    return columns
+
+#LOAD NODES AND EDGES OF THE CURRENT ROUTING TOPOLOGY
+def load_road_graph(conn) -> RoadGraph:
+    version = get_topology_version(conn)
+    if version is None:
+        raise RuntimeError('Routing topology has not been built (run "flask build-topology")')
+
+    columns = _road_attribute_columns(conn)
+    name_sql = 'r.name' if 'name' in columns else 'NULL'
+    type_sql = 'r.highway' if 'highway' in columns else 'NULL'
+
+    node_ids, node_lat, node_lng = array('q'), array('d'), array('d')
+    cur = conn.cursor(name='road_graph_nodes')
+    cur.itersize = 50000
+    cur.execute("""
+        SELECT id, ST_Y(the_geom), ST_X(the_geom)
+        FROM malawi_roads_nodes
+        ORDER BY id;
+    """)
+    for node_id, lat, lng in cur:
+        node_ids.append(node_id)
+        node_lat.append(lat)
+        node_lng.append(lng)
+    cur.close()
+    node_index = {node_id: i for i, node_id in enumerate(node_ids)}
+
+    strings, string_index = [], {}
+
+    def intern(value):
+        if value is None:
+            return -1
+        i = string_index.get(value)
+        if i is None:
+            i = string_index[value] = len(strings)
+            strings.append(value)
+        return i
+
+    edge_ids, edge_ogc_fid = array('q'), array('q')
+    edge_source, edge_target = array('i'), array('i')
+    edge_cost, edge_reverse_cost = array('d'), array('d')
+    edge_name, edge_type = array('i'), array('i')
+
+    cur = conn.cursor(name='road_graph_edges')
+    cur.itersize = 50000
+    cur.execute(f"""
+        SELECT
+            c.id,
+            c.ogc_fid,
+            c.source,
+            c.target,
+            c.cost,
+            c.reverse_cost,
+            {name_sql},
+            {type_sql}
+        FROM malawi_roads_clean c
+        LEFT JOIN malawi_roads r ON r.ogc_fid = c.ogc_fid
+        WHERE c.source IS NOT NULL
+        AND c.target IS NOT NULL
+        ORDER BY c.id;
+    """)
+    for edge_id, ogc_fid, source, target, cost, reverse_cost, name, road_type in cur:
+        s, t = node_index.get(source), node_index.get(target)
+        if s is None or t is None:
+            continue
+        edge_ids.append(edge_id)
+        edge_ogc_fid.append(ogc_fid)
+        edge_source.append(s)
+        edge_target.append(t)
+        edge_cost.append(float(cost) if cost is not None else -1.0)
+        edge_reverse_cost.append(float(reverse_cost) if reverse_cost is not None else -1.0)
+        edge_name.append(intern(name))
+        edge_type.append(intern(road_type))
+    cur.close()
+    conn.rollback()
+
+    graph = RoadGraph(node_ids, node_lat, node_lng, edge_ids, edge_ogc_fid, edge_source, edge_target,
+                      edge_cost, edge_reverse_cost, edge_name, edge_type, strings, node_index=node_index)
+    graph.topology_version = version
+    # O(E) PASS DONE HERE, BEFORE THE GRAPH IS SHARED, RATHER THAN BY THE FIRST A* REQUEST
+    graph.heuristic_scale()
+    return graph
+
+
+_graph: Optional[RoadGraph] = None
+_graph_lock = threading.Lock()
+
+#GET THE SHARED ROAD GRAPH ON FIRST USE - MAPPED FROM THE SNAPSHOT WHEN ONE IS PUBLISHED, ELSE LOADED FROM THE DATABASE
+def get_road_graph(conn=None) -> Optional[RoadGraph]:
+    global _graph
+    if _graph is not None:
+        return _graph
+
+    from app.utils.snapshot import get_snapshot
+    with _graph_lock:
+        snapshot = get_snapshot() if _graph is None else None
+        if snapshot is not None and snapshot.has_road_graph():
+            _graph = snapshot.road_graph()
+            print(f"Road graph mapped from snapshot: {_graph.node_count} nodes, {_graph.edge_count} edges")
+        if _graph is None:
+            with connection_scope(conn) as db:
+                if db is None:
+                    return None
+                try:
+                    _graph = load_road_graph(db)
+                    print(f"Road graph loaded: {_graph.node_count} nodes, {_graph.edge_count} edges")
+                except Exception as e:
+                    print(f"Error loading road graph: {e}")
+                    db.rollback()
+                    return None
+        return _graph
+
+#RELOAD THE GRAPH AFTER THE TOPOLOGY IS REBUILT
+def refresh_road_graph(conn=None, version: Optional[int] = None) -> Optional[RoadGraph]:
+    global _graph
+    with connection_scope(conn) as db:
+        if db is None:
+            return None
+        graph = load_road_graph(db)
+
+    with _graph_lock:
+        _graph = graph
+    print(f"Road graph refreshed: {graph.node_count} nodes, {graph.edge_count} edges")
+    return graph
+
+#SWAP IN A GRAPH BUILT ELSEWHERE (A NEWLY PUBLISHED SNAPSHOT)
+def install_road_graph(graph: RoadGraph):
+    global _graph
+    with _graph_lock:
+        _graph = graph
+
+on_topology_rebuild(refresh_road_graph)
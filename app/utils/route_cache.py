@@ -0,0 +1,45 @@
+# CACHE OF FULL ROUTE RESULTS (DISTANCE, TIME, DIRECTIONS, GEOMETRY) BETWEEN SNAPPED ROAD NODES
+import threading
+from typing import Dict, Optional, Tuple
+
+from app.config import get_setting
+from app.utils.topology import on_topology_rebuild
+from app.utils.ttl_cache import TTLCache
+
+# EDGE WEIGHTS ARE ROAD LENGTH IN KM; A DIFFERENT WEIGHTING MUST USE ITS OWN PROFILE NAME
+DEFAULT_COST_PROFILE = 'distance'
+
+_lock = threading.Lock()
+_cache: Optional[TTLCache] = None
+
+def get_route_cache() -> Optional[TTLCache]:
+    global _cache
+    if _cache is not None:
+        return _cache
+
+    with _lock:
+        if _cache is None:
+            max_entries = get_setting('ROUTE_CACHE_MAX_ENTRIES')
+            if not max_entries:
+                return None
+            _cache = TTLCache(
+                max_entries=max_entries,
+                ttl=get_setting('ROUTE_CACHE_TTL') or None,
+                max_bytes=int(get_setting('ROUTE_CACHE_MAX_MB') * 1024 * 1024)
+            )
+        return _cache
+
+def route_cache_key(start_node: int, end_node: int, algorithm: str, topology_version: Optional[int],
+                    cost_profile: str = DEFAULT_COST_PROFILE) -> Tuple:
+    return (start_node, end_node, algorithm, cost_profile, topology_version)
+
+#DROP EVERY CACHED ROUTE WHEN A NEW TOPOLOGY IS PUBLISHED (OLD KEYS COULD NEVER HIT AGAIN)
+@on_topology_rebuild
+def clear_route_cache(conn=None, version: Optional[int] = None):
+    cache = _cache
+    if cache is not None:
+        cache.clear()
+
+def route_cache_stats() -> Dict:
+    cache = _cache
+    return cache.stats() if cache is not None else {'entries': 0, 'hits': 0, 'misses': 0, 'hit_rate': 0.0}
@@ -0,0 +1,123 @@
+# BOUNDED THREAD POOL FOR THE PER-FACILITY ROUTES OF /api/routes/multiple AND THE LEGS OF /api/route/optimize
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from flask import current_app, has_app_context
+from app.config import get_setting
+
+TIMED_OUT = 'Timed out before the route was calculated'
+
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+_slots: Optional[threading.Semaphore] = None
+_stats = {'batches': 0, 'tasks': 0, 'failed': 0, 'timed_out': 0, 'in_flight': 0, 'batch_ms_max': 0.0}
+
+#SHARED POOL, SIZED ONCE FROM ROUTING_PARALLEL_WORKERS
+def get_route_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is not None:
+        return _executor
+
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, get_setting('ROUTING_PARALLEL_WORKERS')),
+                                           thread_name_prefix='route')
+        return _executor
+
+#ONE SLOT PER TASK IN FLIGHT ACROSS ALL REQUESTS (ROUTING_PARALLEL_MAX_CONCURRENCY) - A TASK THAT OUTLIVES
+#ITS REQUEST'S DEADLINE STILL HOLDS A POOLED CONNECTION, SO IT KEEPS ITS SLOT UNTIL IT ACTUALLY ENDS
+def get_route_slots() -> threading.Semaphore:
+    global _slots
+    if _slots is not None:
+        return _slots
+
+    with _lock:
+        if _slots is None:
+            _slots = threading.Semaphore(max(1, get_setting('ROUTING_PARALLEL_MAX_CONCURRENCY')))
+        return _slots
+
+def _count(name: str, amount=1):
+    with _lock:
+        _stats[name] += amount
+
+#EACH TASK GETS ITS OWN APP CONTEXT, SO get_db_connection CHECKS OUT A SEPARATE POOLED CONNECTION
+#AND TEARDOWN RETURNS IT WHEN THE TASK ENDS
+def _run_task(app, call: Callable[[], Any]):
+    _count('in_flight')
+    try:
+        if app is None:
+            return call()
+        with app.app_context():
+            return call()
+    finally:
+        _count('in_flight', -1)
+
+def run_routes(calls: Sequence[Callable[[], Any]],
+               timeout: Optional[float] = None) -> List[Tuple[Any, Optional[str]]]:
+    """Run the calls in the route pool, each once it holds one of the shared concurrency slots.
+    Returns (result, error) pairs in input order; error is None for calls that returned.
+    Calls still queued or running at the deadline come back as TIMED_OUT (a running call
+    finishes in the background, then releases its connection and its slot)"""
+    if timeout is None:
+        timeout = get_setting('ROUTING_PARALLEL_TIMEOUT')
+
+    started = time.monotonic()
+    deadline = started + timeout if timeout and timeout > 0 else None
+    app = current_app._get_current_object() if has_app_context() else None
+    executor = get_route_executor()
+    slots = get_route_slots()
+
+    results: List[Tuple[Any, Optional[str]]] = [(None, TIMED_OUT)] * len(calls)
+    queued = list(enumerate(calls))
+    queued.reverse()
+    pending = {}
+
+    def submit(i, call):
+        future = executor.submit(_run_task, app, call)
+        # RELEASED WHEN THE TASK ENDS OR IS CANCELLED BEFORE IT STARTS, WHICHEVER REQUEST IS STILL WAITING
+        future.add_done_callback(lambda _: slots.release())
+        pending[future] = i
+
+    while queued or pending:
+        while queued and slots.acquire(blocking=False):
+            submit(*queued.pop())
+
+        remaining = deadline - time.monotonic() if deadline is not None else None
+        if remaining is not None and remaining <= 0:
+            break
+        if not pending:
+            # EVERY SLOT IS HELD BY OTHER REQUESTS (OR THEIR TIMED-OUT TASKS) - WAIT FOR ONE TO FREE UP
+            if not slots.acquire(timeout=remaining):
+                break
+            submit(*queued.pop())
+            continue
+
+        done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            i = pending.pop(future)
+            try:
+                results[i] = (future.result(), None)
+            except Exception as e:
+                print(f"Error in parallel route task: {e}")
+                results[i] = (None, str(e))
+
+    for future in pending:
+        future.cancel()
+
+    with _lock:
+        _stats['batches'] += 1
+        _stats['tasks'] += len(calls)
+        _stats['timed_out'] += sum(1 for _, error in results if error is TIMED_OUT)
+        _stats['failed'] += sum(1 for _, error in results if error is not None and error is not TIMED_OUT)
+        _stats['batch_ms_max'] = max(_stats['batch_ms_max'], (time.monotonic() - started) * 1000)
+    return results
+
+def route_executor_stats() -> Dict:
+    with _lock:
+        stats = dict(_stats)
+    stats['batch_ms_max'] = round(stats['batch_ms_max'], 3)
+    stats['workers'] = max(1, get_setting('ROUTING_PARALLEL_WORKERS'))
+    stats['max_concurrency'] = max(1, get_setting('ROUTING_PARALLEL_MAX_CONCURRENCY'))
+    return stats
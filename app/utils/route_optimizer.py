@@ -0,0 +1,131 @@
+# VISITING ORDER FOR MULTI-FACILITY TRIPS FROM A PRECOMPUTED TRAVEL COST MATRIX
+from typing import List, Optional, Sequence, Tuple
+
+UNREACHABLE = 1e9   # COST USED FOR PAIRS WITH NO ROAD CONNECTION (KEEPS THE ARITHMETIC FINITE)
+
+
+def _cost_table(matrix: Sequence[Sequence[Optional[float]]], return_to_start: bool) -> List[List[float]]:
+    # POINT 0 IS THE START. AN OPEN TRIP GETS AN EXTRA SENTINEL POINT REACHED AT ZERO COST
+    # FROM EVERYWHERE, SO BOTH VARIANTS BECOME A PATH WITH FIXED FIRST AND LAST POINTS
+    table = [[UNREACHABLE if c is None else float(c) for c in row] for row in matrix]
+    if not return_to_start:
+        for row in table:
+            row.append(0.0)
+        table.append([UNREACHABLE] * len(table) + [0.0])
+    return table
+
+def path_cost(table: List[List[float]], seq: List[int]) -> float:
+    return sum(table[seq[k]][seq[k + 1]] for k in range(len(seq) - 1))
+
+#EXACT ORDER BY DYNAMIC PROGRAMMING OVER SUBSETS - O(2^n * n^2)
+def held_karp(table: List[List[float]], end: int, n: int) -> List[int]:
+    """Cheapest path 0 -> every point in 1..n -> end"""
+    full = (1 << n) - 1
+    best = [[UNREACHABLE * (n + 2)] * n for _ in range(full + 1)]
+    parent = [[-1] * n for _ in range(full + 1)]
+    for j in range(n):
+        best[1 << j][j] = table[0][j + 1]
+
+    for mask in range(1, full + 1):
+        row = best[mask]
+        for j in range(n):
+            if not mask & (1 << j):
+                continue
+            d = row[j]
+            costs = table[j + 1]
+            for k in range(n):
+                bit = 1 << k
+                if mask & bit:
+                    continue
+                nd = d + costs[k + 1]
+                if nd < best[mask | bit][k]:
+                    best[mask | bit][k] = nd
+                    parent[mask | bit][k] = j
+
+    last = min(range(n), key=lambda j: best[full][j] + table[j + 1][end])
+    order, mask = [], full
+    while last >= 0:
+        order.append(last + 1)
+        mask, last = mask ^ (1 << last), parent[mask][last]
+    order.reverse()
+    return [0] + order + [end]
+
+#GREEDY NEAREST NEIGHBOUR SEED FOR THE LOCAL SEARCH
+def nearest_neighbour(table: List[List[float]], end: int, n: int) -> List[int]:
+    seq = [0]
+    unvisited = set(range(1, n + 1))
+    while unvisited:
+        nxt = min(unvisited, key=lambda k: table[seq[-1]][k])
+        seq.append(nxt)
+        unvisited.remove(nxt)
+    return seq + [end]
+
+def _two_opt_move(table: List[List[float]], seq: List[int]) -> bool:
+    # REVERSE seq[i..j]. COSTS MAY BE ASYMMETRIC, SO THE REVERSED SEGMENT IS PRICED WITH
+    # PREFIX SUMS OF BACKWARD ARCS INSTEAD OF BEING ASSUMED EQUAL TO THE FORWARD ONE
+    size = len(seq)
+    fwd, bwd = [0.0] * size, [0.0] * size
+    for k in range(1, size):
+        fwd[k] = fwd[k - 1] + table[seq[k - 1]][seq[k]]
+        bwd[k] = bwd[k - 1] + table[seq[k]][seq[k - 1]]
+
+    for i in range(1, size - 2):
+        a, si = seq[i - 1], seq[i]
+        for j in range(i + 1, size - 1):
+            sj, b = seq[j], seq[j + 1]
+            before = table[a][si] + (fwd[j] - fwd[i]) + table[sj][b]
+            after = table[a][sj] + (bwd[j] - bwd[i]) + table[si][b]
+            if after < before - 1e-9:
+                seq[i:j + 1] = reversed(seq[i:j + 1])
+                return True
+    return False
+
+def _or_opt_move(table: List[List[float]], seq: List[int]) -> bool:
+    # MOVE A RUN OF 1-3 CONSECUTIVE STOPS, KEEPING ITS DIRECTION, TO ANOTHER GAP
+    size = len(seq)
+    for length in (1, 2, 3):
+        for i in range(1, size - length):
+            first, last = seq[i], seq[i + length - 1]
+            prev, nxt = seq[i - 1], seq[i + length]
+            removed = table[prev][first] + table[last][nxt] - table[prev][nxt]
+            for p in range(size - 1):
+                if i - 1 <= p <= i + length - 1:
+                    continue
+                x, y = seq[p], seq[p + 1]
+                if removed - (table[x][first] + table[last][y] - table[x][y]) > 1e-9:
+                    segment = seq[i:i + length]
+                    del seq[i:i + length]
+                    at = p + 1 if p < i else p + 1 - length
+                    seq[at:at] = segment
+                    return True
+    return False
+
+#IMPROVE AN ORDER WITH 2-OPT AND OR-OPT UNTIL NEITHER FINDS A CHEAPER MOVE
+def local_search(table: List[List[float]], seq: List[int], max_rounds: int = 10000) -> List[int]:
+    seq = list(seq)
+    for _ in range(max_rounds):
+        if not (_two_opt_move(table, seq) or _or_opt_move(table, seq)):
+            break
+    return seq
+
+def optimize_order(matrix: Sequence[Sequence[Optional[float]]], return_to_start: bool = False,
+                   exact_max: int = 10) -> Tuple[List[int], float, str]:
+    """Order the points 1..n of a square cost matrix (point 0 is the start)
+
+    Returns (order, cost, method) where order lists the point indexes to visit after the start.
+    Held-Karp is used up to `exact_max` stops; larger trips start from nearest neighbour and
+    are improved with 2-opt and Or-opt.
+    """
+    n = len(matrix) - 1
+    if n < 1:
+        return [], 0.0, 'trivial'
+
+    table = _cost_table(matrix, return_to_start)
+    end = 0 if return_to_start else n + 1
+
+    if n <= exact_max:
+        seq, method = held_karp(table, end, n), 'held_karp'
+    else:
+        seq, method = local_search(table, nearest_neighbour(table, end, n)), 'two_opt_or_opt'
+
+    return seq[1:-1], path_cost(table, seq), method
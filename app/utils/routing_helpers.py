@@ -1,96 +1,63 @@
 # ROUTING HELPER FOR PGROUTING ALGORITHM
+import copy
+import json
 import math
 from typing import Dict, List, Tuple, Optional
+from app.config import get_setting
+from app.utils.road_graph import DEFAULT_SPEED_KMH, ROAD_SPEEDS_KMH, get_road_graph
+from app.utils.topology import get_topology_version
+from app.utils.routing_workers import route_search, travel_cost_matrix
+from app.utils.node_snapper import get_node_snapper, get_facility_nodes
+from app.utils.route_cache import get_route_cache, route_cache_key
 
-# BUILD PGROUTING TOPOLOGY IF NOT EXISTS
-def ensure_routing_topology(conn) -> bool:
-    """Build pgRouting topology for malawi_roads if it doesn't exist"""
-    try:
-        cur = conn.cursor()
-        
-        # Check if nodes table already exists
-        cur.execute('''
-            SELECT EXISTS (SELECT 1 FROM information_schema.tables 
-            WHERE table_name = 'malawi_roads_nodes');
-        ''')
-        nodes_exist = cur.fetchone()[0]
-        
-        if nodes_exist:
-            print("Topology already exists")
-            cur.close()
-            return True
-        
-        print("Building pgRouting topology...")
-        conn.commit()
-        
-        # Create nodes table from road line startpoints
-        cur.execute('''
-            DROP TABLE IF EXISTS malawi_roads_nodes;
-            CREATE TABLE malawi_roads_nodes AS
-            SELECT 
-                row_number() OVER () as id,
-                ST_StartPoint(geometry) as the_geom
-            FROM malawi_roads
-            WHERE geometry IS NOT NULL;
-        ''')
-        conn.commit()
-        
-        cur.execute('''
-            CREATE INDEX idx_malawi_roads_nodes_geom ON malawi_roads_nodes USING GIST(the_geom);
-        ''')
-        conn.commit()
-        
-        # Create clean table with edges
-        cur.execute('''
-            DROP TABLE IF EXISTS malawi_roads_clean;
-            CREATE TABLE malawi_roads_clean AS
-            SELECT 
-                row_number() OVER () as id,
-                ogc_fid,
-                geometry,
-                COALESCE(CAST(cost AS FLOAT), ST_Length(geometry::geography)/1000.0, 1) as cost,
-                COALESCE(CAST(reverse_cost AS FLOAT), 1.0) as reverse_cost
+# NEAREST ROAD NODE TO (lng, lat) AND ITS DISTANCE IN METRES - ONLY USED WHEN THE IN-MEMORY SNAPPER IS NOT LOADED
+# PARAMETERS: (lng, lat, lng, lat)
+NEAREST_NODE_QUERY = """
+            SELECT id, ST_Distance(the_geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography) as distance_m
+            FROM malawi_roads_nodes
+            ORDER BY the_geom <-> ST_SetSRID(ST_MakePoint(%s, %s), 4326)
+            LIMIT 1;
+        """
+
+# ONE MERGED LINE FOR THE EDGES OF A ROUTE
+ROUTE_GEOMETRY_QUERY = """
+            SELECT ST_AsGeoJSON(ST_LineMerge(ST_Union(geometry)))
             FROM malawi_roads
-            WHERE geometry IS NOT NULL;
-        ''')
-        conn.commit()
-        
-        cur.execute('''
-            ALTER TABLE malawi_roads_clean ADD PRIMARY KEY (id);
-            CREATE INDEX idx_malawi_roads_clean_geom ON malawi_roads_clean USING GIST(geometry);
-        ''')
-        conn.commit()
-        
-        print("Topology created successfully")
-        cur.close()
-        return True
-        
-    except Exception as e:
-        print(f"Error building topology: {e}")
-        conn.rollback()
-        return False
+            WHERE ogc_fid = ANY(%s);
+        """
+
+# CHECK THAT THE ROUTING TOPOLOGY IS AVAILABLE (CACHED - NO CATALOG QUERY PER CALL)
+def ensure_routing_topology(conn) -> bool:
+    """Topology is built at deploy/startup (see app.utils.topology); the request path only reads the cached version"""
+    return get_topology_version(conn) is not None
+
+#SNAPPING LIMIT IN KM - max_distance IS IN METRES (None MEANS ROUTING_SNAP_MAX_DISTANCE, 0 MEANS NO LIMIT)
+def snap_limit_km(max_distance: Optional[float] = None) -> Optional[float]:
+    if max_distance is None:
+        max_distance = get_setting('ROUTING_SNAP_MAX_DISTANCE')
+    return max_distance / 1000.0 if max_distance and max_distance > 0 else None
 
-#FIND NEAREST ROAD NODE
-def find_nearest_road_node(conn, lat: float, lng: float, max_distance: int = 1000) -> Optional[int]:
+#FIND NEAREST ROAD NODE (None WHEN THE NEAREST ONE IS FURTHER THAN max_distance METRES)
+def find_nearest_road_node(conn, lat: float, lng: float, max_distance: Optional[float] = None) -> Optional[int]:
     try:
         # Ensure topology exists first
-        ensure_routing_topology(conn)
+        if not ensure_routing_topology(conn):
+            return None
+        
+        # IN-MEMORY SNAPPING (CANDIDATES CACHED BY QUANTIZED COORDINATES, RANKED AGAINST THE EXACT POINT)
+        max_km = snap_limit_km(max_distance)
+        snapper = get_node_snapper(conn)
+        if snapper is not None:
+            return snapper.snap(lat, lng, max_km)
         
         cur = conn.cursor()
         
         # FIND THE NEAREST NODE FROM THE NODES TABLE
-        query = """
-            SELECT id
-            FROM malawi_roads_nodes
-            ORDER BY the_geom <-> ST_SetSRID(ST_MakePoint(%s, %s), 4326)
-            LIMIT 1;
-        """
-        
-        cur.execute(query, (lng, lat))
+        cur.execute(NEAREST_NODE_QUERY, (lng, lat, lng, lat))
         result = cur.fetchone()
         cur.close()
         
-        if result:
+        if result and (max_km is None or result[1] <= max_km * 1000):
             return result[0]
         return None
         
@@ -98,68 +65,97 @@ def find_nearest_road_node(conn, lat: float, lng: float, max_distance: int = 100
         print(f"Error finding nearest road node: {e}")
         return None
 
+#SNAP MANY POINTS TO ROAD NODES IN ONE CALL
+def find_nearest_road_nodes(conn, points: List[Tuple[float, float]],
+                            max_distance: Optional[float] = None) -> List[Optional[int]]:
+    if not ensure_routing_topology(conn):
+        return [None] * len(points)
+    
+    snapper = get_node_snapper(conn)
+    if snapper is not None:
+        return snapper.snap_many(points, snap_limit_km(max_distance))
+    return [find_nearest_road_node(conn, lat, lng, max_distance) for lat, lng in points]
+
+#ROAD NODE FOR A FACILITY (PRE-SNAPPED, SO A FACILITY END IS NEVER SNAPPED PER REQUEST)
+#NO DISTANCE LIMIT - A REGISTERED FACILITY IS SERVED BY ITS NEAREST ROAD NODE HOWEVER FAR IT IS
+def find_facility_road_node(conn, facility: Dict) -> Optional[int]:
+    node = get_facility_nodes(conn).get(facility['id'])
+    if node is not None:
+        return node
+    return find_nearest_road_node(conn, float(facility['lat']), float(facility['lng']), max_distance=0)
+
 # CALCULATE ROUTE BETWEEN TWO NODES
-def calculate_route(conn, start_node: int, end_node: int, algorithm: str = 'dijkstra') -> Optional[List[Dict]]:
+def calculate_route(conn, start_node: int, end_node: int, algorithm: str = 'dijkstra',
+                    search_stats: Optional[Dict] = None) -> Optional[List[Dict]]:
     try:
-        ensure_routing_topology(conn)
-        
-        cur = conn.cursor()
-        
-        query = """
-            WITH start_geom AS (
-                SELECT the_geom FROM malawi_roads_nodes WHERE id = %s
-            ),
-            end_geom AS (
-                SELECT the_geom FROM malawi_roads_nodes WHERE id = %s
-            ),
-            roads_by_distance AS (
-                SELECT 
-                    row_number() OVER (ORDER BY ST_Distance(c.geometry, s.the_geom)) as seq,
-                    c.id,
-                    c.ogc_fid,
-                    c.geometry,
-                    c.cost,
-                    ST_Distance(c.geometry::geography, s.the_geom::geography) + ST_Distance(c.geometry::geography, e.the_geom::geography) as total_distance
-                FROM malawi_roads_clean c, start_geom s, end_geom e
-                ORDER BY total_distance
-                LIMIT 50
-            )
-            SELECT seq, id, ogc_fid, geometry, cost, total_distance
-            FROM roads_by_distance;
-        """
+        # IN-MEMORY ROAD GRAPH (LOADED ONCE PER TOPOLOGY VERSION)
+        graph = get_road_graph(conn)
+        if graph is None:
+            return None
         
-        cur.execute(query, (start_node, end_node))
-        results = cur.fetchall()
-        cur.close()
+        source = graph.node_index.get(start_node)
+        target = graph.node_index.get(end_node)
+        if source is None or target is None:
+            return None
         
-        if not results:
+        # SHORTEST PATH ON THE GRAPH (IN A ROUTING WORKER PROCESS WHEN ROUTING_WORKERS IS SET)
+        result = route_search(graph, source, target, algorithm, search_stats)
+        if result is None or not result.arcs:
             return None
         
         # FORMAT RESULTS into route segments
-        route_segments = []
-        agg_cost = 0
-        for row in results:
-            seq, id_val, ogc_fid, geom, cost, dist = row
-            cost_val = float(cost if cost else 1)
-            agg_cost += cost_val
-            
-            route_segments.append({
-                'sequence': int(seq),
-                'node': int(id_val),
-                'edge': int(id_val),
-                'ogc_fid': int(ogc_fid),
-                'cost': cost_val,
-                'agg_cost': agg_cost,
-                'geometry': geom,
-                'edge_length': cost_val,
-            })
-        
-        return route_segments if route_segments else None
+        return graph.path_segments(result.arcs)
         
     except Exception as e:
         print(f"Error calculating route: {e}")
         return None
 
+#DISTANCE / TIME MATRIX BETWEEN ROAD NODES (ONE-TO-MANY SEARCHES, NO GEOMETRY)
+#metric='distance' FOLLOWS THE SHORTEST PATHS, metric='time' THE FASTEST - BOTH VALUES DESCRIBE THE SAME PATH
+def calculate_travel_matrix(conn, origin_nodes: List[Optional[int]],
+                            destination_nodes: List[Optional[int]], metric: str = 'distance') -> Optional[Dict]:
+    graph = get_road_graph(conn)
+    if graph is None:
+        return None
+    
+    # MAP NODE IDS TO GRAPH INDEXES (UNSNAPPED POINTS STAY None)
+    sources = [graph.node_index.get(n) if n is not None else None for n in origin_nodes]
+    targets = [graph.node_index.get(n) if n is not None else None for n in destination_nodes]
+    
+    rows = [i for i, s in enumerate(sources) if s is not None]
+    cols = [j for j, t in enumerate(targets) if t is not None]
+    costs, minutes = travel_cost_matrix(graph, [sources[i] for i in rows], [targets[j] for j in cols], metric)
+    
+    distances_km = [[None] * len(targets) for _ in sources]
+    times_minutes = [[None] * len(targets) for _ in sources]
+    for a, i in enumerate(rows):
+        for b, j in enumerate(cols):
+            if costs[a][b] is not None:
+                distances_km[i][j] = round(costs[a][b], 2)
+                times_minutes[i][j] = round(minutes[a][b], 1)
+    
+    return {
+        'metric': metric,
+        'distances_km': distances_km,
+        'times_minutes': times_minutes
+    }
+
+def route_edge_ids(route_segments: List[Dict]) -> List[int]:
+    return [seg['ogc_fid'] for seg in route_segments]
+
+#GEOJSON FEATURE FROM THE ST_AsGeoJSON TEXT OF THE MERGED ROUTE EDGES
+def route_geometry_feature(geojson: Optional[str], route_segments: List[Dict]) -> Optional[Dict]:
+    if not geojson:
+        return None
+    return {
+        'type': 'Feature',
+        'geometry': json.loads(geojson),
+        'properties': {
+            'total_distance_km': round(route_segments[-1]['agg_cost'], 2),
+            'segments': len(route_segments)
+        }
+    }
+
 #FORMAT ROUTE SEGMENTS TO GEOJSON LINESTRING
 def format_route_geometry(conn, route_segments: List[Dict]) -> Dict:
     try:
@@ -168,53 +164,45 @@ def format_route_geometry(conn, route_segments: List[Dict]) -> Dict:
         
         cur = conn.cursor()
         
-        # COLLECT EDGE IDS
-        edge_ids = [seg['ogc_fid'] for seg in route_segments]
-        
         # GET COMBINE GEOMETRY AS GEOJSON
-        query = """
-            SELECT ST_AsGeoJSON(ST_LineMerge(ST_Union(geometry)))
-            FROM malawi_roads
-            WHERE ogc_fid = ANY(%s);
-        """
-        
-        cur.execute(query, (edge_ids,))
+        cur.execute(ROUTE_GEOMETRY_QUERY, (route_edge_ids(route_segments),))
         result = cur.fetchone()
         cur.close()
         
-        if result and result[0]:
-            import json
-            geometry = json.loads(result[0])
-            return {
-                'type': 'Feature',
-                'geometry': geometry,
-                'properties': {
-                    'total_distance_km': round(route_segments[-1]['agg_cost'], 2),
-                    'segments': len(route_segments)
-                }
-            }
-        
-        return None
+        return route_geometry_feature(result[0] if result else None, route_segments)
         
     except Exception as e:
         print(f"Error formatting route geometry: {e}")
         return None
 
+#ROUTE LINE THROUGH THE ROAD GRAPH JUNCTIONS, FOR WHEN THE DATABASE (AND ITS ROAD GEOMETRY) IS UNREACHABLE;
+#EDGES ARE DRAWN STRAIGHT, SO THE FEATURE IS MARKED APPROXIMATE
+def node_path_geometry(route_segments: List[Dict], end_node: int) -> Optional[Dict]:
+    graph = get_road_graph()
+    if not route_segments or graph is None:
+        return None
+    
+    coordinates = []
+    for node in [seg['node'] for seg in route_segments] + [end_node]:
+        i = graph.node_index.get(node)
+        if i is None:
+            return None
+        coordinates.append([graph.node_lng[i], graph.node_lat[i]])
+    
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'LineString', 'coordinates': coordinates},
+        'properties': {
+            'total_distance_km': round(route_segments[-1]['agg_cost'], 2),
+            'segments': len(route_segments),
+            'approximate': True
+        }
+    }
+
 #CALCULATE TRAVEL TIME
 def estimate_travel_time(distance_km: float, road_type: str = 'unclassified') -> float:
     # AVERAGE SPEED BY ROAD TYPE
-    speed_map = {
-        'motorway': 100,
-        'trunk': 80,
-        'primary': 60,
-        'secondary': 50,
-        'tertiary': 40,
-        'residential': 30,
-        'unclassified': 30,
-        'track': 20
-    }
-    
-    avg_speed = speed_map.get(road_type, 30)
+    avg_speed = ROAD_SPEEDS_KMH.get(road_type, DEFAULT_SPEED_KMH)
     time_hours = distance_km / avg_speed
     time_minutes = time_hours * 60
     
@@ -260,6 +248,7 @@ def generate_directions(route_segments: List[Dict]) -> List[Dict]:
         else:
             #ACCUMULATIVE DISTANCE
             segment_distance += distance
+            directions[-1]['distance_km'] = round(segment_distance, 2)
     
     # FINAL INSTRUCTION
     if directions:
@@ -273,27 +262,9 @@ def generate_directions(route_segments: List[Dict]) -> List[Dict]:
     
     return directions
 
-#CALCULATE COMPLETE ROUTE (GEOMETRY, DISTANCE, TIME, DIRECTION)
-def calculate_route_with_details(conn, start_lat: float, start_lng: float, 
-                                 end_lat: float, end_lng: float, 
-                                 algorithm: str = 'dijkstra') -> Optional[Dict]:
-  
-    # FIND NEAREST NODE
-    start_node = find_nearest_road_node(conn, start_lat, start_lng)
-    end_node = find_nearest_road_node(conn, end_lat, end_lng)
-    
-    if not start_node or not end_node:
-        return None
-    
-    # CCALCULATE ROUTE
-    route_segments = calculate_route(conn, start_node, end_node, algorithm)
-    
-    if not route_segments:
-        return None
-    
-    # GET ROUTE GEOMETRY
-    geometry = format_route_geometry(conn, route_segments)
-    
+#DISTANCE, TRAVEL TIME AND DIRECTIONS FOR A SEARCHED ROUTE
+def summarize_route(route_segments: List[Dict], geometry: Optional[Dict], algorithm: str,
+                    start_node: int, end_node: int) -> Dict:
     # CALCULATE TOTAL DISTANCE
     total_distance = route_segments[-1]['agg_cost'] if route_segments else 0
     
@@ -318,3 +289,51 @@ def calculate_route_with_details(conn, start_lat: float, start_lng: float,
         'start_node': start_node,
         'end_node': end_node
     }
+
+#CALCULATE COMPLETE ROUTE (GEOMETRY, DISTANCE, TIME, DIRECTION)
+def calculate_route_with_details(conn, start_lat: float, start_lng: float, 
+                                 end_lat: float, end_lng: float, 
+                                 algorithm: str = 'dijkstra',
+                                 start_node: Optional[int] = None,
+                                 end_node: Optional[int] = None) -> Optional[Dict]:
+  
+    # FIND NEAREST NODE (UNLESS THE CALLER ALREADY SNAPPED THE POINTS)
+    if start_node is None:
+        start_node = find_nearest_road_node(conn, start_lat, start_lng)
+    if end_node is None:
+        end_node = find_nearest_road_node(conn, end_lat, end_lng)
+    
+    if not start_node or not end_node:
+        return None
+    
+    # SAME SNAPPED NODES, ALGORITHM AND TOPOLOGY GIVE THE SAME ROUTE - KEYED ON THE GRAPH THAT IS SEARCHED,
+    # WHICH MAY BE A SNAPSHOT'S, NOT ON THE VERSION THE DATABASE LAST PUBLISHED
+    graph = get_road_graph(conn)
+    if graph is None:
+        return None
+    cache = get_route_cache()
+    cache_key = route_cache_key(start_node, end_node, algorithm, graph.topology_version)
+    cached = cache.get(cache_key) if cache is not None else None
+    if cached is not None:
+        # CALLERS MAY EDIT THE ROUTE (GEOMETRY, DIRECTIONS) - NEVER HAND OUT THE CACHED OBJECT ITSELF
+        return dict(copy.deepcopy(cached), search={'algorithm': algorithm, 'cached': True})
+    
+    # CCALCULATE ROUTE
+    search_stats = {}
+    route_segments = calculate_route(conn, start_node, end_node, algorithm, search_stats)
+    
+    if not route_segments:
+        return None
+    
+    # GET ROUTE GEOMETRY (APPROXIMATE, AND NOT CACHED, WITHOUT A DATABASE CONNECTION)
+    if conn is None:
+        geometry = node_path_geometry(route_segments, end_node)
+        return dict(summarize_route(route_segments, geometry, algorithm, start_node, end_node),
+                    search=dict(search_stats, cached=False))
+    geometry = format_route_geometry(conn, route_segments)
+    route_info = summarize_route(route_segments, geometry, algorithm, start_node, end_node)
+    if cache is not None and geometry is not None:
+        cache.put(cache_key, route_info)
+        route_info = copy.deepcopy(route_info)
+    
+    return dict(route_info, search=dict(search_stats, cached=False))
@@ -0,0 +1,380 @@
+# ROUTING WORKER PROCESSES - GRAPH SEARCHES RUN OUTSIDE THE WEB PROCESS, SO CPU-BOUND ROUTES DO NOT
+# SERIALIZE EVERY REQUEST THREAD ON THE GIL. EACH WORKER MAPS THE GRAPH SNAPSHOT READ-ONLY (THE PUBLISHED
+# ONE, OR ONE WRITTEN TO RAM-BACKED /dev/shm FOR A GRAPH LOADED FROM THE DATABASE), SO ALL SHARE A SINGLE COPY
+import atexit
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from multiprocessing.connection import Connection
+from typing import Dict, List, Optional
+
+from app.config import get_setting
+from app.utils.contraction import get_contraction_hierarchy
+from app.utils.graph_search import MATRIX_METRICS, SEARCH_ALGORITHMS, SearchResult, cost_matrix, record_search, shortest_path
+from app.utils.road_graph import RoadGraph
+from app.utils.snapshot import Snapshot, write_snapshot
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class RoutingWorkerError(Exception):
+    """The search could not be answered by a routing worker"""
+
+
+class RoutingTimeout(RoutingWorkerError):
+    """The search ran longer than ROUTING_WORKER_TIMEOUT; its worker was killed"""
+
+
+#WORKER PROCESS LOOP - ONE REQUEST AT A TIME OVER ITS SOCKET, EXITS WHEN THE WEB PROCESS CLOSES IT
+def worker_main(fd: int):
+    conn = Connection(fd)
+    graph = None
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+
+        try:
+            kind = message[0]
+            if kind == 'map':
+                graph = None
+                graph = Snapshot(message[1]['path']).road_graph()
+                result = None
+            elif kind == 'search':
+                _, source, target, algorithm = message
+                started = time.perf_counter()
+                found = SEARCH_ALGORITHMS[algorithm](graph, source, target)
+                result = (found, (time.perf_counter() - started) * 1000)
+            elif kind == 'matrix':
+                result = cost_matrix(graph, message[1], message[2], message[3])
+            else:
+                raise ValueError(f'Unknown routing worker request: {kind}')
+            reply = ('ok', result)
+        except Exception as e:
+            reply = ('error', f'{type(e).__name__}: {e}')
+
+        try:
+            conn.send(reply)
+        except (EOFError, OSError):
+            return
+
+
+#ONE WORKER PROCESS (python -m app.utils.routing_workers) AND THE WEB PROCESS END OF ITS SOCKET
+class RoutingWorker:
+    def __init__(self):
+        parent, child = socket.socketpair()
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(p for p in (PROJECT_ROOT, env.get('PYTHONPATH')) if p)
+        try:
+            self.process = subprocess.Popen(
+                [sys.executable, '-m', 'app.utils.routing_workers', str(child.fileno())],
+                pass_fds=(child.fileno(),), cwd=PROJECT_ROOT, env=env
+            )
+        finally:
+            child.close()
+        self.conn = Connection(parent.detach())
+        self.generation = None   # GRAPH FILE THE WORKER HAS MAPPED
+        self.jobs = 0
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def stop(self, kill: bool = False, wait: bool = False):
+        try:
+            self.conn.close()
+        except OSError:
+            pass
+        if kill:
+            self.process.kill()
+        if wait:
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+
+#FIXED SET OF WORKER PROCESSES, CHECKED OUT LIKE DATABASE CONNECTIONS
+class RoutingWorkerPool:
+    def __init__(self, size: int, timeout: float = 30.0, queue_timeout: float = 10.0,
+                 max_jobs: int = 1000, directory: str = ''):
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.max_jobs = max_jobs
+        self.directory = directory or ('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir())
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._running = 0       # WORKER PROCESSES (IDLE + BUSY + BEING STARTED)
+        self._busy = 0
+        self._waiting = 0       # REQUESTS QUEUED FOR A FREE WORKER
+        self._closed = False
+
+        self._publish_lock = threading.Lock()
+        self._published: Optional[Dict] = None   # {'graph', 'hierarchy', 'descriptor', 'bytes'}
+        self._files = deque()
+
+        self._jobs = 0
+        self._errors = 0
+        self._timeouts = 0
+        self._queue_timeouts = 0
+        self._crashed = 0
+        self._recycled = 0
+        self._max_waiting = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._job_total = 0.0
+
+    def publish(self, graph: RoadGraph) -> Dict:
+        """Write the graph (and its hierarchy) for the workers, once per graph / hierarchy pair"""
+        hierarchy = get_contraction_hierarchy(graph)
+        current = self._published
+        if current is not None and current['graph'] is graph and current['hierarchy'] is hierarchy:
+            return current['descriptor']
+
+        with self._publish_lock:
+            current = self._published
+            if current is not None and current['graph'] is graph and current['hierarchy'] is hierarchy:
+                return current['descriptor']
+
+            generation = current['descriptor']['generation'] + 1 if current is not None else 1
+            if graph.snapshot_path is not None and hierarchy is graph.hierarchy:
+                # MAPPED FROM THE PUBLISHED SNAPSHOT - THE WORKERS MAP THE SAME FILE
+                path = graph.snapshot_path
+            else:
+                path = os.path.join(self.directory, f'road_graph-{os.getpid()}-{generation}.bin')
+                write_snapshot(path, graph=graph, hierarchy=hierarchy)
+
+                # KEEP THE PREVIOUS FILE FOR WORKERS STILL MAPPING IT, REMOVE OLDER ONES
+                # (A MAPPED FILE STAYS READABLE AFTER IT IS UNLINKED)
+                self._files.append(path)
+                while len(self._files) > 2:
+                    self._remove(self._files.popleft())
+
+            descriptor = {'generation': generation, 'path': path}
+            self._published = {'graph': graph, 'hierarchy': hierarchy, 'descriptor': descriptor,
+                               'bytes': os.path.getsize(path)}
+            return descriptor
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _checkout(self) -> RoutingWorker:
+        start = time.monotonic()
+        deadline = start + self.queue_timeout
+        worker = None
+
+        with self._cond:
+            self._waiting += 1
+            self._max_waiting = max(self._max_waiting, self._waiting)
+            try:
+                while True:
+                    if self._closed:
+                        raise RoutingWorkerError('Routing worker pool is closed')
+                    if self._idle:
+                        worker = self._idle.pop()
+                        break
+                    if self._running < self.size:
+                        # START A WORKER OUTSIDE THE LOCK
+                        self._running += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._queue_timeouts += 1
+                        raise RoutingWorkerError(f'No routing worker free after {self.queue_timeout}s '
+                                                 f'({self.size} workers)')
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+            self._busy += 1
+            waited = time.monotonic() - start
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+
+        if worker is None:
+            try:
+                worker = RoutingWorker()
+            except Exception:
+                with self._cond:
+                    self._running -= 1
+                    self._busy -= 1
+                    self._cond.notify()
+                raise
+        return worker
+
+    def _checkin(self, worker: RoutingWorker, healthy: bool):
+        with self._cond:
+            self._busy -= 1
+            if healthy and not self._closed and worker.alive() and worker.jobs < self.max_jobs:
+                self._idle.append(worker)
+                self._cond.notify()
+                return
+            self._running -= 1
+            if healthy and worker.jobs >= self.max_jobs:
+                self._recycled += 1
+            self._cond.notify()
+        # UNHEALTHY WORKERS ARE KILLED; A RECYCLED ONE EXITS WHEN ITS SOCKET CLOSES
+        worker.stop(kill=not healthy)
+
+    def _count(self, name: str, amount=1):
+        with self._cond:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def _call(self, worker: RoutingWorker, message, timeout: float):
+        worker.conn.send(message)
+        if not worker.conn.poll(timeout):
+            self._count('_timeouts')
+            raise RoutingTimeout(f'Route search did not finish within {timeout}s')
+        return worker.conn.recv()
+
+    def run(self, graph: RoadGraph, message, timeout: Optional[float] = None):
+        """Send one request to a free worker (mapping the current graph first if needed)"""
+        descriptor = self.publish(graph)
+        worker = self._checkout()
+        started = time.monotonic()
+        healthy = False
+        try:
+            if worker.generation != descriptor['generation']:
+                status, result = self._call(worker, ('map', descriptor), self.timeout)
+                if status != 'ok':
+                    raise RoutingWorkerError(f'Routing worker could not map the graph: {result}')
+                worker.generation = descriptor['generation']
+
+            status, result = self._call(worker, message, timeout or self.timeout)
+            healthy = True
+            worker.jobs += 1
+            if status != 'ok':
+                self._count('_errors')
+                raise RoutingWorkerError(result)
+            return result
+        except (EOFError, OSError) as e:
+            self._count('_crashed')
+            raise RoutingWorkerError(f'Routing worker exited: {e}')
+        finally:
+            with self._cond:
+                self._jobs += 1
+                self._job_total += time.monotonic() - started
+            self._checkin(worker, healthy)
+
+    def warm(self, graph: Optional[RoadGraph]):
+        """Start every worker and map the graph, so the first searches do not pay for it"""
+        if graph is None:
+            return
+        descriptor = self.publish(graph)
+        workers = []
+        try:
+            for _ in range(self.size):
+                workers.append(self._checkout())
+            for worker in workers:
+                worker.conn.send(('map', descriptor))
+            for worker in workers:
+                if worker.conn.poll(self.timeout) and worker.conn.recv()[0] == 'ok':
+                    worker.generation = descriptor['generation']
+        finally:
+            for worker in workers:
+                self._checkin(worker, worker.generation == descriptor['generation'])
+        print(f"Routing workers started: {len(workers)} processes sharing "
+              f"{self._published['bytes'] / 1048576:.1f} MB of graph arrays")
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._running -= len(idle)
+            self._cond.notify_all()
+        for worker in idle:
+            worker.stop(wait=True)
+        for path in self._files:
+            self._remove(path)
+        self._files.clear()
+
+    def stats(self) -> dict:
+        with self._cond:
+            published = self._published
+            return {
+                'workers': self.size,
+                'running': self._running,
+                'idle': len(self._idle),
+                'busy': self._busy,
+                'queue_depth': self._waiting,
+                'max_queue_depth': self._max_waiting,
+                'jobs': self._jobs,
+                'errors': self._errors,
+                'timeouts': self._timeouts,
+                'queue_timeouts': self._queue_timeouts,
+                'crashed': self._crashed,
+                'recycled': self._recycled,
+                'avg_wait_ms': round(self._wait_total / self._jobs * 1000, 3) if self._jobs else 0.0,
+                'max_wait_ms': round(self._wait_max * 1000, 3),
+                'avg_job_ms': round(self._job_total / self._jobs * 1000, 3) if self._jobs else 0.0,
+                'graph_generation': published['descriptor']['generation'] if published else None,
+                'graph_mb': round(published['bytes'] / 1048576, 2) if published else 0.0
+            }
+
+
+_lock = threading.Lock()
+_pool: Optional[RoutingWorkerPool] = None
+
+#SHARED POOL, OR None WHEN ROUTING_WORKERS IS 0 (SEARCHES RUN IN THE REQUEST THREAD)
+def get_routing_pool() -> Optional[RoutingWorkerPool]:
+    global _pool
+    if _pool is not None:
+        return _pool
+    size = get_setting('ROUTING_WORKERS')
+    if not size:
+        return None
+
+    with _lock:
+        if _pool is None:
+            _pool = RoutingWorkerPool(
+                size,
+                timeout=get_setting('ROUTING_WORKER_TIMEOUT'),
+                queue_timeout=get_setting('ROUTING_WORKER_QUEUE_TIMEOUT'),
+                max_jobs=get_setting('ROUTING_WORKER_MAX_JOBS'),
+                directory=get_setting('ROUTING_WORKER_DIR')
+            )
+            atexit.register(_pool.close)
+        return _pool
+
+#SHORTEST PATH BETWEEN INTERNAL NODE INDEXES, IN A WORKER PROCESS WHEN THE POOL IS ENABLED
+def route_search(graph: RoadGraph, source: int, target: int, algorithm: str = 'dijkstra',
+                 stats: Optional[Dict] = None) -> Optional[SearchResult]:
+    pool = get_routing_pool()
+    if pool is None:
+        return shortest_path(graph, source, target, algorithm, stats)
+    if algorithm not in SEARCH_ALGORITHMS:
+        raise ValueError(f'Unknown routing algorithm: {algorithm}')
+
+    result, elapsed_ms = pool.run(graph, ('search', source, target, algorithm))
+    record_search(algorithm, result.settled if result else 0, elapsed_ms, stats)
+    return result
+
+#MANY-TO-MANY COSTS, IN A WORKER PROCESS WHEN THE POOL IS ENABLED
+def travel_cost_matrix(graph: RoadGraph, sources: List[int], targets: List[int], metric: str = 'distance'):
+    pool = get_routing_pool()
+    if pool is None:
+        return cost_matrix(graph, sources, targets, metric)
+    if metric not in MATRIX_METRICS:
+        raise ValueError(f'Unknown matrix metric: {metric}')
+    return pool.run(graph, ('matrix', list(sources), list(targets), metric))
+
+def routing_worker_stats() -> Dict:
+    pool = _pool
+    return dict(pool.stats(), enabled=True) if pool is not None else {'enabled': False}
+
+
+if __name__ == '__main__':
+    worker_main(int(sys.argv[1]))
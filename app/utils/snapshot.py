@@ -0,0 +1,372 @@
+# SNAPSHOT FILE OF THE FACILITY REGISTRY AND ROAD GRAPH - FLAT TYPED ARRAYS PLUS ONE INTERNED STRING TABLE,
+# BUILT ONCE ("flask build-snapshot") AND MAPPED READ-ONLY BY EVERY PROCESS, SO N WORKERS SHARE ONE COPY
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence
+
+from app.config import get_setting
+from app.utils.contraction import ContractionHierarchy
+from app.utils.data_version import reload_data
+from app.utils.road_graph import RoadGraph, install_road_graph
+
+# FILE LAYOUT: HEADER, ONE ENTRY PER ARRAY, THEN THE ARRAYS (LITTLE-ENDIAN, EACH ON AN 8-BYTE BOUNDARY)
+MAGIC = b'MWSN'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sIqdI')      # MAGIC, FORMAT, TOPOLOGY VERSION (-1 = NONE), CREATED (UNIX TIME), ENTRIES
+ENTRY = struct.Struct('<48scB6xqq')    # NAME, TYPECODE, KIND, BYTE OFFSET, LENGTH (ITEMS)
+ALIGN = 8
+
+# HOW AN ARRAY IS DECODED
+PLAIN = 0       # NUMBERS AS STORED
+STRINGS = 1     # INDEXES INTO THE STRING TABLE (-1 = NULL)
+DECIMALS = 2    # INDEXES INTO THE STRING TABLE, READ BACK AS Decimal (NUMERIC COLUMNS KEEP THEIR EXACT TEXT)
+
+
+class StringTable:
+    def __init__(self):
+        self.strings: List[str] = []
+        self._index: Dict[str, int] = {}
+
+    def intern(self, value) -> int:
+        if value is None:
+            return -1
+        value = str(value)
+        i = self._index.get(value)
+        if i is None:
+            i = self._index[value] = len(self.strings)
+            self.strings.append(value)
+        return i
+
+
+#FACILITY ROWS -> ONE ARRAY PER COLUMN, TYPED FROM THE VALUES THE DATABASE RETURNED
+def _facility_columns(facilities: List[Dict], strings: StringTable) -> List[tuple]:
+    columns = [('facilities', 'q', PLAIN, array('q', [len(facilities)]))]
+    for name in (facilities[0].keys() if facilities else ()):
+        values = [f[name] for f in facilities]
+        present = [v for v in values if v is not None]
+        if present and len(present) == len(values) and all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+            columns.append((f'facility.{name}', 'q', PLAIN, array('q', values)))
+        elif present and len(present) == len(values) and all(isinstance(v, (int, float)) for v in values):
+            columns.append((f'facility.{name}', 'd', PLAIN, array('d', values)))
+        elif all(isinstance(v, Decimal) for v in present) and present:
+            columns.append((f'facility.{name}', 'i', DECIMALS, array('i', [strings.intern(v) for v in values])))
+        elif all(isinstance(v, str) for v in present):
+            columns.append((f'facility.{name}', 'i', STRINGS, array('i', [strings.intern(v) for v in values])))
+        else:
+            raise ValueError(f'Facility column {name} cannot be stored in a snapshot')
+    return columns
+
+def _graph_arrays(graph: RoadGraph, hierarchy: Optional[ContractionHierarchy], strings: StringTable) -> List[tuple]:
+    node_ids = graph.node_ids
+    if any(node_ids[i] >= node_ids[i + 1] for i in range(len(node_ids) - 1)):
+        raise ValueError('Road graph node ids must be sorted to be stored in a snapshot')
+
+    search_arrays = graph.search_arrays()
+    arrays = [(f'graph.{name}', typecode, PLAIN, search_arrays[name])
+              for name, typecode in RoadGraph.ARRAYS + RoadGraph.DERIVED_ARRAYS]
+    arrays.append(('graph.strings', 'i', STRINGS, array('i', [strings.intern(s) for s in graph.strings])))
+    arrays.append(('graph.heuristic_scale', 'd', PLAIN, array('d', [graph.heuristic_scale()])))
+    if hierarchy is not None:
+        arrays += [(f'ch.{name}', typecode, PLAIN, getattr(hierarchy, name))
+                   for name, typecode in ContractionHierarchy.ARRAYS]
+    return arrays
+
+def write_snapshot(path: str, facilities: Optional[List[Dict]] = None, graph: Optional[RoadGraph] = None,
+                   hierarchy: Optional[ContractionHierarchy] = None) -> int:
+    """Write a snapshot file (through a temporary file, so readers never see it half written); returns its size"""
+    strings = StringTable()
+    arrays = []
+    if facilities is not None:
+        arrays += _facility_columns(facilities, strings)
+    if graph is not None:
+        arrays += _graph_arrays(graph, hierarchy, strings)
+
+    encoded = [s.encode('utf-8') for s in strings.strings]
+    offsets = array('q', [0])
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+    arrays.append(('strings.offsets', 'q', PLAIN, offsets))
+    arrays.append(('strings.data', 'B', PLAIN, array('B', b''.join(encoded))))
+
+    entries = []
+    offset = HEADER.size + ENTRY.size * len(arrays)
+    prepared = []
+    for name, typecode, kind, values in arrays:
+        if not isinstance(values, array) or values.typecode != typecode:
+            values = array(typecode, values)
+        if sys.byteorder == 'big':
+            values = array(typecode, values)
+            values.byteswap()
+        offset += -offset % ALIGN
+        entries.append(ENTRY.pack(name.encode('utf-8'), typecode.encode('ascii'), kind, offset, len(values)))
+        prepared.append((offset, values))
+        offset += len(values) * values.itemsize
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    version = graph.topology_version if graph is not None and graph.topology_version is not None else -1
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, version, time.time(), len(entries)))
+        for entry in entries:
+            f.write(entry)
+        for start, values in prepared:
+            f.write(b'\0' * (start - f.tell()))
+            values.tofile(f)
+    os.replace(tmp_path, path)
+    return offset
+
+
+#READ-ONLY VIEW OF A SNAPSHOT FILE - EVERY ARRAY IS A memoryview OVER ONE SHARED MAPPING
+class Snapshot:
+    def __init__(self, path: str):
+        self.path = os.path.realpath(path)
+        with open(self.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self._mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.identity = (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+        self.size = len(self._mapping)
+
+        magic, fmt, version, created_at, count = HEADER.unpack_from(self._mapping, 0)
+        if magic != MAGIC or fmt != FORMAT_VERSION:
+            raise ValueError(f'{path} is not a snapshot file (format {FORMAT_VERSION})')
+        self.topology_version = version if version >= 0 else None
+        self.created_at = created_at
+
+        self.entries = {}
+        for k in range(count):
+            name, typecode, kind, offset, length = ENTRY.unpack_from(self._mapping, HEADER.size + k * ENTRY.size)
+            typecode = typecode.decode('ascii')
+            if offset + length * array(typecode).itemsize > self.size:
+                raise ValueError(f'{path} is truncated')
+            self.entries[name.rstrip(b'\0').decode('utf-8')] = (typecode, kind, offset, length)
+
+        self._view = memoryview(self._mapping)
+        self._strings: Optional[List[str]] = None
+
+    def array(self, name: str) -> Sequence:
+        typecode, _, offset, length = self.entries[name]
+        data = self._view[offset:offset + length * array(typecode).itemsize]
+        if sys.byteorder == 'big':
+            values = array(typecode, data.tobytes())
+            values.byteswap()
+            return values
+        return data.cast(typecode)
+
+    def strings(self) -> List[str]:
+        if self._strings is None:
+            offsets = self.array('strings.offsets')
+            data = self.array('strings.data').tobytes()
+            self._strings = [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+        return self._strings
+
+    def has_facilities(self) -> bool:
+        return 'facilities' in self.entries
+
+    def facility_count(self) -> int:
+        return self.array('facilities')[0] if self.has_facilities() else 0
+
+    def facilities(self) -> Optional[List[Dict]]:
+        """Facility rows as dicts, the same values the database query returned"""
+        if not self.has_facilities():
+            return None
+        strings = self.strings()
+        names, columns = [], []
+        for name, (_, kind, _, _) in self.entries.items():
+            if not name.startswith('facility.'):
+                continue
+            values = self.array(name)
+            if kind == STRINGS:
+                column = [strings[i] if i >= 0 else None for i in values]
+            elif kind == DECIMALS:
+                column = [Decimal(strings[i]) if i >= 0 else None for i in values]
+            else:
+                column = values.tolist()
+            names.append(name[len('facility.'):])
+            columns.append(column)
+        return [dict(zip(names, row)) for row in zip(*columns)]
+
+    def has_road_graph(self) -> bool:
+        return 'graph.offsets' in self.entries
+
+    def road_graph(self) -> Optional[RoadGraph]:
+        """Road graph over the mapped arrays (and its contraction hierarchy when one was stored)"""
+        if not self.has_road_graph():
+            return None
+        arrays = {name: self.array(f'graph.{name}') for name, _ in RoadGraph.ARRAYS + RoadGraph.DERIVED_ARRAYS}
+        strings = self.strings()
+        graph = RoadGraph.from_search_arrays(arrays, [strings[i] for i in self.array('graph.strings')],
+                                             self.array('graph.heuristic_scale')[0], self.topology_version)
+        graph.snapshot_path = self.path
+        if 'ch.rank' in self.entries:
+            graph.hierarchy = ContractionHierarchy(
+                **{name: self.array(f'ch.{name}') for name, _ in ContractionHierarchy.ARRAYS},
+                topology_version=self.topology_version,
+                graph_arc_count=len(arrays['arc_head'])
+            )
+        return graph
+
+
+def snapshot_path() -> str:
+    return get_setting('SNAPSHOT_PATH')
+
+#WRITE A NEW VERSION NEXT TO SNAPSHOT_PATH AND REPOINT THE SNAPSHOT_PATH SYMLINK AT IT IN ONE RENAME
+def publish_snapshot(path: str, facilities=None, graph=None, hierarchy=None, keep: int = 3) -> Dict:
+    version_path = f'{path}.{int(time.time() * 1000)}'
+    size = write_snapshot(version_path, facilities, graph, hierarchy)
+
+    link_tmp = f'{path}.link'
+    if os.path.lexists(link_tmp):
+        os.remove(link_tmp)
+    os.symlink(os.path.basename(version_path), link_tmp)
+    os.replace(link_tmp, path)
+
+    # OLDER VERSIONS GO; PROCESSES STILL MAPPING ONE KEEP READING IT UNTIL THEY SWAP
+    directory, base = os.path.split(path)
+    versions = sorted(name for name in os.listdir(directory or '.')
+                      if name.startswith(f'{base}.') and name[len(base) + 1:].isdigit())
+    for name in versions[:-max(1, keep)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+    return {'path': version_path, 'bytes': size}
+
+#SNAPSHOT OF THE CURRENT TABLES (FACILITIES, ROAD GRAPH AND ITS CONTRACTION HIERARCHY)
+def build_snapshot(conn, path: Optional[str] = None) -> Dict:
+    from app.utils.contraction import get_contraction_hierarchy
+    from app.utils.facility_index import load_facility_index
+    from app.utils.road_graph import load_road_graph
+    from app.utils.topology import get_topology_version
+
+    facilities = load_facility_index(conn).facilities
+    graph = load_road_graph(conn) if get_topology_version(conn) is not None else None
+    hierarchy = get_contraction_hierarchy(graph) if graph is not None else None
+    published = publish_snapshot(path or snapshot_path(), facilities, graph, hierarchy,
+                                 keep=get_setting('SNAPSHOT_KEEP'))
+    published.update({
+        'facilities': len(facilities),
+        'nodes': graph.node_count if graph is not None else 0,
+        'edges': graph.edge_count if graph is not None else 0,
+        'hierarchy': hierarchy is not None
+    })
+    return published
+
+
+_lock = threading.Lock()
+_swap_lock = threading.Lock()
+_snapshot: Optional[Snapshot] = None
+_opened = False
+_checked_at = 0.0
+_swaps = 0
+
+def _open(path: str) -> Optional[Snapshot]:
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        snapshot = Snapshot(path)
+    except Exception as e:
+        print(f"Error opening snapshot {path}: {e}")
+        return None
+    print(f"Snapshot {snapshot.path} mapped: {snapshot.facility_count()} facilities, "
+          f"{snapshot.size / 1048576:.1f} MB")
+    return snapshot
+
+#THE PUBLISHED SNAPSHOT, MAPPED ON FIRST USE (None WHEN THERE IS NONE - EVERYTHING LOADS FROM THE DATABASE)
+def get_snapshot() -> Optional[Snapshot]:
+    global _snapshot, _opened
+    if _opened:
+        return _snapshot
+
+    with _lock:
+        if not _opened:
+            _snapshot = _open(snapshot_path())
+            _opened = True
+        return _snapshot
+
+#CHEAP CHECK, AT MOST ONCE PER SNAPSHOT_CHECK_INTERVAL, FOR A SNAPSHOT PUBLISHED AFTER THIS PROCESS MAPPED ITS OWN
+def snapshot_changed() -> bool:
+    global _checked_at
+    interval = get_setting('SNAPSHOT_CHECK_INTERVAL')
+    now = time.monotonic()
+    if interval is None or interval < 0 or now - _checked_at < interval:
+        return False
+    _checked_at = now
+
+    path = snapshot_path()
+    try:
+        stat = os.stat(path) if path else None
+    except OSError:
+        return False
+    if stat is None:
+        return False
+    current = _snapshot
+    return current is None or (stat.st_dev, stat.st_ino, stat.st_mtime_ns) != current.identity
+
+#MAP THE NEW SNAPSHOT, SWAP THE ROAD GRAPH AND REBUILD EVERY CACHE DERIVED FROM THE FACILITY REGISTRY
+def swap_snapshot() -> Optional[Snapshot]:
+    global _snapshot, _opened, _swaps
+    if not _swap_lock.acquire(blocking=False):
+        return _snapshot   # ANOTHER THREAD IS ALREADY SWAPPING
+    try:
+        snapshot = _open(snapshot_path())
+        current = _snapshot
+        if snapshot is None or (current is not None and snapshot.identity == current.identity):
+            return current
+
+        graph = snapshot.road_graph()
+        with _lock:
+            _snapshot = snapshot
+            _opened = True
+            _swaps += 1
+        if graph is not None:
+            install_road_graph(graph)
+        reload_data()
+
+        from app.utils.node_snapper import get_facility_nodes
+        get_facility_nodes()
+        print(f"Snapshot swapped in: {snapshot.path}")
+        return snapshot
+    finally:
+        _swap_lock.release()
+
+#PICK UP NEWLY PUBLISHED SNAPSHOTS BETWEEN REQUESTS; THE SWAP RUNS IN THE BACKGROUND
+def init_snapshot_watch(app):
+    @app.before_request
+    def pick_up_snapshot():
+        if snapshot_changed():
+            start_snapshot_swap(app)
+
+def start_snapshot_swap(app):
+    def run():
+        with app.app_context():
+            try:
+                swap_snapshot()
+            except Exception as e:
+                print(f"Error swapping in snapshot: {e}")
+
+    threading.Thread(target=run, name='snapshot-swap', daemon=True).start()
+
+def snapshot_stats() -> Dict:
+    snapshot = _snapshot
+    if snapshot is None:
+        return {'loaded': False, 'swaps': _swaps}
+    return {
+        'loaded': True,
+        'path': snapshot.path,
+        'size_mb': round(snapshot.size / 1048576, 2),
+        'created_at': round(snapshot.created_at, 3),
+        'topology_version': snapshot.topology_version,
+        'facilities': snapshot.facility_count(),
+        'road_graph': snapshot.has_road_graph(),
+        'contraction_hierarchy': 'ch.rank' in snapshot.entries,
+        'swaps': _swaps
+    }
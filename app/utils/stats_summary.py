@@ -0,0 +1,117 @@
+# FACILITY STATISTICS CUBE - EVERY BREAKDOWN FROM ONE GROUPING SETS SCAN, KEPT UNTIL THE DATA VERSION CHANGES
+import threading
+from typing import Dict, List, Optional
+
+from psycopg2.extras import RealDictCursor
+from app.db import connection_scope
+from app.utils.data_version import current_data_version
+
+# GROUPING(district, type, ownership, zone) HAS A BIT SET FOR EVERY COLUMN THAT IS ROLLED UP
+STATS_QUERY = """
+    SELECT
+        district,
+        type as facility_type,
+        ownership,
+        zone,
+        GROUPING(district, type, ownership, zone) as grouping_id,
+        COUNT(*) as total,
+        COUNT(*) FILTER (WHERE status = 'Functional') as functional,
+        COUNT(*) FILTER (WHERE status = 'Non-functional') as non_functional
+    FROM malawi_health_facilities
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    GROUP BY GROUPING SETS ((), (type), (district), (ownership), (zone), (district, type));
+"""
+
+# BREAKDOWN NAME -> (GROUPING ID, KEY COLUMNS)
+DIMENSIONS = {
+    'type': (0b1011, ('facility_type',)),
+    'district': (0b0111, ('district',)),
+    'ownership': (0b1101, ('ownership',)),
+    'zone': (0b1110, ('zone',)),
+    'district_type': (0b0011, ('district', 'facility_type'))
+}
+TOTALS_GROUPING = 0b1111
+
+
+class StatsSummary:
+    def __init__(self, rows: List[Dict], data_version: int):
+        self.data_version = data_version
+        self.breakdowns: Dict[str, List[Dict]] = {name: [] for name in DIMENSIONS}
+        by_grouping = {grouping: (name, columns) for name, (grouping, columns) in DIMENSIONS.items()}
+
+        totals = {'total': 0, 'functional': 0, 'non_functional': 0}
+        for row in rows:
+            if row['grouping_id'] == TOTALS_GROUPING:
+                totals = row
+                continue
+            name, columns = by_grouping[row['grouping_id']]
+            entry = {column: row[column] for column in columns}
+            entry['total'] = row['total']
+            entry['functional'] = row['functional']
+            self.breakdowns[name].append(entry)
+
+        for entries in self.breakdowns.values():
+            entries.sort(key=lambda e: -e['total'])
+
+        def distinct(name):
+            column = DIMENSIONS[name][1][0]
+            return sum(1 for e in self.breakdowns[name] if e[column] is not None)
+
+        self.totals = {
+            'total_facilities': totals['total'],
+            'functional_facilities': totals['functional'],
+            'non_functional_facilities': totals['non_functional'],
+            'total_districts': distinct('district'),
+            'total_types': distinct('type'),
+            'ownership_types': distinct('ownership')
+        }
+
+    def breakdown(self, name: str, limit: Optional[int] = None, **filters) -> List[Dict]:
+        entries = self.breakdowns[name]
+        if filters:
+            entries = [e for e in entries if all(e.get(k) == v for k, v in filters.items() if v is not None)]
+        return entries[:limit] if limit else list(entries)
+
+
+def load_stats_summary(conn) -> StatsSummary:
+    version = current_data_version()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur.execute(STATS_QUERY)
+    rows = cur.fetchall()
+    cur.close()
+    conn.rollback()
+    return StatsSummary(rows, version)
+
+
+_summary: Optional[StatsSummary] = None
+_lock = threading.Lock()
+
+#THE LOADED SUMMARY IF IT IS STILL CURRENT (NEVER QUERIES)
+def loaded_stats_summary() -> Optional[StatsSummary]:
+    summary = _summary
+    if summary is not None and summary.data_version == current_data_version():
+        return summary
+    return None
+
+#KEEP A SUMMARY AGGREGATED ELSEWHERE (THE ASGI APP QUERIES WITH asyncpg) UNLESS A NEWER ONE IS LOADED
+def install_stats_summary(summary: StatsSummary) -> StatsSummary:
+    global _summary
+    with _lock:
+        if _summary is None or _summary.data_version <= summary.data_version:
+            _summary = summary
+        return _summary
+
+#GET THE SUMMARY FOR THE CURRENT DATA VERSION, RE-AGGREGATING ONCE AFTER EACH RELOAD
+def get_stats_summary(conn=None) -> Optional[StatsSummary]:
+    global _summary
+    summary = loaded_stats_summary()
+    if summary is not None:
+        return summary
+
+    with _lock:
+        if _summary is None or _summary.data_version != current_data_version():
+            with connection_scope(conn) as db:
+                if db is None:
+                    return None
+                _summary = load_stats_summary(db)
+        return _summary
@@ -0,0 +1,103 @@
+# STREAMED QUERY RESULTS - SERVER-SIDE (NAMED) CURSORS ENCODED AS CHUNKED JSON OR NDJSON
+import itertools
+from typing import AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Iterator, List
+
+from psycopg2.extras import RealDictCursor
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+_cursor_ids = itertools.count(1)
+
+#EXECUTE ON A NAMED CURSOR SO POSTGRES KEEPS THE RESULT AND ONLY batch_size ROWS ARE IN MEMORY AT ONCE
+def open_stream_cursor(conn, query: str, params, batch_size: int):
+    """Errors in the query surface here, before any part of the response has been sent"""
+    cur = conn.cursor(name=f'stream_{next(_cursor_ids)}', cursor_factory=RealDictCursor)
+    cur.itersize = batch_size
+    try:
+        cur.execute(query, params)
+    except Exception:
+        cur.close()
+        conn.rollback()
+        raise
+    return cur
+
+def iter_batches(conn, cur, batch_size: int) -> Iterator[List[Dict]]:
+    try:
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cur.close()
+        conn.rollback()
+        conn.close()
+
+def _envelope_head(dumps: Callable[..., str], fields: Dict) -> str:
+    head = dumps(fields, separators=(',', ':'))
+    return head[:-1] + (',' if fields else '') + '"data":['
+
+# A COMPACT LIST ENCODES AS [a,b,...]; DROP THE BRACKETS AND JOIN BATCHES WITH A COMMA
+def _envelope_rows(rows: List[Dict], dumps: Callable[..., str], first: bool) -> str:
+    return ('' if first else ',') + dumps(rows, separators=(',', ':'))[1:-1]
+
+def _ndjson_rows(rows: List[Dict], dumps: Callable[..., str]) -> str:
+    return ''.join(dumps(row, separators=(',', ':')) + '\n' for row in rows)
+
+#{"<fields>": ..., "data": [rows ...], "count": n} WRITTEN ONE BATCH AT A TIME
+def json_envelope_stream(batches: Iterable[List[Dict]], dumps: Callable[..., str], **fields) -> Iterator[str]:
+    yield _envelope_head(dumps, fields)
+    count = 0
+    try:
+        for rows in batches:
+            yield _envelope_rows(rows, dumps, count == 0)
+            count += len(rows)
+    except Exception as e:
+        # HEADERS ARE ALREADY SENT - THE CLIENT SEES A TRUNCATED DOCUMENT
+        print(f"Error while streaming rows: {e}")
+        return
+    yield f'],"count":{count}}}\n'
+
+#ONE JSON OBJECT PER LINE
+def ndjson_stream(batches: Iterable[List[Dict]], dumps: Callable[..., str]) -> Iterator[str]:
+    try:
+        for rows in batches:
+            yield _ndjson_rows(rows, dumps)
+    except Exception as e:
+        print(f"Error while streaming rows: {e}")
+
+#FETCH THE FIRST BATCH NOW SO QUERY ERRORS SURFACE BEFORE ANY PART OF THE RESPONSE IS SENT
+async def prime_batches(batches: AsyncIterator[List[Dict]]) -> AsyncIterator[List[Dict]]:
+    try:
+        first = await batches.__anext__()
+    except StopAsyncIteration:
+        first = None
+
+    async def chained():
+        if first is not None:
+            yield first
+            async for rows in batches:
+                yield rows
+
+    return chained()
+
+#THE SAME TWO FORMATS FROM ASYNC BATCHES (asyncpg CURSOR IN THE ASGI APP)
+async def async_json_envelope_stream(batches: AsyncIterable[List[Dict]], dumps: Callable[..., str],
+                                     **fields) -> AsyncIterator[str]:
+    yield _envelope_head(dumps, fields)
+    count = 0
+    try:
+        async for rows in batches:
+            yield _envelope_rows(rows, dumps, count == 0)
+            count += len(rows)
+    except Exception as e:
+        print(f"Error while streaming rows: {e}")
+        return
+    yield f'],"count":{count}}}\n'
+
+async def async_ndjson_stream(batches: AsyncIterable[List[Dict]], dumps: Callable[..., str]) -> AsyncIterator[str]:
+    try:
+        async for rows in batches:
+            yield _ndjson_rows(rows, dumps)
+    except Exception as e:
+        print(f"Error while streaming rows: {e}")
@@ -0,0 +1,134 @@
+# IN-MEMORY TEXT INDEX - EXACT, PREFIX, WORD-PREFIX AND TRIGRAM (pg_trgm STYLE) FUZZY MATCHING
+import bisect
+import re
+import unicodedata
+from typing import Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+#LOWER CASE, NO ACCENTS, WORDS SEPARATED BY SINGLE SPACES ("St. Joseph's" -> "st joseph s")
+def normalize(text: str) -> str:
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return _NON_ALNUM.sub(' ', text).strip()
+
+#TRIGRAMS OF EACH WORD PADDED LIKE pg_trgm ("  w", " wo", ..., "ds "), PLUS THOSE OF THE WORDS RUN TOGETHER
+def trigrams(key: str) -> FrozenSet[str]:
+    grams = set()
+    words = key.split()
+    for word in words + ([''.join(words)] if len(words) > 1 else []):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+# SCORE BANDS - AN EXACT MATCH BEATS A PREFIX, WHICH BEATS A WORD PREFIX, WHICH USUALLY BEATS A FUZZY MATCH
+EXACT_SCORE = 1.0
+PREFIX_SCORE = 0.75
+WORD_PREFIX_SCORE = 0.55
+FUZZY_WEIGHT = 0.7
+
+
+class TextIndex:
+    """Keys (names, aliases) pointing at integer items. An item can have many keys and is scored
+    by its best one. Call build() after the last add()"""
+    def __init__(self, min_similarity: float = 0.3, min_fuzzy_length: int = 3):
+        self.min_similarity = min_similarity
+        self.min_fuzzy_length = min_fuzzy_length    # SHORTER QUERIES (EVERY KEYSTROKE OF AN AUTOCOMPLETE) SKIP TRIGRAMS
+        self.keys: List[str] = []
+        self.items: List[int] = []
+        self.grams: List[FrozenSet[str]] = []
+        self.words: List[List[str]] = []
+        self.postings: Dict[str, List[int]] = {}
+        self.exact: Dict[str, List[int]] = {}
+        self.suffixes: List[Tuple[str, int]] = []    # (KEY FROM EACH WORD ONWARDS, KEY POSITION), SORTED
+        self._built = False
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, text: str, item: int):
+        key = normalize(text)
+        if not key:
+            return
+        k = len(self.keys)
+        self.keys.append(key)
+        self.items.append(item)
+        self.grams.append(trigrams(key))
+        self.words.append(key.split())
+        self.exact.setdefault(key, []).append(k)
+        for gram in self.grams[k]:
+            self.postings.setdefault(gram, []).append(k)
+        start = 0
+        for word in self.words[k]:
+            start = key.index(word, start)
+            self.suffixes.append((key[start:], k))
+            start += len(word)
+        self._built = False
+
+    def build(self) -> 'TextIndex':
+        self.suffixes.sort()
+        self._built = True
+        return self
+
+    def _prefixed(self, prefix: str) -> List[Tuple[str, int]]:
+        lo = bisect.bisect_left(self.suffixes, (prefix,))
+        hi = bisect.bisect_left(self.suffixes, (prefix + '\uffff',))
+        return self.suffixes[lo:hi]
+
+    def scores(self, query: str, predicate: Optional[Callable[[int], bool]] = None) -> Dict[int, float]:
+        """Best text score (0..1] per matching item"""
+        if not self._built:
+            self.build()
+        q = normalize(query)
+        if not q:
+            return {}
+        best: Dict[int, float] = {}
+
+        def offer(k: int, score: float):
+            item = self.items[k]
+            if score > best.get(item, 0.0) and (predicate is None or predicate(item)):
+                best[item] = score
+
+        for k in self.exact.get(q, ()):
+            offer(k, EXACT_SCORE)
+
+        # PREFIX OF THE WHOLE KEY, OR OF THE KEY FROM ONE OF ITS LATER WORDS ("central" -> "kamuzu central hospital")
+        for suffix, k in self._prefixed(q):
+            coverage = len(q) / len(self.keys[k])
+            if len(suffix) == len(self.keys[k]):
+                offer(k, PREFIX_SCORE + 0.2 * coverage)
+            else:
+                offer(k, WORD_PREFIX_SCORE + 0.2 * coverage)
+
+        # EVERY QUERY WORD STARTS SOME WORD OF THE KEY, IN ANY ORDER ("jo st" -> "st joseph")
+        tokens = q.split()
+        if len(tokens) > 1:
+            longest = max(tokens, key=len)
+            candidates: Set[int] = {k for _, k in self._prefixed(longest)}
+            for k in candidates:
+                words = self.words[k]
+                if all(any(w.startswith(t) for w in words) for t in tokens):
+                    coverage = len(q.replace(' ', '')) / len(self.keys[k].replace(' ', ''))
+                    offer(k, WORD_PREFIX_SCORE - 0.05 + 0.2 * coverage)
+
+        # TRIGRAM SIMILARITY |A n B| / |A u B| FOR MISSPELLINGS ("mzuzzu" -> "mzuzu")
+        if len(q) < self.min_fuzzy_length:
+            return best
+        grams = trigrams(q)
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for k in self.postings.get(gram, ()):
+                shared[k] = shared.get(k, 0) + 1
+        for k, n in shared.items():
+            sim = n / (len(grams) + len(self.grams[k]) - n)
+            if sim >= self.min_similarity:
+                offer(k, FUZZY_WEIGHT * sim)
+        return best
+
+    def search(self, query: str, limit: int = 10,
+               predicate: Optional[Callable[[int], bool]] = None) -> List[Tuple[float, int]]:
+        """Top `limit` (score, item) pairs, best first"""
+        ranked = sorted(((score, item) for item, score in self.scores(query, predicate).items()),
+                        key=lambda pair: (-pair[0], pair[1]))
+        return ranked[:limit]
@@ -0,0 +1,237 @@
+# ROUTING TOPOLOGY - NODES ROAD ENDPOINTS, ASSIGNS SOURCE/TARGET TO EDGES AND RECORDS A VERSION
+import math
+import threading
+import time
+from array import array
+from typing import Callable, Dict, List, Optional
+
+from psycopg2.extras import execute_values
+from app.config import get_setting
+from app.db import connection_scope
+from app.utils.data_version import on_data_reload
+
+_lock = threading.Lock()
+_version: Optional[int] = None
+_version_loaded = False
+_listeners: List[Callable] = []
+
+#REGISTER A CALLBACK TO RUN AFTER THE TOPOLOGY IS REBUILT
+def on_topology_rebuild(callback: Callable) -> Callable:
+    """Register callback(conn, version) to run after a new topology version is committed"""
+    with _lock:
+        _listeners.append(callback)
+    return callback
+
+def _read_topology_version(conn) -> Optional[int]:
+    cur = conn.cursor()
+    cur.execute("SELECT to_regclass('routing_topology_meta') IS NOT NULL;")
+    if not cur.fetchone()[0]:
+        cur.close()
+        conn.rollback()
+        return None
+
+    cur.execute("SELECT MAX(version) FROM routing_topology_meta;")
+    version = cur.fetchone()[0]
+    cur.close()
+    conn.rollback()
+    return int(version) if version is not None else None
+
+#CACHED TOPOLOGY VERSION - THE CATALOG IS READ ONCE PER PROCESS, NOT PER REQUEST
+def get_topology_version(conn=None) -> Optional[int]:
+    global _version, _version_loaded
+    if _version_loaded:
+        return _version
+
+    with _lock:
+        if not _version_loaded:
+            with connection_scope(conn) as db:
+                if db is None:
+                    return _snapshot_topology_version()
+                _version = _read_topology_version(db)
+                _version_loaded = True
+        return _version
+
+#VERSION OF THE GRAPH IN THE PUBLISHED SNAPSHOT, WHILE THE DATABASE IS UNREACHABLE (NOT KEPT, SO THE DATABASE IS ASKED AGAIN)
+def _snapshot_topology_version() -> Optional[int]:
+    from app.utils.snapshot import get_snapshot
+    snapshot = get_snapshot()
+    return snapshot.topology_version if snapshot is not None and snapshot.has_road_graph() else None
+
+
+#GROUP POINTS THAT LIE WITHIN `tolerance` OF EACH OTHER USING A SPATIAL HASH
+class EndpointSnapper:
+    def __init__(self, tolerance: float):
+        self.tolerance = tolerance
+        self.cells: Dict[tuple, List[int]] = {}
+        self.xs = array('d')
+        self.ys = array('d')
+
+    def _cell(self, x: float, y: float) -> tuple:
+        if self.tolerance <= 0:
+            return (x, y)
+        return (math.floor(x / self.tolerance), math.floor(y / self.tolerance))
+
+    def node_for(self, x: float, y: float) -> int:
+        cx, cy = self._cell(x, y)
+        if self.tolerance > 0:
+            tol2 = self.tolerance * self.tolerance
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for i in self.cells.get((cx + dx, cy + dy), ()):
+                        if (self.xs[i] - x) ** 2 + (self.ys[i] - y) ** 2 <= tol2:
+                            return i
+        else:
+            for i in self.cells.get((cx, cy), ()):
+                return i
+
+        i = len(self.xs)
+        self.xs.append(x)
+        self.ys.append(y)
+        self.cells.setdefault((cx, cy), []).append(i)
+        return i
+
+
+#BUILD malawi_roads_clean, malawi_roads_nodes AND source/target IN ONE TRANSACTION
+def build_routing_topology(conn, tolerance: Optional[float] = None) -> int:
+    """Rebuild the routing topology from malawi_roads and return the new topology version"""
+    if tolerance is None:
+        tolerance = get_setting('ROUTING_TOPOLOGY_TOLERANCE')
+    started = time.perf_counter()
+    cur = conn.cursor()
+
+    print("Building routing topology...")
+
+    # EDGE TABLE - A MISSING REVERSE COST DEFAULTS TO THE FORWARD COST (TWO-WAY ROAD)
+    cur.execute('''
+        DROP TABLE IF EXISTS malawi_roads_clean;
+        CREATE TABLE malawi_roads_clean AS
+        SELECT
+            row_number() OVER (ORDER BY ogc_fid) as id,
+            ogc_fid,
+            geometry,
+            COALESCE(CAST(cost AS FLOAT), ST_Length(geometry::geography)/1000.0, 1) as cost,
+            COALESCE(CAST(reverse_cost AS FLOAT), CAST(cost AS FLOAT), ST_Length(geometry::geography)/1000.0, 1) as reverse_cost,
+            CAST(NULL AS BIGINT) as source,
+            CAST(NULL AS BIGINT) as target
+        FROM malawi_roads
+        WHERE geometry IS NOT NULL;
+
+        ALTER TABLE malawi_roads_clean ADD PRIMARY KEY (id);
+    ''')
+
+    cur.execute('''
+        SELECT
+            id,
+            ST_X(ST_StartPoint(ST_GeometryN(geometry, 1))),
+            ST_Y(ST_StartPoint(ST_GeometryN(geometry, 1))),
+            ST_X(ST_EndPoint(ST_GeometryN(geometry, ST_NumGeometries(geometry)))),
+            ST_Y(ST_EndPoint(ST_GeometryN(geometry, ST_NumGeometries(geometry))))
+        FROM malawi_roads_clean
+        ORDER BY id;
+    ''')
+
+    # SNAP ENDPOINTS TO SHARED NODES (NODE IDS ARE 1-BASED)
+    snapper = EndpointSnapper(tolerance)
+    edges = []
+    for edge_id, x1, y1, x2, y2 in cur.fetchall():
+        if x1 is None or x2 is None:
+            continue
+        edges.append((edge_id, snapper.node_for(x1, y1) + 1, snapper.node_for(x2, y2) + 1))
+
+    cur.execute('''
+        DROP TABLE IF EXISTS malawi_roads_nodes;
+        CREATE TABLE malawi_roads_nodes (
+            id BIGINT PRIMARY KEY,
+            the_geom geometry(Point, 4326)
+        );
+    ''')
+    execute_values(
+        cur,
+        "INSERT INTO malawi_roads_nodes (id, the_geom) VALUES %s",
+        ((i + 1, snapper.xs[i], snapper.ys[i]) for i in range(len(snapper.xs))),
+        template="(%s, ST_SetSRID(ST_MakePoint(%s, %s), 4326))",
+        page_size=5000
+    )
+
+    cur.execute('''
+        CREATE TEMP TABLE topology_edges (id BIGINT PRIMARY KEY, source BIGINT, target BIGINT) ON COMMIT DROP;
+    ''')
+    execute_values(cur, "INSERT INTO topology_edges (id, source, target) VALUES %s", edges, page_size=5000)
+    cur.execute('''
+        UPDATE malawi_roads_clean c
+        SET source = t.source, target = t.target
+        FROM topology_edges t
+        WHERE c.id = t.id;
+
+        DELETE FROM malawi_roads_clean WHERE source IS NULL OR target IS NULL;
+
+        CREATE INDEX idx_malawi_roads_nodes_geom ON malawi_roads_nodes USING GIST(the_geom);
+        CREATE INDEX idx_malawi_roads_clean_geom ON malawi_roads_clean USING GIST(geometry);
+        CREATE INDEX idx_malawi_roads_clean_source ON malawi_roads_clean (source);
+        CREATE INDEX idx_malawi_roads_clean_target ON malawi_roads_clean (target);
+
+        CREATE TABLE IF NOT EXISTS routing_topology_meta (
+            version INTEGER PRIMARY KEY,
+            built_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            tolerance DOUBLE PRECISION,
+            node_count INTEGER,
+            edge_count INTEGER
+        );
+    ''')
+
+    cur.execute('''
+        INSERT INTO routing_topology_meta (version, tolerance, node_count, edge_count)
+        SELECT COALESCE(MAX(version), 0) + 1, %s, %s, %s FROM routing_topology_meta
+        RETURNING version;
+    ''', (tolerance, len(snapper.xs), len(edges)))
+    version = cur.fetchone()[0]
+
+    conn.commit()
+    cur.close()
+    print(f"Topology version {version} built: {len(snapper.xs)} nodes, {len(edges)} edges "
+          f"in {time.perf_counter() - started:.1f}s")
+
+    _publish_version(conn, version)
+    return version
+
+def _publish_version(conn, version: int):
+    global _version, _version_loaded
+    with _lock:
+        _version, _version_loaded = version, True
+        listeners = list(_listeners)
+
+    for callback in listeners:
+        try:
+            callback(conn, version)
+        except Exception as e:
+            print(f"Error in topology rebuild hook {getattr(callback, '__name__', callback)}: {e}")
+
+#PICK UP A TOPOLOGY BUILT BY ANOTHER PROCESS (E.G. THE DEPLOY COMMAND) ON DATA RELOAD
+@on_data_reload
+def check_topology_version(conn=None) -> Optional[int]:
+    with connection_scope(conn) as db:
+        if db is None:
+            return None
+        version = _read_topology_version(db)
+        if version is not None and version != _version:
+            print(f"Topology version changed: {_version} -> {version}")
+            _publish_version(db, version)
+    return version
+
+#MAKE SURE A TOPOLOGY EXISTS (STARTUP) - BUILDS ONE ONLY IF NONE WAS EVER RECORDED AND build_if_missing IS SET
+def ensure_topology(conn=None, build_if_missing: bool = False) -> Optional[int]:
+    with connection_scope(conn) as db:
+        if db is None:
+            return None
+        try:
+            version = get_topology_version(db)
+            if version is not None:
+                return version
+            if not build_if_missing:
+                print("No routing topology found - run \"flask build-topology\" before serving routes")
+                return None
+            return build_routing_topology(db)
+        except Exception as e:
+            print(f"Error building topology: {e}")
+            db.rollback()
+            return None
@@ -0,0 +1,216 @@
+# FACILITY VECTOR TILES (MAPBOX VECTOR TILE, BUILT BY ST_AsMVT) WITH A MEMORY + DISK TILE CACHE
+import hashlib
+import math
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+from app.config import get_setting
+from app.db import connection_scope
+from app.utils.data_version import current_data_version, on_data_reload
+from app.utils.facility_index import get_facility_index
+from app.utils.ttl_cache import TTLCache
+
+MVT_MIMETYPE = 'application/vnd.mapbox-vector-tile'
+LAYER_NAME = 'facilities'
+EXTENT = 4096
+BUFFER = 64
+MAX_LAT = 85.0511287798
+
+# POINTS ARE BUILT FROM latitude/longitude; THE PLAIN RANGE FILTER KEEPS POSTGIS WORK TO THE TILE'S ROWS
+TILE_QUERY = """
+    SELECT ST_AsMVT(tile, %s, %s, 'geom', 'id')
+    FROM (
+        SELECT
+            ST_AsMVTGeom(
+                ST_Transform(ST_SetSRID(ST_MakePoint(longitude, latitude), 4326), 3857),
+                ST_TileEnvelope(%s, %s, %s), %s, %s, true
+            ) as geom,
+            gid as id,
+            name,
+            type as facility_type,
+            status,
+            status = 'Functional' as functional,
+            ownership,
+            district,
+            zone
+        FROM malawi_health_facilities
+        WHERE latitude IS NOT NULL
+        AND longitude IS NOT NULL
+        AND name IS NOT NULL
+        AND longitude BETWEEN %s AND %s
+        AND latitude BETWEEN %s AND %s
+    ) as tile
+    WHERE geom IS NOT NULL;
+"""
+
+#WEB MERCATOR TILE -> (west, south, east, north) IN DEGREES
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+def tiles_covering(west: float, south: float, east: float, north: float, z: int) -> Iterator[Tuple[int, int]]:
+    n = 2 ** z
+
+    def column(lng):
+        return min(n - 1, max(0, int((lng + 180.0) / 360.0 * n)))
+
+    def row(lat):
+        lat = math.radians(max(-MAX_LAT, min(MAX_LAT, lat)))
+        return min(n - 1, max(0, int((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * n)))
+
+    for x in range(column(west), column(east) + 1):
+        for y in range(row(north), row(south) + 1):
+            yield x, y
+
+def render_tile(conn, z: int, x: int, y: int) -> bytes:
+    west, south, east, north = tile_bounds(z, x, y)
+    # WIDEN THE ROW FILTER BY THE TILE BUFFER SO POINTS JUST OUTSIDE THE EDGE ARE STILL DRAWN
+    pad_x, pad_y = (east - west) * BUFFER / EXTENT, (north - south) * BUFFER / EXTENT
+    cur = conn.cursor()
+    cur.execute(TILE_QUERY, (LAYER_NAME, EXTENT, z, x, y, EXTENT, BUFFER,
+                             west - pad_x, east + pad_x, south - pad_y, north + pad_y))
+    row = cur.fetchone()
+    cur.close()
+    conn.rollback()
+    return bytes(row[0]) if row and row[0] is not None else b''
+
+#DIGEST OF EVERY ATTRIBUTE DRAWN IN A TILE - NAMES THE DISK CACHE SO IT SURVIVES RESTARTS BUT NOT DATA CHANGES
+def facility_signature(index) -> str:
+    digest = hashlib.sha1()
+    for f in index.facilities:
+        digest.update(repr((f['id'], f['lat'], f['lng'], f['name'], f['facility_type'], f['status'],
+                            f['ownership'], f['district'], f['zone'])).encode())
+    return digest.hexdigest()[:16]
+
+
+class TileCache:
+    """Tiles in memory (LRU, size capped) backed by <directory>/<signature>/<z>/<x>/<y>.mvt"""
+    def __init__(self, directory: Optional[str], max_entries: int, max_bytes: Optional[int] = None):
+        self.directory = directory or None
+        self.memory = TTLCache(max_entries=max_entries, max_bytes=max_bytes, sizeof=len)
+        self.disk_hits = 0
+        self.disk_writes = 0
+
+    def _path(self, signature: str, z: int, x: int, y: int) -> str:
+        return os.path.join(self.directory, signature, str(z), str(x), f'{y}.mvt')
+
+    def get(self, signature: str, z: int, x: int, y: int) -> Optional[bytes]:
+        data = self.memory.get((signature, z, x, y))
+        if data is not None or not self.directory:
+            return data
+        try:
+            with open(self._path(signature, z, x, y), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        self.disk_hits += 1
+        self.memory.put((signature, z, x, y), data)
+        return data
+
+    def put(self, signature: str, z: int, x: int, y: int, data: bytes):
+        self.memory.put((signature, z, x, y), data)
+        if not self.directory:
+            return
+        path = self._path(signature, z, x, y)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+            self.disk_writes += 1
+        except OSError as e:
+            print(f"Could not write tile {z}/{x}/{y}: {e}")
+
+    def reset(self, signature: Optional[str]):
+        """Drop cached tiles for every other signature"""
+        self.memory.clear()
+        if not self.directory or not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name != signature and len(name) == 16 and all(c in '0123456789abcdef' for c in name):
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def stats(self) -> Dict:
+        stats = self.memory.stats()
+        stats.update({'directory': self.directory, 'disk_hits': self.disk_hits, 'disk_writes': self.disk_writes})
+        return stats
+
+
+_lock = threading.Lock()
+_cache: Optional[TileCache] = None
+_signature: Tuple[int, Optional[str]] = (0, None)    # (DATA VERSION, SIGNATURE)
+
+def get_tile_cache() -> TileCache:
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = TileCache(
+                    get_setting('TILE_CACHE_DIR'),
+                    max_entries=get_setting('TILE_CACHE_MAX_ENTRIES'),
+                    max_bytes=int(get_setting('TILE_CACHE_MAX_MB') * 1024 * 1024)
+                )
+    return _cache
+
+def current_signature(conn=None) -> Optional[str]:
+    global _signature
+    version, signature = _signature
+    if signature is not None and version == current_data_version():
+        return signature
+    index = get_facility_index(conn)
+    if index is None:
+        return None
+    _signature = (current_data_version(), facility_signature(index))
+    return _signature[1]
+
+#(TILE BYTES, SIGNATURE) - AN EMPTY TILE IS b''; None WHEN THE DATABASE IS UNAVAILABLE
+def get_tile(z: int, x: int, y: int, conn=None) -> Optional[Tuple[bytes, str]]:
+    signature = current_signature(conn)
+    if signature is None:
+        return None
+    cache = get_tile_cache()
+    data = cache.get(signature, z, x, y)
+    if data is None:
+        with connection_scope(conn) as db:
+            if db is None:
+                return None
+            data = render_tile(db, z, x, y)
+        cache.put(signature, z, x, y, data)
+    return data, signature
+
+#RENDER EVERY TILE OVER THE FACILITIES' EXTENT UP TO max_zoom (SKIPS TILES ALREADY ON DISK)
+def seed_tiles(max_zoom: int, conn=None) -> int:
+    index = get_facility_index(conn)
+    if index is None or not len(index) or max_zoom < 0:
+        return 0
+    west, east = min(index.lngs), max(index.lngs)
+    south, north = min(index.lats), max(index.lats)
+
+    started = time.perf_counter()
+    count = 0
+    for z in range(max_zoom + 1):
+        for x, y in tiles_covering(west, south, east, north, z):
+            if get_tile(z, x, y, conn) is not None:
+                count += 1
+    print(f"Seeded {count} facility tiles (zoom 0-{max_zoom}) in {time.perf_counter() - started:.1f}s")
+    return count
+
+#AT STARTUP AND ON NEW FACILITY DATA - DROP TILES FOR OTHER SNAPSHOTS AND SEED THE LOW ZOOM LEVELS
+@on_data_reload
+def refresh_tile_cache(conn=None):
+    cache = get_tile_cache()
+    signature = current_signature(conn)
+    cache.reset(signature)
+    if signature is not None:
+        seed_tiles(get_setting('TILE_SEED_MAX_ZOOM'), conn)
+
+def tile_cache_stats() -> Dict:
+    return _cache.stats() if _cache is not None else {'entries': 0, 'hits': 0, 'misses': 0, 'hit_rate': 0.0}
@@ -0,0 +1,4 @@
+# ASYNC SERVING MODE: uvicorn asgi:app --port 5000  (OR hypercorn asgi:app --bind 127.0.0.1:5000)
+from app.asgi import create_asgi_app
+
+app = create_asgi_app()
@@ -0,0 +1,125 @@
+# SIDE-BY-SIDE LOAD TEST OF THE SYNC (FLASK) AND ASYNC (ASGI) SERVING MODES
+#
+#   python bench_async.py --start                       # LAUNCH BOTH SERVERS ON :5000 / :8000, THEN BENCHMARK
+#   python bench_async.py --sync http://host:5000 --async http://host:8000 -c 64 -n 2000
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+SYNC_COMMAND = [sys.executable, '-m', 'flask', '--app', 'run:app', 'run', '--port', '{port}', '--with-threads']
+ASYNC_COMMAND = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', '{port}', '--log-level', 'warning']
+
+
+def call(base_url, method, path, payload=None, timeout=30.0):
+    data = json.dumps(payload).encode() if payload is not None else None
+    req = urllib.request.Request(base_url + path, data=data, method=method,
+                                 headers={'Content-Type': 'application/json'} if data else {})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            ok = response.status < 500
+    except urllib.error.HTTPError as e:
+        e.read()
+        ok = e.code < 500
+    except Exception:
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+def scenarios(base_url):
+    """Endpoints to load, with a real facility id and a start point 5 km away for routing"""
+    with urllib.request.urlopen(f'{base_url}/api/facilities?page_size=1&fields=id,lat,lng') as response:
+        facility = json.loads(response.read().decode())['data'][0]
+    route = {
+        'start_lat': float(facility['lat']) - 0.05,
+        'start_lng': float(facility['lng']) - 0.05,
+        'facility_id': facility['id']
+    }
+    return [
+        ('facility list (page)', 'GET', '/api/facilities?page_size=100&include_total=true', None),
+        ('facility details', 'GET', f"/api/facility/{facility['id']}", None),
+        ('districts (cached)', 'GET', '/api/districts', None),
+        ('stats (cached)', 'GET', '/api/stats', None),
+        ('route', 'POST', '/api/route', route),
+        ('nearest (sync fallback)', 'POST', '/api/nearest', {'lat': route['start_lat'], 'lng': route['start_lng']}),
+    ]
+
+
+def run_load(base_url, method, path, payload, requests, concurrency):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # WARM UP CONNECTIONS AND CACHES
+        list(pool.map(lambda _: call(base_url, method, path, payload), range(concurrency)))
+        started = time.perf_counter()
+        results = list(pool.map(lambda _: call(base_url, method, path, payload), range(requests)))
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(t for t, _ in results)
+    return {
+        'rps': requests / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        'errors': sum(1 for _, ok in results if not ok)
+    }
+
+
+def wait_until_up(base_url, timeout=120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'{base_url}/health', timeout=2):
+                return True
+        except Exception:
+            time.sleep(0.5)
+    return False
+
+
+def start_servers(sync_port, async_port):
+    processes = []
+    for command, port in ((SYNC_COMMAND, sync_port), (ASYNC_COMMAND, async_port)):
+        # ACCESS LOGS WOULD DROWN THE RESULTS TABLE
+        processes.append(subprocess.Popen([part.format(port=port) for part in command], env=dict(os.environ),
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    return processes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the sync and async serving modes side by side')
+    parser.add_argument('--sync', default='http://127.0.0.1:5000', help='base URL of the Flask (sync) server')
+    parser.add_argument('--async', dest='async_url', default='http://127.0.0.1:8000', help='base URL of the ASGI server')
+    parser.add_argument('-n', '--requests', type=int, default=1000, help='requests per endpoint and mode')
+    parser.add_argument('-c', '--concurrency', type=int, default=32, help='requests in flight')
+    parser.add_argument('--start', action='store_true', help='start both servers from this checkout first')
+    args = parser.parse_args()
+
+    processes = []
+    if args.start:
+        processes = start_servers(args.sync.rsplit(':', 1)[1], args.async_url.rsplit(':', 1)[1])
+    try:
+        for url in (args.sync, args.async_url):
+            if not wait_until_up(url):
+                print(f"Server at {url} is not responding")
+                return 1
+
+        print(f"{args.requests} requests per endpoint, {args.concurrency} concurrent\n")
+        print(f"{'endpoint':<26}{'mode':<7}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+        for name, method, path, payload in scenarios(args.sync):
+            for mode, url in (('sync', args.sync), ('async', args.async_url)):
+                r = run_load(url, method, path, payload, args.requests, args.concurrency)
+                print(f"{name:<26}{mode:<7}{r['rps']:>9.0f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['errors']:>8}")
+        return 0
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+# SHARED FIXTURES - A SMALL SYNTHETIC ROAD GRID AND A FLASK APP WITHOUT A DATABASE POOL
+import os
+import random
+import sys
+from array import array
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import Config
+from app.utils.contraction import build_contraction_hierarchy
+from app.utils.geo import haversine_km
+from app.utils.road_graph import RoadGraph
+
+GRID_WIDTH = 7
+GRID_HEIGHT = 6
+
+
+#W x H GRID AROUND LILONGWE - SOME STREETS MISSING, SOME ONE-WAY, COSTS ABOVE THE STRAIGHT-LINE DISTANCE
+def grid_graph(width: int = GRID_WIDTH, height: int = GRID_HEIGHT, seed: int = 7,
+               oneway: float = 0.3, missing: float = 0.15) -> RoadGraph:
+    rng = random.Random(seed)
+    node_lat, node_lng = array('d'), array('d')
+    for y in range(height):
+        for x in range(width):
+            node_lat.append(-13.99 + y * 0.01 + rng.uniform(-0.002, 0.002))
+            node_lng.append(33.76 + x * 0.01 + rng.uniform(-0.002, 0.002))
+
+    edge_ids, edge_source, edge_target = array('q'), array('i'), array('i')
+    edge_cost, edge_reverse_cost = array('d'), array('d')
+    edge_name, edge_type = array('i'), array('i')
+    strings = ['M1', 'Kamuzu Procession Rd', 'primary', 'residential', 'track']
+    for y in range(height):
+        for x in range(width):
+            u = y * width + x
+            for v in ([u + 1] if x + 1 < width else []) + ([u + width] if y + 1 < height else []):
+                if rng.random() < missing:
+                    continue
+                cost = haversine_km(node_lat[u], node_lng[u], node_lat[v], node_lng[v]) * rng.uniform(1.0, 1.5)
+                edge_ids.append(len(edge_ids) + 1)
+                edge_source.append(u)
+                edge_target.append(v)
+                edge_cost.append(cost)
+                edge_reverse_cost.append(-1.0 if rng.random() < oneway else cost)
+                edge_name.append(rng.randrange(2))
+                edge_type.append(2 + rng.randrange(3))
+
+    graph = RoadGraph(array('q', range(101, 101 + width * height)), node_lat, node_lng,
+                      edge_ids, array('q', edge_ids), edge_source, edge_target,
+                      edge_cost, edge_reverse_cost, edge_name, edge_type, strings)
+    graph.topology_version = 1
+    return graph
+
+
+@pytest.fixture(scope='session')
+def road_graph() -> RoadGraph:
+    graph = grid_graph()
+    # THE "ch" SEARCH PICKS THE HIERARCHY UP FROM THE GRAPH, AS IT DOES FOR A MAPPED SNAPSHOT
+    graph.hierarchy = build_contraction_hierarchy(graph)
+    return graph
+
+
+#THE API BLUEPRINTS ON A BARE APP - NO POOL WARM-UP OR PRELOADS; TESTS PATCH WHAT A HANDLER READS FROM THE DATABASE
+@pytest.fixture
+def flask_app() -> Flask:
+    from app.routes.facilities import facilities_bp
+    from app.routes.locations import locations_bp
+    from app.routes.main import main_bp
+    from app.routes.routing import routing_bp
+    from app.routes.stats import stats_bp
+    from app.routes.tiles import tiles_bp
+    from app.utils.json_provider import init_json_provider
+
+    app = Flask('app')
+    app.config.from_object(Config)
+    app.config['TESTING'] = True
+    init_json_provider(app)
+    for blueprint in (main_bp, facilities_bp, locations_bp, stats_bp, routing_bp, tiles_bp):
+        app.register_blueprint(blueprint)
+    return app
@@ -0,0 +1,18 @@
+import pytest
+
+
+@pytest.mark.parametrize('path, method', [('/api/metrics', 'get'), ('/api/admin/reload', 'post')])
+def test_admin_token_is_required(flask_app, path, method):
+    client = flask_app.test_client()
+    flask_app.config['ADMIN_TOKEN'] = ''
+    assert getattr(client, method)(path, headers={'X-Admin-Token': ''}).status_code == 403
+
+    flask_app.config['ADMIN_TOKEN'] = 's3cret'
+    assert getattr(client, method)(path).status_code == 403
+    assert getattr(client, method)(path, headers={'X-Admin-Token': 's3cret-not'}).status_code == 403
+
+def test_metrics_with_the_admin_token(flask_app):
+    flask_app.config['ADMIN_TOKEN'] = 's3cret'
+    response = flask_app.test_client().get('/api/metrics', headers={'X-Admin-Token': 's3cret'})
+    assert response.status_code == 200
+    assert response.get_json()['db_pool']['size'] == 0
@@ -0,0 +1,65 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from app.asgi import WSGIFallback
+
+
+def serve(wsgi_app, path='/api/echo', body=b'', headers=()):
+    scope = {'type': 'http', 'method': 'POST', 'path': path, 'query_string': b'a=1&b=2',
+             'headers': [(b'content-type', b'application/json'), (b'x-admin-token', b't')] + list(headers)}
+    incoming = [{'type': 'http.request', 'body': body[:3], 'more_body': True},
+                {'type': 'http.request', 'body': body[3:], 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return incoming.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        try:
+            asyncio.run(WSGIFallback(wsgi_app, executor, queue_size=2)(scope, receive, send))
+            return sent, None
+        except RuntimeError as e:
+            return sent, e
+
+
+def test_streams_the_wsgi_response():
+    def echo(environ, start_response):
+        start_response('201 Created', [('Content-Type', 'text/plain')])
+        yield environ['QUERY_STRING'].encode()
+        yield environ['HTTP_X_ADMIN_TOKEN'].encode() + environ['CONTENT_TYPE'].encode()
+        yield environ['wsgi.input'].read()
+
+    sent, error = serve(echo, body=b'{"x": 1}')
+    assert error is None
+    assert sent[0]['status'] == 201 and (b'content-type', b'text/plain') in sent[0]['headers']
+    assert [m['body'] for m in sent[1:]] == [b'a=1&b=2', b'tapplication/json', b'{"x": 1}', b'']
+    assert sent[-1]['more_body'] is False
+
+def test_failure_before_the_status_is_a_500():
+    def broken(environ, start_response):
+        raise ValueError('boom')
+
+    sent, error = serve(broken)
+    assert error is None
+    assert sent[0]['status'] == 500 and sent[-1] == {'type': 'http.response.body', 'body': b'', 'more_body': False}
+
+def test_failure_mid_body_aborts_the_response():
+    def truncated(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'application/x-ndjson')])
+        yield b'{"id": 1}\n'
+        raise ValueError('connection lost')
+
+    sent, error = serve(truncated)
+    # NEVER A CLEAN END OF BODY AFTER A 200 - THE SERVER DROPS THE CONNECTION
+    assert isinstance(error, RuntimeError)
+    assert sent[0]['status'] == 200 and [m['body'] for m in sent[1:]] == [b'{"id": 1}\n']
+    assert all(m.get('more_body', True) for m in sent[1:])
+
+def test_environ_strips_the_root_path():
+    environ = WSGIFallback.environ({'method': 'GET', 'path': '/api/v1/facilities', 'root_path': '/api/v1',
+                                    'headers': [(b'accept', b'a'), (b'accept', b'b')]}, b'')
+    assert (environ['SCRIPT_NAME'], environ['PATH_INFO']) == ('/api/v1', '/facilities')
+    assert environ['HTTP_ACCEPT'] == 'a,b' and environ['SERVER_PORT'] == '80'
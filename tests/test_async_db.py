@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+asyncpg = pytest.importorskip('asyncpg')
+
+import app.async_db as async_db
+from app.async_db import AsyncConnectionPool, pg_placeholders
+from app.db import PoolTimeout
+
+
+class FakePool:
+    def __init__(self, acquire_error=None, query_error=None):
+        self.acquire_error = acquire_error
+        self.query_error = query_error
+        self.released = 0
+
+    async def acquire(self, timeout=None):
+        if self.acquire_error is not None:
+            raise self.acquire_error
+        return self
+
+    async def release(self, conn):
+        self.released += 1
+
+    async def fetch(self, query, *params):
+        raise self.query_error
+
+
+@pytest.fixture
+def marked(monkeypatch):
+    calls = []
+    monkeypatch.setattr(async_db, 'mark_database_unreachable', lambda: calls.append(True))
+    return calls
+
+
+def pool_with(fake):
+    pool = AsyncConnectionPool({'dbname': 'test'})
+    pool._pool = fake
+    return pool
+
+
+def test_placeholders():
+    assert pg_placeholders("SELECT %s, '%%' || %s") == "SELECT $1, '%' || $2"
+
+@pytest.mark.parametrize('error', [ConnectionRefusedError(), asyncpg.CannotConnectNowError(),
+                                   asyncpg.ConnectionFailureError(), asyncpg.ConnectionDoesNotExistError()])
+def test_connection_failures_mark_the_database_unreachable(marked, error):
+    with pytest.raises(type(error)):
+        asyncio.run(pool_with(FakePool(acquire_error=error)).fetch_all('SELECT 1'))
+    fake = FakePool(query_error=error)
+    with pytest.raises(type(error)):
+        asyncio.run(pool_with(fake).fetch_all('SELECT 1'))
+    assert marked == [True, True]
+    assert fake.released == 1
+
+def test_busy_pool_is_not_a_failure(marked):
+    with pytest.raises(PoolTimeout):
+        asyncio.run(pool_with(FakePool(acquire_error=asyncio.TimeoutError())).fetch_all('SELECT 1'))
+    assert marked == []
+
+def test_query_errors_are_not_a_failure(marked):
+    with pytest.raises(asyncpg.UndefinedTableError):
+        asyncio.run(pool_with(FakePool(query_error=asyncpg.UndefinedTableError())).fetch_all('SELECT 1'))
+    assert marked == []
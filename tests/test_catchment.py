@@ -0,0 +1,63 @@
+import heapq
+
+import pytest
+
+from app.utils.catchment import catchment_features, cells_to_multipolygon, reach_times
+
+CELL = 0.5
+
+
+def minutes_to(graph, target):
+    # PLAIN DIJKSTRA FROM EVERY NODE, FOR REFERENCE
+    minutes = graph.arc_minutes()
+    found = {}
+    for s in range(graph.node_count):
+        best, heap = {s: 0.0}, [(0.0, s)]
+        while heap:
+            t, u = heapq.heappop(heap)
+            if u == target:
+                found[s] = t
+                break
+            if t > best[u]:
+                continue
+            for a in range(graph.offsets[u], graph.offsets[u + 1]):
+                v, nt = graph.arc_head[a], t + minutes[a]
+                if nt < best.get(v, float('inf')):
+                    best[v] = nt
+                    heapq.heappush(heap, (nt, v))
+    return found
+
+def ring_area(ring):
+    return sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(ring, ring[1:])) / 2.0 / (CELL * CELL)
+
+
+def test_reach_times_are_minutes_to_the_source(road_graph):
+    source = road_graph.node_count // 2
+    expected = minutes_to(road_graph, source)
+    limit = sorted(expected.values())[len(expected) // 2]
+
+    times = reach_times(road_graph, source, limit)
+    assert set(times) == {u for u, t in expected.items() if t <= limit}
+    for u, t in times.items():
+        assert t == pytest.approx(expected[u])
+
+def test_ring_with_a_hole():
+    cells = [(r, c) for r in range(3) for c in range(3) if (r, c) != (1, 1)]
+    geometry = cells_to_multipolygon(cells, CELL)
+    assert geometry['type'] == 'MultiPolygon' and len(geometry['coordinates']) == 1
+    outer, hole = geometry['coordinates'][0]
+    assert (ring_area(outer), ring_area(hole)) == (9, -1)
+    assert outer[0] == outer[-1] and hole[0] == hole[-1]
+
+def test_cells_touching_at_a_corner_stay_separate():
+    geometry = cells_to_multipolygon([(0, 0), (1, 1)], CELL)
+    assert sorted(ring_area(polygon[0]) for polygon in geometry['coordinates']) == [1, 1]
+    assert cells_to_multipolygon([], CELL) is None
+
+def test_bands_are_nested(road_graph):
+    features = catchment_features(road_graph, road_graph.node_count // 2, [2, 5, 10], cell_size=0.002)
+    cells = [features[band]['properties']['cells'] for band in (2, 5, 10)]
+    areas = [features[band]['properties']['area_km2'] for band in (2, 5, 10)]
+    assert 0 < cells[0] <= cells[1] <= cells[2]
+    assert areas == sorted(areas)
+    assert all(features[band]['properties']['minutes'] == band for band in features)
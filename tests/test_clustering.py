@@ -0,0 +1,72 @@
+import random
+
+import pytest
+
+from app.utils.clustering import ClusterIndex, mercator_xy
+
+WORLD = (-180.0, -85.0, 180.0, 85.0)
+MAX_ZOOM = 12
+CELL_PX = 64
+
+
+@pytest.fixture(scope='module')
+def facilities():
+    rng = random.Random(4)
+    return [{'id': i, 'lat': rng.uniform(-17.0, -9.5), 'lng': rng.uniform(32.7, 35.9),
+             'facility_type': rng.choice(['Hospital', 'Health Centre', 'Dispensary']),
+             'status': rng.choice(['Functional', 'Non-functional'])}
+            for i in range(400)]
+
+@pytest.fixture(scope='module')
+def index(facilities):
+    return ClusterIndex(facilities, MAX_ZOOM, CELL_PX)
+
+
+def brute_force_cells(facilities, z):
+    scale = 2 ** (z + 2)    # 256 / 64 PX CELLS = 4 x 4 CELLS PER TILE
+    cells = {}
+    for f in facilities:
+        x, y = mercator_xy(f['lat'], f['lng'])
+        cells.setdefault((int(x * scale), int(y * scale)), []).append(f)
+    return cells
+
+
+@pytest.mark.parametrize('zoom', [0, 5, 8, MAX_ZOOM])
+def test_clusters_match_a_direct_grid(facilities, index, zoom):
+    clusters, singles = index.query(*WORLD, zoom)
+    expected = brute_force_cells(facilities, zoom)
+
+    assert sum(c.count for _, c in clusters) + len(singles) == len(facilities)
+    for key, cluster in clusters:
+        members = expected[key]
+        assert cluster.count == len(members)
+        assert cluster.lat == pytest.approx(sum(f['lat'] for f in members) / len(members))
+        assert sum(cluster.by_type.values()) == sum(cluster.by_status.values()) == cluster.count
+        assert cluster.west == min(f['lng'] for f in members) and cluster.north == max(f['lat'] for f in members)
+    assert sorted(f['id'] for f in singles) == sorted(m[0]['id'] for m in expected.values() if len(m) == 1)
+
+def test_expansion_zoom_is_where_a_cluster_splits(facilities, index):
+    clusters, _ = index.query(*WORLD, 4)
+    for (cx, cy), cluster in clusters:
+        z = cluster.expansion_zoom
+        shift = z - 4
+        children = [key for key in brute_force_cells(facilities, z)
+                    if (key[0] >> shift, key[1] >> shift) == (cx, cy)]
+        assert len(children) > 1
+        if z > 5:
+            assert len([key for key in brute_force_cells(facilities, z - 1)
+                        if (key[0] >> (shift - 1), key[1] >> (shift - 1)) == (cx, cy)]) == 1
+
+def test_viewport_and_unclustered_zooms(facilities, index):
+    west, south, east, north = 33.5, -14.5, 34.2, -13.0
+    clusters, singles = index.query(west, south, east, north, MAX_ZOOM + 2)
+    assert clusters == []
+    assert sorted(f['id'] for f in singles) == sorted(
+        f['id'] for f in facilities if west <= f['lng'] <= east and south <= f['lat'] <= north)
+
+    clusters, singles = index.query(west, south, east, north, 6)
+    assert all(west <= c.lng <= east and south <= c.lat <= north for _, c in clusters)
+
+def test_cell_size_must_be_a_power_of_two():
+    with pytest.raises(ValueError):
+        ClusterIndex([], 10, 48)
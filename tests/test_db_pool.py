@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+import app.db as db
+from app.db import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+
+    def close(self):
+        self.closed = 1
+
+    def get_transaction_status(self):
+        return db.extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def fake_connect(monkeypatch):
+    opened = []
+
+    def connect(**config):
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    monkeypatch.setattr(db.psycopg2, 'connect', connect)
+    return opened
+
+
+def test_checkout_reuses_returned_connections(fake_connect):
+    pool = ConnectionPool({}, min_size=1, max_size=2, timeout=0.1)
+    pool.warm()
+    first = pool.getconn()
+    pool.putconn(first)
+    assert pool.getconn() is first
+    assert len(fake_connect) == 1
+
+    stats = pool.stats()
+    assert (stats['size'], stats['in_use'], stats['idle'], stats['opened']) == (1, 1, 0, 1)
+
+def test_checkout_times_out_when_exhausted():
+    pool = ConnectionPool({}, max_size=2, timeout=0.05)
+    held = [pool.getconn(), pool.getconn()]
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert pool.stats()['timeouts'] == 1
+
+    # A RETURNED CONNECTION WAKES A WAITER
+    threading.Timer(0.02, pool.putconn, args=(held[0],)).start()
+    pool.timeout = 2.0
+    assert pool.getconn() is held[0]
+
+def test_broken_connections_are_replaced():
+    pool = ConnectionPool({}, max_size=1, timeout=0.05)
+    conn = pool.getconn()
+    conn.close()
+    pool.putconn(conn)
+    assert pool.stats()['size'] == 0 and pool.stats()['discarded'] == 1
+    assert pool.getconn() is not conn
+
+@pytest.mark.parametrize('max_idle, kept', [(0, 3), (0.01, 1)])
+def test_idle_connections_above_min_size_are_pruned(max_idle, kept):
+    pool = ConnectionPool({}, min_size=1, max_size=3, timeout=0.05, max_idle=max_idle)
+    conns = [pool.getconn() for _ in range(3)]
+    for conn in conns[:2]:
+        pool.putconn(conn)
+    time.sleep(0.02)
+    pool.putconn(conns[2])
+    # max_idle=0 NEVER EXPIRES, OTHERWISE THE TWO STALE ONES ARE CLOSED DOWN TO min_size
+    assert pool.stats()['size'] == kept
@@ -0,0 +1,37 @@
+import pytest
+
+from app.utils.facility_query import (
+    decode_cursor,
+    encode_cursor,
+    facility_count_query,
+    facility_filter_clause,
+    facility_listing_query,
+    parse_fields
+)
+
+
+@pytest.mark.parametrize('name, gid', [('Kamuzu Central Hospital', 12), ('Ékwendeni "Mission"', 7), ('', 0)])
+def test_cursor_round_trip(name, gid):
+    cursor = encode_cursor(name, gid)
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == (name, gid)
+
+@pytest.mark.parametrize('cursor', ['not base64!', encode_cursor('x', 1)[:-2], 'WzEsMl0'])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+def test_parse_fields():
+    assert parse_fields(None)[:3] == ['id', 'code', 'name']
+    assert parse_fields('name, id,name') == ['name', 'id']
+    with pytest.raises(ValueError):
+        parse_fields('name,beds')
+
+def test_keyset_page_query():
+    where, params = facility_filter_clause(functional_only=True, district='Lilongwe')
+    query, params = facility_listing_query(['id', 'lat'], where, params, after=('Area 18 Clinic', 3), limit=5)
+    # ONLY THE REQUESTED COLUMNS, A ROW COMPARISON INSTEAD OF OFFSET, THE FILTER VALUES BEFORE THE CURSOR
+    assert 'gid as id' in query and 'latitude as lat' in query and 'longitude' not in query.split('FROM')[0]
+    assert 'OFFSET' not in query and ', gid) > (%s, %s)' in query
+    assert params == ['Lilongwe', 'Area 18 Clinic', 3, 5]
+    assert facility_count_query(where).endswith("AND district = %s;")
@@ -0,0 +1,44 @@
+import pytest
+
+from app.utils.facility_index import FacilityIndex
+from app.utils.facility_search import FacilitySearchIndex
+
+LILONGWE = (-13.96, 33.77)
+
+
+@pytest.fixture(scope='module')
+def search():
+    rows = [
+        (1, 'Mzuzu Central Hospital', 'Functional', -11.45, 34.02),
+        (2, 'Kamuzu Central Hospital', 'Functional', -13.98, 33.78),
+        (3, 'Zomba Central Hospital', 'Non-functional', -15.38, 35.32),
+        (4, 'Central Clinic', 'Functional', -15.78, 35.0),
+    ]
+    return FacilitySearchIndex(FacilityIndex([
+        {'id': i, 'name': name, 'common_name': 'KCH' if i == 2 else None, 'status': status,
+         'district': 'X', 'facility_type': 'Hospital', 'ownership': 'Government', 'lat': lat, 'lng': lng}
+        for i, name, status, lat, lng in rows
+    ]))
+
+
+def ids(results):
+    return [facility['id'] for _, _, _, facility in results]
+
+
+def test_text_only_ranking(search):
+    results = search.search('central')
+    # "Central Clinic" STARTS WITH THE QUERY, THE HOSPITALS ONLY HAVE IT AS A LATER WORD
+    assert ids(results)[0] == 4
+    assert all(distance is None and score == text for score, text, distance, _ in results)
+    assert ids(search.search('kch')) == [2]
+
+def test_proximity_breaks_text_ties(search):
+    results = search.search('central hospital', lat=LILONGWE[0], lng=LILONGWE[1])
+    assert ids(results)[:1] == [2]
+    for score, text, distance, _ in results:
+        assert score == pytest.approx(0.7 * text + 0.3 * 25.0 / (25.0 + distance))
+    assert [s for s, _, _, _ in results] == sorted((s for s, _, _, _ in results), reverse=True)
+
+def test_filters_and_limit(search):
+    assert 3 not in ids(search.search('central', functional_only=True))
+    assert len(search.search('central', limit=2)) == 2
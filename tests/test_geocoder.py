@@ -0,0 +1,50 @@
+import pytest
+
+from app.utils.geocoder import KNOWN_PLACES, Geocoder
+from app.utils.text_index import TextIndex, normalize, trigrams
+
+FACILITIES = [
+    {'id': 1, 'name': 'Kamuzu Central Hospital', 'common_name': 'KCH', 'lat': -13.98, 'lng': 33.78, 'district': 'Lilongwe'},
+    {'id': 2, 'name': "St. Joseph's Mission Hospital", 'common_name': None, 'lat': -15.0, 'lng': 35.0, 'district': 'Balaka'},
+    {'id': 3, 'name': 'Mzuzu Central Hospital', 'common_name': None, 'lat': -11.45, 'lng': 34.02, 'district': 'Mzimba'},
+    {'id': 4, 'name': 'Lilongwe Health Centre', 'common_name': None, 'lat': -13.96, 'lng': 33.77, 'district': 'Lilongwe'},
+]
+DISTRICTS = [{'district': 'Lilongwe', 'lat': -13.97, 'lng': 33.78, 'facility_count': 2}]
+
+
+@pytest.fixture(scope='module')
+def geocoder():
+    return Geocoder(KNOWN_PLACES, DISTRICTS, FACILITIES)
+
+
+def test_normalize_and_trigrams():
+    assert normalize("  St. Joséph's  ") == 'st joseph s'
+    assert {'  n', ' ne', 'neo', 'eo '} == trigrams('neo')
+
+def test_score_bands():
+    index = TextIndex()
+    for item, name in enumerate(['mzuzu', 'mzuzu central hospital', 'kamuzu central hospital', 'st joseph']):
+        index.add(name, item)
+    scores = index.scores('mzuzu')
+    # EXACT > PREFIX > WORD PREFIX > FUZZY
+    assert scores[0] == 1.0 and 0.75 < scores[1] < 1.0
+    assert 0.55 <= index.scores('central')[2] < 0.75
+    assert index.search('jo st')[0][1] == 3
+    assert index.search('mzuzzu')[0][1] == 0 and index.search('mzuzzu')[0][0] < 0.7
+    # SHORT QUERIES SKIP THE FUZZY PASS
+    assert index.scores('zz') == {}
+
+def test_exact_place_ranks_first(geocoder):
+    results = geocoder.geocode('Lilongwe')
+    assert [r['kind'] for r in results[:3]] == ['place', 'district', 'facility']
+    assert results[0]['name'] == 'Lilongwe' and results[0]['score'] > results[1]['score']
+
+def test_alias_and_misspelling(geocoder):
+    assert geocoder.geocode('nkatabay')[0]['name'] == 'Nkhata Bay'
+    assert geocoder.geocode('mzuzzu')[0]['name'] == 'Mzuzu'
+    assert geocoder.geocode('KCH', kinds=['facility'])[0]['facility_id'] == 1
+
+def test_kinds_and_limit(geocoder):
+    results = geocoder.geocode('central hospital', limit=1, kinds=['facility'])
+    assert len(results) == 1 and results[0]['kind'] == 'facility'
+    assert geocoder.geocode('') == []
@@ -0,0 +1,77 @@
+import itertools
+
+import pytest
+
+from app.utils.graph_search import (
+    SEARCH_ALGORITHMS,
+    cost_matrix,
+    dijkstra,
+    verify_contraction_hierarchy
+)
+
+
+def all_pairs(graph):
+    return itertools.product(range(graph.node_count), repeat=2)
+
+def path_is_contiguous(graph, arcs, source, target) -> bool:
+    node = source
+    for a in arcs:
+        if graph.arc_tail(a) != node:
+            return False
+        node = graph.arc_head[a]
+    return node == target
+
+
+@pytest.mark.parametrize('algorithm', ['astar', 'bidirectional', 'ch'])
+def test_search_matches_dijkstra(road_graph, algorithm):
+    search = SEARCH_ALGORITHMS[algorithm]
+    for s, t in all_pairs(road_graph):
+        expected = dijkstra(road_graph, s, t)
+        found = search(road_graph, s, t)
+        assert (found is None) == (expected is None), (algorithm, s, t)
+        if expected is None:
+            continue
+        assert found.cost == pytest.approx(expected.cost), (algorithm, s, t)
+        assert path_is_contiguous(road_graph, found.arcs, s, t), (algorithm, s, t)
+        assert sum(road_graph.arc_weight[a] for a in found.arcs) == pytest.approx(found.cost)
+
+def test_grid_has_unreachable_pairs(road_graph):
+    # ONE-WAY AND MISSING STREETS MUST LEAVE SOME PAIRS UNCONNECTED, OR THE REACHABILITY CHECKS PROVE NOTHING
+    assert any(dijkstra(road_graph, s, t) is None for s, t in all_pairs(road_graph))
+
+@pytest.mark.parametrize('metric', ['distance', 'time'])
+def test_cost_matrix_matches_dijkstra(road_graph, metric):
+    minutes = road_graph.arc_minutes()
+    nodes = list(range(0, road_graph.node_count, 3))
+    for sources, targets in ((nodes[:2], nodes), (nodes, nodes[:2])):
+        km, mins = cost_matrix(road_graph, sources, targets, metric)
+        for i, s in enumerate(sources):
+            for j, t in enumerate(targets):
+                expected = dijkstra(road_graph, s, t)
+                if expected is None:
+                    assert km[i][j] is None and mins[i][j] is None
+                    continue
+                if metric == 'distance':
+                    assert km[i][j] == pytest.approx(expected.cost)
+                    assert mins[i][j] == pytest.approx(sum(minutes[a] for a in expected.arcs))
+                else:
+                    # NEVER SLOWER THAN THE SHORTEST PATH, AND NEVER SHORTER IN KM
+                    assert mins[i][j] <= sum(minutes[a] for a in expected.arcs) + 1e-9
+                    assert km[i][j] >= expected.cost - 1e-9
+
+def test_verify_contraction_hierarchy_finds_no_mismatches(road_graph):
+    report = verify_contraction_hierarchy(road_graph, road_graph.hierarchy, pairs=300, seed=1)
+    assert report['mismatches'] == 0, report['examples']
+
+def test_verify_keeps_the_first_problem(road_graph):
+    # A HIERARCHY THAT RETURNS A SCRAMBLED PATH WITH A WRONG COST IS REPORTED AS NOT CONTIGUOUS
+    class Scrambled:
+        def query(self, source, target):
+            found = dijkstra(road_graph, source, target)
+            if found is None:
+                return None
+            return found.cost + 1.0, list(reversed(found.arcs)), found.settled
+
+    report = verify_contraction_hierarchy(road_graph, Scrambled(), pairs=300, seed=1)
+    problems = {example['problem'] for example in report['examples']}
+    assert 'unpacked path is not contiguous' in problems
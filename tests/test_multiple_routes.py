@@ -0,0 +1,56 @@
+import app.routes.routing as routing
+
+FACILITIES = [
+    {'id': 1, 'name': 'Kamuzu Central Hospital', 'lat': -13.985, 'lng': 33.795},
+    {'id': 2, 'name': 'Area 25 Health Centre', 'lat': -13.98, 'lng': 33.79},
+    {'id': 3, 'name': 'Bwaila Hospital', 'lat': -13.97, 'lng': 33.78},
+    {'id': 4, 'name': 'Chileka Health Centre', 'lat': -13.95, 'lng': 33.76},
+]
+# FASTEST-PATH MINUTES FROM THE MATRIX, AND A PER-ROUTE ESTIMATE THAT DISAGREES WITH THEM
+MATRIX_MINUTES = {1: 12.0, 2: 5.0, 3: None, 4: 9.0}
+ROUTE_ESTIMATES = {1: 3.0, 2: 20.0, 4: 1.0}
+
+
+class FakeCursor:
+    def execute(self, query, params=None):
+        self.rows = [dict(f) for f in FACILITIES if f['id'] in params[0]]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def cursor(self, cursor_factory=None):
+        return FakeCursor()
+
+    def close(self):
+        pass
+
+
+def route_details(start_lat, start_lng, end_lat, end_lng, algorithm, start_node, end_node):
+    return lambda: {'distance_km': 1.0, 'estimated_time_minutes': ROUTE_ESTIMATES[end_node],
+                    'algorithm': algorithm, 'start_node': start_node, 'end_node': end_node}
+
+
+def test_results_follow_the_matrix_minutes(flask_app, monkeypatch):
+    monkeypatch.setattr(routing, 'get_db_connection', lambda: FakeConnection())
+    monkeypatch.setattr(routing, 'find_nearest_road_node', lambda conn, lat, lng: 100)
+    monkeypatch.setattr(routing, 'find_facility_road_node', lambda conn, facility: facility['id'])
+    monkeypatch.setattr(routing, 'calculate_travel_matrix', lambda conn, origins, destinations, metric: {
+        'metric': metric,
+        'distances_km': [[1.0 for _ in destinations]],
+        'times_minutes': [[MATRIX_MINUTES[node] for node in destinations]]
+    })
+    monkeypatch.setattr(routing, 'route_details_task', route_details)
+
+    response = flask_app.test_client().post('/api/routes/multiple', json={
+        'start_lat': -13.96, 'start_lng': 33.77, 'facility_ids': [1, 2, 3, 4], 'limit': 2})
+    body = response.get_json()
+
+    assert response.status_code == 200
+    assert [r['facility']['id'] for r in body['data']] == [2, 4]
+    assert [r['travel_time_minutes'] for r in body['data']] == [5.0, 9.0]
+    assert body['sorted_by'] == 'travel_time'
@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+import app.utils.network_voronoi as network_voronoi
+from app.config import Config
+from app.utils.facility_index import FacilityIndex
+from app.utils.network_voronoi import NetworkVoronoi, nearest_by_travel_time
+from app.utils.node_snapper import NodeSnapper
+
+K = 3
+
+
+def sources(graph, count, seed):
+    rng = random.Random(seed)
+    return {facility_id: rng.randrange(graph.node_count) for facility_id in range(1, count + 1)}
+
+def label_minutes(table):
+    # TIES MAY LIST EQUALLY FAST FACILITIES IN EITHER ORDER, SO COMPARE THE TIMES
+    return [[round(t, 9) for t, _, _ in table.labels(u)] for u in range(table.graph.node_count)]
+
+def reverse_map_is_exact(table):
+    expected = {}
+    for i, f in enumerate(table.facility):
+        if f >= 0:
+            expected.setdefault(f, set()).add(i // table.k)
+    return table._nodes_of is None or table._nodes_of == expected
+
+
+def test_incremental_updates_match_a_fresh_build(road_graph):
+    current = sources(road_graph, 8, seed=3)
+    original = NetworkVoronoi(road_graph, K, dict(current)).build()
+    table = original.copy()
+    before = label_minutes(original)
+
+    rng = random.Random(11)
+    for step in range(20):
+        if step % 2 and current:
+            facility_id = rng.choice(sorted(current))
+            del current[facility_id]
+            table.remove_facility(facility_id)
+        else:
+            facility_id, node = 100 + step, rng.randrange(road_graph.node_count)
+            current[facility_id] = node
+            table.add_facility(facility_id, node)
+        assert label_minutes(table) == label_minutes(NetworkVoronoi(road_graph, K, dict(current)).build()), step
+        assert reverse_map_is_exact(table)
+
+    # THE COPY TOOK THE CHANGES, THE PUBLISHED TABLE DID NOT
+    assert label_minutes(original) == before
+
+def test_two_facilities_on_one_node(road_graph):
+    table = NetworkVoronoi(road_graph, K, {1: 5, 2: 5}).build()
+    assert {f for _, _, f in table.labels(5)} == {1, 2}
+    table.remove_facility(1)
+    assert [f for _, _, f in table.labels(5)] == [2]
+
+
+@pytest.fixture
+def travel_time_setup(road_graph, monkeypatch):
+    index = FacilityIndex([
+        {'id': i, 'name': f'Facility {i}', 'status': 'Functional', 'district': 'Lilongwe',
+         'facility_type': 'Hospital', 'ownership': 'Government',
+         'lat': road_graph.node_lat[node], 'lng': road_graph.node_lng[node]}
+        for i, node in sources(road_graph, 6, seed=5).items()
+    ])
+    snapper = NodeSnapper(road_graph)
+    monkeypatch.setattr(network_voronoi, 'get_node_snapper', lambda conn=None: snapper)
+    monkeypatch.setattr(network_voronoi, 'get_facility_index', lambda conn=None: index)
+    monkeypatch.setattr(network_voronoi, 'get_network_voronoi', lambda conn=None: None)
+    monkeypatch.setattr(network_voronoi, 'get_facility_nodes', lambda conn=None: {
+        f['id']: snapper.snap(f['lat'], f['lng']) for f in index.facilities})
+    monkeypatch.setattr(Config, 'ROUTING_SNAP_MAX_DISTANCE', 1000)
+    return index
+
+def test_nearest_by_travel_time_snaps_within_the_limit(road_graph, travel_time_setup):
+    lat, lng = road_graph.node_lat[0] + 0.001, road_graph.node_lng[0]
+    nearest = nearest_by_travel_time(lat, lng, limit=3, functional_only=True)
+    assert nearest and [t for t, _, _ in nearest] == sorted(t for t, _, _ in nearest)
+
+    # ~50 km FROM THE GRID: NO ROAD NODE WITHIN ROUTING_SNAP_MAX_DISTANCE
+    assert nearest_by_travel_time(lat + 0.5, lng, limit=3, functional_only=True) == []
@@ -0,0 +1,32 @@
+import random
+
+import pytest
+
+from app.utils.geo import haversine_km
+from app.utils.node_snapper import NodeSnapper
+
+
+def brute_force_nearest(graph, lat, lng):
+    distance, i = min((haversine_km(lat, lng, graph.node_lat[i], graph.node_lng[i]), i)
+                      for i in range(graph.node_count))
+    return int(graph.node_ids[i]), distance
+
+
+@pytest.mark.parametrize('precision', [2, 3, 4])
+def test_snap_uses_the_exact_point(road_graph, precision):
+    # COARSE KEYS PUT MANY POINTS IN ONE CACHE CELL - EACH MUST STILL GET ITS OWN NEAREST NODE
+    snapper = NodeSnapper(road_graph, cell_size=0.005, precision=precision, cache_size=1000)
+    rng = random.Random(precision)
+    points = [(rng.uniform(-14.0, -13.93), rng.uniform(33.75, 33.83)) for _ in range(400)]
+
+    expected = [brute_force_nearest(road_graph, lat, lng)[0] for lat, lng in points]
+    assert [snapper.snap(lat, lng) for lat, lng in points] == expected
+    assert snapper.snap_many(points) == expected
+
+def test_snap_enforces_max_distance(road_graph):
+    snapper = NodeSnapper(road_graph)
+    lat, lng = -13.95, 33.79
+    node, distance = brute_force_nearest(road_graph, lat, lng)
+    assert snapper.snap(lat, lng, max_km=distance + 1e-6) == node
+    assert snapper.snap(lat, lng, max_km=distance - 1e-6) is None
+    assert snapper.snap_many([(lat, lng), (-13.0, 33.0)], max_km=distance + 1e-6) == [node, None]
@@ -0,0 +1,52 @@
+import pytest
+
+from app.utils.facility_index import FacilityIndex
+from app.utils.facility_query import DISTRICTS_QUERY, decode_cursor, encode_cursor, facility_listing_query
+from app.utils.offline import facility_listing
+
+# NAMES WHOSE ORDER DEPENDS ON THE COLLATION (CASE, ACCENTS, PUNCTUATION, SHARED PREFIXES)
+NAMES = ['Zomba Central Hospital', 'area 25 Health Centre', 'Area 18 Clinic', 'Ékwendeni Mission Hospital',
+         'Mzuzu Central Hospital', "St. Anne's Hospital", 'Mzuzu Central Hospital', 'Chileka Health Centre',
+         '_Mobile Clinic', 'Kamuzu Central Hospital', 'mangochi District Hospital', 'Area 18 Clinic']
+
+
+@pytest.fixture
+def facility_index() -> FacilityIndex:
+    return FacilityIndex([
+        {'id': i, 'name': name, 'status': 'Functional' if i % 3 else 'Non-functional',
+         'district': 'Lilongwe', 'facility_type': 'Hospital', 'ownership': 'Government',
+         'lat': -13.9 - i * 0.01, 'lng': 33.7 + i * 0.01}
+        for i, name in enumerate(NAMES, 1)
+    ])
+
+
+def test_pages_order_by_byte_order():
+    query, params = facility_listing_query(['id', 'name'], ' WHERE TRUE', [], after=('Area 18 Clinic', 3), limit=5)
+    assert '(name COLLATE "C", gid) > (%s, %s)' in query
+    assert 'ORDER BY name COLLATE "C", gid' in query
+    assert params == ['Area 18 Clinic', 3, 5]
+
+    query, params = facility_listing_query(['id'], ' WHERE TRUE', [], limit=5)
+    assert 'ORDER BY name COLLATE "C", gid LIMIT %s' in query
+
+def test_full_listings_keep_the_database_collation():
+    query, params = facility_listing_query(['id', 'name'], ' WHERE TRUE', [])
+    assert 'COLLATE' not in query and 'ORDER BY name, gid' in query
+    assert params == []
+    assert 'COLLATE' not in DISTRICTS_QUERY
+
+@pytest.mark.parametrize('filters', [{}, {'functional_only': True}])
+def test_offline_pages_resume_from_cursors(facility_index, filters):
+    # THE SQL ORDER (name COLLATE "C", gid) IS UTF-8 BYTE ORDER
+    expected = sorted((f for f in facility_index.facilities if FacilityIndex.matches(f, **filters)),
+                      key=lambda f: (f['name'].encode('utf-8'), f['id']))
+
+    walked, after = [], None
+    while True:
+        page = facility_listing(facility_index, ['id', 'name'], filters, after=after, limit=3)
+        walked.extend(page)
+        if len(page) < 3:
+            break
+        after = decode_cursor(encode_cursor(page[-1]['name'], page[-1]['id']))
+
+    assert [row['id'] for row in walked] == [f['id'] for f in expected]
@@ -0,0 +1,60 @@
+import pytest
+from flask import jsonify
+
+import app.utils.response_cache as response_cache
+from app.utils.response_cache import cached_response, invalidate_responses
+
+
+@pytest.fixture
+def counted_app(flask_app):
+    calls = []
+
+    @flask_app.route('/test/counted')
+    @cached_response
+    def counted():
+        calls.append(True)
+        return jsonify({'success': True, 'data': len(calls)})
+
+    invalidate_responses()
+    yield flask_app.test_client(), calls
+    invalidate_responses()
+
+
+def test_snapshot_answers_are_not_cached(counted_app, monkeypatch):
+    client, calls = counted_app
+    monkeypatch.setattr(response_cache, 'database_unreachable', lambda: True)
+    for _ in range(2):
+        response = client.get('/test/counted')
+        assert response.status_code == 200
+        assert 'ETag' not in response.headers
+    assert len(calls) == 2
+
+    # ONCE THE DATABASE IS BACK THE LIVE ANSWER IS CACHED AS USUAL
+    monkeypatch.setattr(response_cache, 'database_unreachable', lambda: False)
+    first, second = client.get('/test/counted'), client.get('/test/counted')
+    assert first.get_json()['data'] == 3 and first.headers['ETag'] == second.headers['ETag']
+    assert len(calls) == 3
+
+def test_etag_and_not_modified(counted_app, monkeypatch):
+    client, calls = counted_app
+    monkeypatch.setattr(response_cache, 'database_unreachable', lambda: False)
+    first = client.get('/test/counted')
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'].startswith('public, max-age=')
+
+    again = client.get('/test/counted', headers={'If-None-Match': etag})
+    assert again.status_code == 304 and again.get_data() == b''
+    assert client.get('/test/counted', headers={'If-None-Match': '"other"'}).status_code == 200
+    # QUERY STRINGS ARE SEPARATE ENTRIES
+    assert client.get('/test/counted?district=Lilongwe').get_json()['data'] == 2
+    assert len(calls) == 2
+
+def test_reload_changes_the_etag(counted_app, monkeypatch):
+    client, calls = counted_app
+    monkeypatch.setattr(response_cache, 'database_unreachable', lambda: False)
+    etag = client.get('/test/counted').headers['ETag']
+
+    monkeypatch.setattr(response_cache, 'current_data_version', lambda: 99)
+    response = client.get('/test/counted', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+    assert len(calls) == 2
@@ -0,0 +1,67 @@
+import pytest
+
+import app.utils.route_cache as route_cache
+import app.utils.routing_helpers as routing_helpers
+from app.utils.graph_search import dijkstra
+from app.utils.route_cache import clear_route_cache
+from app.utils.routing_helpers import calculate_route_with_details
+from conftest import grid_graph
+
+
+@pytest.fixture
+def routing(road_graph, monkeypatch):
+    graphs = {'current': road_graph}
+    geometry_calls = []
+
+    def geometry(conn, segments):
+        geometry_calls.append(len(segments))
+        return {'type': 'LineString', 'coordinates': [[33.7, -13.9], [33.8, -13.95]]}
+
+    monkeypatch.setattr(route_cache, '_cache', None)
+    monkeypatch.setattr(routing_helpers, 'get_road_graph', lambda conn=None: graphs['current'])
+    monkeypatch.setattr(routing_helpers, 'format_route_geometry', geometry)
+    return graphs, geometry_calls
+
+
+def connected_pair(graph):
+    for target in range(graph.node_count - 1, 0, -1):
+        if dijkstra(graph, 0, target) is not None:
+            return int(graph.node_ids[0]), int(graph.node_ids[target])
+
+
+def route(start, end):
+    # ANY NON-NONE CONNECTION - THE GEOMETRY QUERY IS PATCHED OUT
+    return calculate_route_with_details(object(), 0, 0, 0, 0, 'dijkstra', start, end)
+
+
+def test_repeat_routes_hit_the_cache(routing):
+    graphs, geometry_calls = routing
+    start, end = connected_pair(graphs['current'])
+
+    first = route(start, end)
+    second = route(start, end)
+    assert first['search']['cached'] is False and second['search']['cached'] is True
+    assert {k: v for k, v in first.items() if k != 'search'} == {k: v for k, v in second.items() if k != 'search'}
+    assert len(geometry_calls) == 1
+
+def test_cached_routes_are_copies(routing):
+    graphs, _ = routing
+    start, end = connected_pair(graphs['current'])
+
+    route(start, end)['geometry']['coordinates'].clear()
+    route(start, end)['geometry']['coordinates'].append([0, 0])
+    assert len(route(start, end)['geometry']['coordinates']) == 2
+
+def test_new_topology_misses_and_clears(routing):
+    graphs, geometry_calls = routing
+    start, end = connected_pair(graphs['current'])
+    route(start, end)
+
+    # THE KEY FOLLOWS THE GRAPH BEING SEARCHED, SO A SWAPPED-IN GRAPH NEVER SEES THE OLD ROUTES
+    graphs['current'] = grid_graph()
+    graphs['current'].topology_version = 2
+    assert route(start, end)['search']['cached'] is False
+    assert len(geometry_calls) == 2
+
+    clear_route_cache(version=3)
+    assert route_cache.route_cache_stats()['entries'] == 0
@@ -0,0 +1,71 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import app.utils.route_executor as route_executor
+from app.utils.route_executor import TIMED_OUT, run_routes
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    pool = ThreadPoolExecutor(max_workers=4)
+    monkeypatch.setattr(route_executor, '_executor', pool)
+    monkeypatch.setattr(route_executor, '_slots', threading.Semaphore(2))
+    yield pool
+    pool.shutdown(wait=True)
+
+
+def test_results_keep_the_input_order(executor):
+    def task(i):
+        def call():
+            time.sleep(0.01 * (5 - i))
+            if i == 3:
+                raise ValueError('no path')
+            return i * 10
+        return call
+
+    assert run_routes([task(i) for i in range(5)], timeout=5) == [
+        (0, None), (10, None), (20, None), (None, 'no path'), (40, None)]
+
+def test_deadline_returns_stragglers_as_timed_out(executor):
+    release = threading.Event()
+    started = []
+
+    def slow():
+        started.append(True)
+        release.wait(5)
+        return 'late'
+
+    began = time.monotonic()
+    results = run_routes([lambda: 'fast', slow, slow, slow], timeout=0.1)
+    assert time.monotonic() - began < 1.0
+    assert results[0] == ('fast', None)
+    assert results[1:] == [(None, TIMED_OUT)] * 3
+    # TWO SLOTS: THE FAST TASK FREED ONE, SO ONLY TWO SLOW TASKS EVER STARTED
+    assert len(started) == 2
+
+    # THE RUNNING STRAGGLERS STILL HOLD BOTH SLOTS, SO THE NEXT REQUEST TIMES OUT WITHOUT RUNNING ANYTHING
+    assert run_routes([lambda: 'next'], timeout=0.05) == [(None, TIMED_OUT)]
+    release.set()
+    assert run_routes([lambda: 'next'], timeout=2) == [('next', None)]
+
+def test_concurrency_is_capped_across_requests(executor):
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def task():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return True
+
+    threads = [threading.Thread(target=run_routes, args=([task] * 4,), kwargs={'timeout': 5}) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
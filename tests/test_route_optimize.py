@@ -0,0 +1,84 @@
+import itertools
+import random
+
+import pytest
+
+import app.routes.routing as routing
+from app.utils.route_optimizer import optimize_order
+
+STOPS = {1: (-13.90, 33.70), 2: (-13.80, 33.70), 3: (-13.70, 33.70), 4: (-13.60, 33.70)}
+
+
+def random_matrix(n, seed):
+    rng = random.Random(seed)
+    points = [(rng.random(), rng.random()) for _ in range(n + 1)]
+    return [[abs(ax - bx) + abs(ay - by) for bx, by in points] for ax, ay in points]
+
+def brute_force(matrix, return_to_start):
+    n = len(matrix) - 1
+    best = None
+    for order in itertools.permutations(range(1, n + 1)):
+        seq = [0, *order] + ([0] if return_to_start else [])
+        cost = sum(matrix[a][b] for a, b in zip(seq, seq[1:]))
+        best = cost if best is None else min(best, cost)
+    return best
+
+
+@pytest.mark.parametrize('return_to_start', [False, True])
+def test_exact_orders_are_optimal(return_to_start):
+    for seed in range(5):
+        matrix = random_matrix(6, seed)
+        order, cost, method = optimize_order(matrix, return_to_start)
+        assert method == 'held_karp' and sorted(order) == list(range(1, 7))
+        assert cost == pytest.approx(brute_force(matrix, return_to_start))
+
+def test_large_trips_use_local_search():
+    matrix = random_matrix(30, 1)
+    order, cost, method = optimize_order(matrix, exact_max=10)
+    assert method == 'two_opt_or_opt' and sorted(order) == list(range(1, 31))
+    assert cost == pytest.approx(sum(matrix[a][b] for a, b in zip([0] + order, order)))
+
+
+class FakeCursor:
+    def execute(self, query, params=None):
+        self.rows = [{'id': i, 'name': f'Facility {i}', 'lat': lat, 'lng': lng}
+                     for i, (lat, lng) in STOPS.items() if i in params[0]]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def cursor(self, cursor_factory=None):
+        return FakeCursor()
+
+    def close(self):
+        pass
+
+
+def test_tour_stops_at_the_first_failed_leg(flask_app, monkeypatch):
+    # STOPS IN A LINE NORTH OF THE START, SO THE ORDER IS 1, 2, 3, 4; THE LEG INTO 3 FAILS
+    monkeypatch.setattr(routing, 'get_db_connection', lambda: FakeConnection())
+    monkeypatch.setattr(routing, 'find_nearest_road_node', lambda conn, lat, lng: 100)
+    monkeypatch.setattr(routing, 'find_facility_road_node', lambda conn, facility: 100 + facility['id'])
+    monkeypatch.setattr(routing, 'calculate_travel_matrix', lambda conn, origins, destinations: {
+        'distances_km': [[abs(a - b) * 10.0 for b in destinations] for a in origins]})
+
+    def route_details(start_lat, start_lng, end_lat, end_lng, algorithm, start_node, end_node):
+        if end_node == 103:
+            return lambda: None
+        return lambda: {'distance_km': 10.0, 'estimated_time_minutes': 12.0, 'start_node': start_node,
+                        'end_node': end_node}
+
+    monkeypatch.setattr(routing, 'route_details_task', route_details)
+    response = flask_app.test_client().post('/api/route/optimize', json={
+        'start_lat': -14.0, 'start_lng': 33.7, 'facility_ids': [4, 2, 3, 1]})
+    data = response.get_json()['data']
+
+    assert response.status_code == 200
+    assert data['optimized_order'] == [1, 2] and data['unvisited_facility_ids'] == [3, 4]
+    assert data['partial'] is True and data['failed_legs'][0]['to']['id'] == 3
+    assert (data['total_distance_km'], len(data['routes'])) == (20.0, 2)
@@ -0,0 +1,60 @@
+import os
+import signal
+
+import pytest
+
+from app.utils.graph_search import cost_matrix, dijkstra
+from app.utils.routing_workers import RoutingTimeout, RoutingWorkerError, RoutingWorkerPool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = RoutingWorkerPool(2, timeout=30, queue_timeout=5, max_jobs=3, directory=str(tmp_path))
+    yield pool
+    pool.close()
+
+
+def pairs(graph):
+    return [(s, t) for s in range(0, graph.node_count, 5) for t in range(3, graph.node_count, 11)]
+
+
+def test_worker_searches_match_in_process(road_graph, pool):
+    for s, t in pairs(road_graph)[:8]:
+        found, elapsed_ms = pool.run(road_graph, ('search', s, t, 'ch'))
+        expected = dijkstra(road_graph, s, t)
+        assert (found is None) == (expected is None)
+        if expected is not None:
+            assert found.cost == pytest.approx(expected.cost) and elapsed_ms >= 0
+
+    nodes = list(range(0, road_graph.node_count, 4))
+    assert pool.run(road_graph, ('matrix', nodes[:3], nodes, 'time')) == cost_matrix(road_graph, nodes[:3], nodes, 'time')
+
+def test_workers_are_recycled_after_max_jobs(road_graph, pool):
+    for s, t in pairs(road_graph)[:7]:
+        pool.run(road_graph, ('search', s, t, 'dijkstra'))
+    stats = pool.stats()
+    # ONE REQUEST AT A TIME KEEPS REUSING THE SAME IDLE WORKER: RETIRED AFTER JOBS 3 AND 6
+    assert (stats['jobs'], stats['recycled'], stats['running'], stats['idle']) == (7, 2, 1, 1)
+
+def test_timeouts_and_crashes_replace_the_worker(road_graph, pool):
+    s, t = pairs(road_graph)[0]
+    pool.run(road_graph, ('search', s, t, 'dijkstra'))
+    # A STOPPED PROCESS NEVER ANSWERS - THE POOL KILLS IT AT THE TIMEOUT
+    os.kill(pool._idle[0].process.pid, signal.SIGSTOP)
+    with pytest.raises(RoutingTimeout):
+        pool.run(road_graph, ('search', s, t, 'dijkstra'), timeout=0.2)
+    assert pool.stats()['timeouts'] == 1 and pool.stats()['running'] == 0
+
+    pool.run(road_graph, ('search', s, t, 'dijkstra'))
+    idle = pool._idle[0]
+    idle.process.kill()
+    idle.process.wait()
+    with pytest.raises(RoutingWorkerError):
+        pool.run(road_graph, ('search', s, t, 'dijkstra'))
+    assert pool.stats()['crashed'] == 1
+    assert pool.run(road_graph, ('search', s, t, 'dijkstra'))[0].cost == pytest.approx(dijkstra(road_graph, s, t).cost)
+
+def test_unknown_requests_are_errors(road_graph, pool):
+    with pytest.raises(RoutingWorkerError):
+        pool.run(road_graph, ('search', 0, 1, 'teleport'))
+    assert pool.stats()['errors'] == 1 and pool.stats()['idle'] == 1
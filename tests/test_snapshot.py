@@ -0,0 +1,73 @@
+import os
+import time
+from decimal import Decimal
+
+import pytest
+
+from app.utils.graph_search import SEARCH_ALGORITHMS, dijkstra
+from app.utils.snapshot import Snapshot, publish_snapshot, write_snapshot
+
+FACILITIES = [
+    {'id': 1, 'code': 'KCH', 'name': 'Kamuzu Central Hospital', 'common_name': None,
+     'lat': Decimal('-13.9833'), 'lng': Decimal('33.7833'), 'beds': 1.5},
+    {'id': 2, 'code': 'ÉKW', 'name': 'Ékwendeni Mission Hospital', 'common_name': 'Ekwendeni',
+     'lat': Decimal('-11.3667'), 'lng': None, 'beds': 2},
+]
+
+
+@pytest.fixture
+def snapshot(tmp_path, road_graph):
+    path = str(tmp_path / 'snapshot.bin')
+    write_snapshot(path, FACILITIES, road_graph, road_graph.hierarchy)
+    return Snapshot(path)
+
+
+def test_facilities_round_trip(snapshot):
+    assert snapshot.facility_count() == 2
+    assert snapshot.facilities() == FACILITIES
+    assert isinstance(snapshot.facilities()[0]['lat'], Decimal)
+
+def test_mapped_graph_routes_like_the_original(snapshot, road_graph):
+    graph = snapshot.road_graph()
+    assert graph.snapshot_path == snapshot.path and graph.topology_version == road_graph.topology_version
+    assert (graph.node_count, graph.edge_count) == (road_graph.node_count, road_graph.edge_count)
+    assert all(graph.node_index.get(int(node)) == i for i, node in enumerate(road_graph.node_ids))
+
+    for algorithm in ('astar', 'bidirectional', 'ch'):
+        for s, t in [(0, road_graph.node_count - 1), (5, 17), (30, 2)]:
+            expected = dijkstra(road_graph, s, t)
+            found = SEARCH_ALGORITHMS[algorithm](graph, s, t)
+            assert (found is None) == (expected is None), (algorithm, s, t)
+            if expected is not None:
+                assert found.cost == pytest.approx(expected.cost)
+                assert graph.path_segments(found.arcs)[-1]['agg_cost'] == pytest.approx(expected.cost)
+
+def test_facilities_only_snapshot(tmp_path):
+    path = str(tmp_path / 'facilities.bin')
+    write_snapshot(path, FACILITIES)
+    snapshot = Snapshot(path)
+    assert not snapshot.has_road_graph() and snapshot.road_graph() is None
+    assert snapshot.topology_version is None
+
+def test_truncated_and_foreign_files_are_rejected(tmp_path, road_graph):
+    path = str(tmp_path / 'snapshot.bin')
+    write_snapshot(path, graph=road_graph)
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) // 2)
+    with pytest.raises(ValueError):
+        Snapshot(path)
+
+    (tmp_path / 'other.bin').write_bytes(b'PK\x03\x04' + bytes(64))
+    with pytest.raises(ValueError):
+        Snapshot(str(tmp_path / 'other.bin'))
+
+def test_publish_repoints_the_link_and_keeps_recent_versions(tmp_path):
+    path = str(tmp_path / 'snapshot.bin')
+    published = []
+    for n in range(4):
+        published.append(publish_snapshot(path, FACILITIES[:n % 2 + 1], keep=2)['path'])
+        time.sleep(0.002)    # VERSIONS ARE NAMED BY THE MILLISECOND
+
+    assert os.path.islink(path) and os.path.realpath(path) == os.path.realpath(published[-1])
+    assert sorted(os.listdir(tmp_path)) == sorted([os.path.basename(p) for p in published[-2:]] + ['snapshot.bin'])
+    assert Snapshot(path).facility_count() == 2
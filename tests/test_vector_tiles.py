@@ -0,0 +1,52 @@
+import pytest
+
+import app.routes.tiles as tiles
+from app.utils.vector_tiles import MAX_LAT, MVT_MIMETYPE, TileCache, tile_bounds, tiles_covering
+
+SIGNATURE = '0123456789abcdef'
+
+
+def test_world_tile():
+    west, south, east, north = tile_bounds(0, 0, 0)
+    assert (west, east) == (-180.0, 180.0)
+    assert north == pytest.approx(MAX_LAT) and south == pytest.approx(-MAX_LAT)
+
+@pytest.mark.parametrize('z', [1, 7, 12, 16])
+def test_points_fall_in_the_tile_that_covers_them(z):
+    for lat, lng in [(-13.9626, 33.7741), (-9.7, 33.27), (-17.1, 35.3)]:
+        (x, y), = tiles_covering(lng, lat, lng, lat, z)
+        west, south, east, north = tile_bounds(z, x, y)
+        assert west <= lng < east and south < lat <= north
+
+def test_covering_tiles_of_a_bbox():
+    # MALAWI AT ZOOM 6: A CONTIGUOUS BLOCK, ROWS COUNTED FROM THE NORTH
+    covered = list(tiles_covering(32.7, -17.1, 35.9, -9.4, 6))
+    xs, ys = sorted({x for x, _ in covered}), sorted({y for _, y in covered})
+    assert len(covered) == len(xs) * len(ys)
+    assert xs == list(range(xs[0], xs[-1] + 1)) and ys == list(range(ys[0], ys[-1] + 1))
+    assert tile_bounds(6, xs[0], ys[0])[3] >= -9.4 and tile_bounds(6, xs[-1], ys[-1])[1] <= -17.1
+
+def test_tile_cache_survives_a_restart(tmp_path):
+    cache = TileCache(str(tmp_path), max_entries=10)
+    cache.put(SIGNATURE, 6, 37, 33, b'tile')
+    cache.put('fedcba9876543210', 6, 37, 33, b'old')
+
+    restarted = TileCache(str(tmp_path), max_entries=10)
+    assert restarted.get(SIGNATURE, 6, 37, 33) == b'tile' and restarted.disk_hits == 1
+    restarted.reset(SIGNATURE)
+    assert restarted.get('fedcba9876543210', 6, 37, 33) is None
+    assert restarted.get(SIGNATURE, 6, 37, 33) == b'tile'
+
+
+def test_tile_endpoint(flask_app, monkeypatch):
+    monkeypatch.setattr(tiles, 'get_tile', lambda z, x, y: (b'' if x == 0 else b'mvt', SIGNATURE))
+    client = flask_app.test_client()
+    max_zoom = flask_app.config['TILE_MAX_ZOOM']
+
+    response = client.get('/tiles/facilities/6/37/33.mvt')
+    assert response.status_code == 200 and response.mimetype == MVT_MIMETYPE and response.data == b'mvt'
+    assert client.get('/tiles/facilities/6/0/0.mvt').data == b''
+    assert client.get('/tiles/facilities/6/37/33.mvt',
+                      headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    for path in ('/tiles/facilities/6/64/0.mvt', '/tiles/facilities/2/0/4.mvt', f'/tiles/facilities/{max_zoom + 1}/0/0.mvt'):
+        assert client.get(path).status_code == 404